@@ -1,39 +1,161 @@
+import logging
 import os
-import traceback
-from flask import Flask, request, jsonify, send_from_directory
+import time
+from flask import Flask, Response, g, request, jsonify, send_from_directory
 from flask_cors import CORS
 # from flask_socketio import SocketIO, emit  # REMOVE flask_socketio
-import asyncio
-import websockets
-import json
 
+from async_logging import configure_logging
+from metrics import REGISTRY, stats_samples, timed
+from sampling_profiler import SamplingProfiler
 from health_ai import HealthAIPredictor  # Import the predictor class
+from model_registry import ModelRegistry
+from microbatch import MicroBatcher
+from ws_hub import BroadcastHub
+from stream_scoring import StreamScorer
+from timeseries import TimeSeriesStore
+from early_warning import EarlyWarningEvaluator
+from preprocessing import INPUT_KEYS
+
+# Records are written to stderr by a background thread, the level comes from LIFELINE_LOG_LEVEL (INFO by default)
+configure_logging()
+logger = logging.getLogger('lifeline')
 
 # --- Flask Application Setup ---
 app = Flask(__name__, static_folder=None)  # Disable default static folder handling initially
 CORS(app)  # Enable Cross-Origin Resource Sharing for all routes
 
 app.config['SECRET_KEY'] = 'secret!'
+app.config['MAX_BATCH_SIZE'] = 10000  # Largest number of readings accepted by /predict/batch
+# Serve the active version of the local model registry (model_registry.py), set LIFELINE_MODEL_REGISTRY= to use models/* directly
+app.config['MODEL_REGISTRY'] = os.environ.get('LIFELINE_MODEL_REGISTRY', 'models/registry')
+app.config['MODEL_REGISTRY_POLL'] = 2.0  # Seconds between checks for a newly activated version
+# Score the Random Forest with the array-backed engine (rf_engine.py), set LIFELINE_COMPILED_RF=0 to use sklearn
+app.config['COMPILED_RF'] = os.environ.get('LIFELINE_COMPILED_RF', '1') != '0'
+# Run the NN with the NumPy kernel (nn_engine.py), set LIFELINE_NUMPY_NN=0 to use Keras
+app.config['NUMPY_NN'] = os.environ.get('LIFELINE_NUMPY_NN', '1') != '0'
+# Map the compiled RF and NumPy NN arrays read-only so all workers on a host share one copy, set LIFELINE_MMAP_MODELS=0 to read them into each process
+app.config['MMAP_MODELS'] = os.environ.get('LIFELINE_MMAP_MODELS', '1') != '0'
+# Serve with the RF as soon as it is loaded and let the NN join once TensorFlow has loaded it
+app.config['BACKGROUND_NN'] = os.environ.get('LIFELINE_BACKGROUND_NN', '1') != '0'
+# Coalesce concurrent /predict calls into one batch (microbatch.py), set LIFELINE_MICROBATCH=0 to score one by one
+app.config['MICROBATCH'] = os.environ.get('LIFELINE_MICROBATCH', '1') != '0'
+app.config['MICROBATCH_MAX_SIZE'] = int(os.environ.get('LIFELINE_MICROBATCH_MAX_SIZE', 64))
+app.config['MICROBATCH_MAX_WAIT_MS'] = float(os.environ.get('LIFELINE_MICROBATCH_MAX_WAIT_MS', 2.0))
+# Memoize model probabilities on quantized vitals (prediction_cache.py), set LIFELINE_PREDICTION_CACHE=0 to disable
+app.config['PREDICTION_CACHE'] = os.environ.get('LIFELINE_PREDICTION_CACHE', '1') != '0'
+app.config['PREDICTION_CACHE_SIZE'] = int(os.environ.get('LIFELINE_PREDICTION_CACHE_SIZE', 10000))
+app.config['PREDICTION_CACHE_TTL'] = 60.0  # Seconds a cached probability stays valid
+app.config['PREDICTION_CACHE_QUANTIZATION'] = {}  # Per-feature rounding step overrides, e.g. {'temperature': 0.2}
+app.config['PREDICT_TIMEOUT'] = 10.0  # Seconds a /predict call waits for its batch to be scored
+app.config['WS_QUEUE_SIZE'] = 256  # Messages buffered per WebSocket client before the oldest is dropped
+app.config['WS_SEND_TIMEOUT'] = 5.0  # Seconds a send to one WebSocket client may take before it is disconnected
+# Score device readings on the WebSocket path before relaying them (stream_scoring.py), set LIFELINE_STREAM_SCORING=0 to relay raw
+app.config['STREAM_SCORING'] = os.environ.get('LIFELINE_STREAM_SCORING', '1') != '0'
+app.config['STREAM_TICK_MS'] = 20.0  # Streamed readings are collected this long and scored as one batch
+app.config['STREAM_TOLERANCE'] = {}  # Per-key change below which a device reuses its last predictions, e.g. {'temperature': 0.1}
+# Devices whose last reading is kept for reuse at most, and seconds without a reading before a device is dropped
+app.config['STREAM_MAX_DEVICES'] = int(os.environ.get('LIFELINE_STREAM_MAX_DEVICES', 100000))
+app.config['STREAM_IDLE_TIMEOUT'] = float(os.environ.get('LIFELINE_STREAM_IDLE_TIMEOUT', 600.0))
+# Keep a per-device history of streamed readings (timeseries.py), set LIFELINE_HISTORY=0 to disable
+app.config['HISTORY'] = os.environ.get('LIFELINE_HISTORY', '1') != '0'
+app.config['HISTORY_CAPACITY'] = int(os.environ.get('LIFELINE_HISTORY_CAPACITY', 3600))  # Readings kept in memory per device
+# Devices kept at most (the least recently updated makes room), and seconds without a reading before a device is dropped
+app.config['HISTORY_MAX_SERIES'] = int(os.environ.get('LIFELINE_HISTORY_MAX_SERIES', 10000))
+app.config['HISTORY_IDLE_TIMEOUT'] = float(os.environ.get('LIFELINE_HISTORY_IDLE_TIMEOUT', 3600.0))
+app.config['HISTORY_WINDOWS'] = (60.0, 300.0)  # Rolling statistics windows in seconds
+# Directory for per-device append-only history files, unset keeps history in memory only
+app.config['HISTORY_SPILL_DIR'] = os.environ.get('LIFELINE_HISTORY_SPILL_DIR')
+app.config['HISTORY_MAX_POINTS'] = 1000  # Largest number of points /history returns
+# Sustained and trend alerts per device/patient (early_warning.py), set LIFELINE_EARLY_WARNING=0 to disable
+app.config['EARLY_WARNING'] = os.environ.get('LIFELINE_EARLY_WARNING', '1') != '0'
+app.config['EARLY_WARNING_MAX_GAP'] = 15.0  # Seconds without a reading after which a patient's rule state is reset
+# Patients whose rule state is kept at most, the least recently updated makes room
+app.config['EARLY_WARNING_MAX_PATIENTS'] = int(os.environ.get('LIFELINE_EARLY_WARNING_MAX_PATIENTS', 100000))
+# Sample every thread's stack from startup (sampling_profiler.py), set LIFELINE_PROFILER=1; POST /profiler/start works too
+app.config['PROFILER'] = os.environ.get('LIFELINE_PROFILER', '0') == '1'
+app.config['PROFILER_INTERVAL_MS'] = float(os.environ.get('LIFELINE_PROFILER_INTERVAL_MS', 10.0))
 
 # --- Predictor Initialization ---
 predictor = None
+registry = ModelRegistry(app.config['MODEL_REGISTRY']) if app.config['MODEL_REGISTRY'] else None
 try:
-    print("Initializing HealthAIPredictor...")
-    predictor = HealthAIPredictor()
-    print("HealthAIPredictor initialized successfully.")
+    logger.info("Initializing HealthAIPredictor...")
+    predictor = HealthAIPredictor(compiled_rf=app.config['COMPILED_RF'], numpy_nn=app.config['NUMPY_NN'],
+                                  background_nn=app.config['BACKGROUND_NN'],
+                                  cache_size=app.config['PREDICTION_CACHE_SIZE'] if app.config['PREDICTION_CACHE'] else 0,
+                                  cache_ttl=app.config['PREDICTION_CACHE_TTL'],
+                                  cache_quantization=app.config['PREDICTION_CACHE_QUANTIZATION'],
+                                  registry=registry, mmap_models=app.config['MMAP_MODELS'])
+    if registry is not None:
+        predictor.watch_registry(interval=app.config['MODEL_REGISTRY_POLL'])
+    logger.info("HealthAIPredictor initialized successfully.")
 except SystemExit as e:
-    print(f"FATAL: Failed to initialize predictor: {e}")
+    logger.critical("Failed to initialize predictor: %s", e)
     # The application might still run but the /predict endpoint will fail.
 except Exception as e:
-    print(f"FATAL: An unexpected error occurred during predictor initialization: {e}")
-    print(traceback.format_exc())
+    logger.critical("An unexpected error occurred during predictor initialization: %s", e, exc_info=True)
+
+evaluator = None
+if predictor is not None and app.config['EARLY_WARNING']:
+    # Columns in the order validate_batch returns vitals, which is what the stream scorer feeds it
+    evaluator = EarlyWarningEvaluator(keys=[INPUT_KEYS[name] for name in predictor.feature_names],
+                                      max_gap=app.config['EARLY_WARNING_MAX_GAP'],
+                                      max_patients=app.config['EARLY_WARNING_MAX_PATIENTS'])
+
+batcher = None
+if predictor is not None and app.config['MICROBATCH']:
+    batcher = MicroBatcher(predictor, max_batch_size=app.config['MICROBATCH_MAX_SIZE'],
+                           max_wait_ms=app.config['MICROBATCH_MAX_WAIT_MS']).start()
+    REGISTRY.register('lifeline_microbatch_batch_size', "Readings per batch scored by the /predict micro-batcher",
+                      batcher.batch_size)
+    REGISTRY.register('lifeline_microbatch_queue_wait_seconds', "Seconds a /predict reading waited for its batch",
+                      batcher.queue_wait_seconds)
+
+profiler = SamplingProfiler(interval=app.config['PROFILER_INTERVAL_MS'] / 1000.0)
+if app.config['PROFILER']:
+    profiler.start()
+
+
+# --- Request Metrics ---
+http_requests = REGISTRY.counter('lifeline_http_requests_total', "HTTP requests by endpoint and status code",
+                                 ('endpoint', 'status'))
+http_seconds = REGISTRY.histogram('lifeline_http_request_duration_seconds', "Seconds spent handling HTTP requests",
+                                  labelnames=('endpoint',))
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started_at = time.perf_counter()
+
+
+@app.after_request
+def record_request(response):
+    started_at = g.get('request_started_at')
+    if started_at is not None:
+        # Route function names, so unknown paths cannot grow the label set
+        endpoint = request.endpoint or 'unmatched'
+        http_seconds.labels(endpoint).observe(time.perf_counter() - started_at)
+        http_requests.labels(endpoint, response.status_code).inc()
+    return response
+
+
+# --- Readiness Check ---
+@app.route('/ready')
+def ready():
+    """Reports which models are loaded; 200 once predictions can be served, 503 before that."""
+    if predictor is None:
+        return jsonify({"ready": False, "models": {}}), 503
+
+    is_ready = predictor.is_ready()
+    return jsonify({"ready": is_ready, "models": dict(predictor.model_status)}), 200 if is_ready else 503
 
 
 # --- Static File Serving ---
 # Route for serving index.html at the root
 @app.route('/')
 def serve_index():
-    print("Serving index.html")
+    logger.debug("Serving index.html")
     return send_from_directory('.', 'index.html')
 
 
@@ -41,7 +163,7 @@ def serve_index():
 # This captures requests for files in css/, js/, img/, vendor/, scss/, partials/ and specific html files
 @app.route('/<path:path>')
 def serve_static_files(path):
-    print(f"Attempting to serve static file: {path}")
+    logger.debug("Attempting to serve static file: %s", path)
     # Basic security check: prevent accessing files outside the project
     if '..' in path or path.startswith('/'):
         return "Not Found", 404
@@ -57,88 +179,292 @@ def serve_static_files(path):
         return send_from_directory('.', path)
     else:
         # If it doesn't match known static directories or HTML files, return 404
-        print(f"File not found or not allowed: {path}")
+        logger.debug("File not found or not allowed: %s", path)
         return "Not Found", 404
 
 # --- WebSocket Handler ---
-connected_clients = set()
+# Fan-out hub (ws_hub.py): per-client bounded queues, per-device subscriptions
+hub = BroadcastHub(queue_size=app.config['WS_QUEUE_SIZE'], send_timeout=app.config['WS_SEND_TIMEOUT'])
+if predictor is not None and app.config['STREAM_SCORING']:
+    hub.pipeline = StreamScorer(hub, predictor, tick_ms=app.config['STREAM_TICK_MS'],
+                                tolerance=app.config['STREAM_TOLERANCE'], evaluator=evaluator,
+                                max_devices=app.config['STREAM_MAX_DEVICES'],
+                                idle_timeout=app.config['STREAM_IDLE_TIMEOUT'])
+
+if app.config['HISTORY']:
+    # With several workers, serve.py hands the history over to the broker process
+    hub.store = TimeSeriesStore(capacity=app.config['HISTORY_CAPACITY'], windows=app.config['HISTORY_WINDOWS'],
+                                spill_dir=app.config['HISTORY_SPILL_DIR'], max_series=app.config['HISTORY_MAX_SERIES'],
+                                idle_timeout=app.config['HISTORY_IDLE_TIMEOUT'])
+
+async def handle_websocket(websocket, path=None):
+    await hub.handle(websocket, path)
+
+
+@app.route('/ws/stats')
+def websocket_stats():
+    """Connection, delivery and drop counters of the WebSocket hub, plus streaming scoring counters."""
+    stats = hub.stats()
+    if hub.pipeline is not None:
+        stats['scoring'] = hub.pipeline.stats()
+    return jsonify(stats)
+
+@app.route('/history')
+def history():
+    """
+    Recorded readings of one device: ?device_id=...&start=...&end=... (Unix timestamps) and
+    max_points to downsample to, plus its rolling statistics. Without device_id, lists the devices.
+    """
+    from_broker = hub.bridge is not None and hub.bridge.history  # Several workers: the broker keeps the history
+    if hub.store is None and not from_broker:
+        return jsonify({"error": "History is disabled."}), 404
+
+    query = {}
+    device_id = request.args.get('device_id') or request.args.get('patient_id')
+    if device_id is not None:
+        try:
+            start = float(request.args['start']) if 'start' in request.args else None
+            end = float(request.args['end']) if 'end' in request.args else None
+            max_points = min(int(request.args.get('max_points', app.config['HISTORY_MAX_POINTS'])),
+                             app.config['HISTORY_MAX_POINTS'])
+        except ValueError:
+            return jsonify({"error": "start and end must be timestamps and max_points an integer"}), 400
+        if max_points < 1:
+            return jsonify({"error": "max_points must be at least 1"}), 400
+        query = {'topic': device_id, 'start': start, 'end': end, 'max_points': max_points}
 
-async def handle_websocket(websocket, path):
-    print(f"New WebSocket connection from {websocket.remote_address}")
-    connected_clients.add(websocket)
     try:
-        async for message in websocket:
-            print(f"Received message from Arduino: {message}")
-            try:
-                data = json.loads(message)
-                print(f"Parsed JSON data: {data}")
-                # Relay data to all connected clients
-                for client in connected_clients:
-                    if client != websocket and client.open:
-                        try:
-                            await client.send(json.dumps(data))
-                        except Exception as e:
-                            print("Error sending data to client: {e}")
-            except json.JSONDecodeError as e:
-                print(f"Error decoding JSON: {message}")
-            except Exception as e:
-                print(f"Error handling message: {e}")
-    except websockets.exceptions.ConnectionClosedError as e:
-        print(f"WebSocket connection closed: {e}")
-    except Exception as e:
-        print(f"Error in WebSocket handler: {e}")
-    finally:
-        connected_clients.remove(websocket)
+        result = hub.bridge.query_history(**query) if from_broker else hub.store.query(**query)
+    except TimeoutError as e:
+        return jsonify({"error": str(e)}), 503
+    if result is None:
+        return jsonify({"error": f"No readings recorded for device '{device_id}'"}), 404
+    return jsonify(result)
+
+# --- Condition Rules ---
+@app.route('/rules')
+def rules_info():
+    """The condition table in use: file, rule count and reload counters."""
+    if predictor is None or predictor.rules is None:
+        return jsonify({"error": "Prediction service is unavailable due to model loading issues."}), 500
+    return jsonify(predictor.rules.info())
+
+
+@app.route('/rules/reload', methods=['POST'])
+def reload_rules():
+    """Recompiles the condition table now instead of waiting for the file change to be noticed."""
+    if predictor is None or predictor.rules is None:
+        return jsonify({"error": "Prediction service is unavailable due to model loading issues."}), 500
+    try:
+        predictor.rules.load()
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logger.error("Error reloading condition rules: %r", e)
+        return jsonify({"error": f"Invalid condition rules, keeping the previous ones: {e!r}"}), 400
+    return jsonify(predictor.rules.info())
+
+# --- Model Versions ---
+@app.route('/models')
+def models_info():
+    """The model version being served, the registry's versions and the state of the last swap."""
+    if predictor is None:
+        return jsonify({"error": "Prediction service is unavailable due to model loading issues."}), 500
+    info = {"active": predictor.version, "swap": dict(predictor.swap_status), "models": dict(predictor.model_status)}
+    if registry is not None:
+        info.update(registry_active=registry.active_version(), versions=registry.versions(), history=registry.history())
+    return jsonify(info)
+
+
+def _activate_version(activate):
+    """Records a new active version in the registry and starts loading it; the swap happens in the background."""
+    if predictor is None:
+        return jsonify({"error": "Prediction service is unavailable due to model loading issues."}), 500
+    if registry is None:
+        return jsonify({"error": "No model registry configured"}), 400
+    try:
+        version = activate()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    # Other workers pick the change up from the registry
+    predictor.load_version(version)
+    return jsonify({"version": version, "state": "loading"}), 202
+
+
+@app.route('/models/activate', methods=['POST'])
+def activate_model():
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data.get('version'), str):
+        return jsonify({"error": "Request must be JSON with a 'version'"}), 400
+    return _activate_version(lambda: registry.activate(data['version']))
+
+
+@app.route('/models/rollback', methods=['POST'])
+def rollback_model():
+    return _activate_version(lambda: registry.rollback())
 
 # --- API Endpoint ---
 @app.route('/predict', methods=['POST'])
 def predict():
     global predictor  # Access the globally initialized predictor
-    print("Received request for /predict")
+    logger.debug("Received request for /predict")
 
     if predictor is None:
-        print("Error: Predictor not initialized.")
+        logger.error("Predictor not initialized.")
         return jsonify({"error": "Prediction service is unavailable due to model loading issues."}), 500
 
     if not request.is_json:
-        print("Error: Request is not JSON.")
+        logger.debug("Request is not JSON.")
         return jsonify({"error": "Request must be JSON"}), 400
 
     data = request.get_json()
-    print(f"Received data for prediction: {data}")
+    logger.debug("Received data for prediction: %s", data)
 
     # Basic validation of incoming data (adjust keys as needed based on your JS)
     required_keys = ['heart_rate', 'blood_pressure_systolic', 'blood_pressure_diastolic', 'spo2', 'temperature', 'glucose']  # Match keys sent by JS
     if not all(key in data for key in required_keys):
         missing_keys = [key for key in required_keys if key not in data]
-        print(f"Error: Missing required keys: {missing_keys}")
+        logger.debug("Missing required keys: %s", missing_keys)
         return jsonify({"error": f"Missing required keys: {missing_keys}. Expected: {required_keys}"}), 500
 
     try:
         # Get predictions from the predictor class instance
-        predictions_result = predictor.predict_health(data)
-        print(f"Prediction result: {predictions_result}")
+        if batcher is not None:
+            predictions_result, model_version = batcher.predict(data, timeout=app.config['PREDICT_TIMEOUT'])
+        else:
+            models = predictor.models  # Pinned so a concurrent version swap does not affect this request
+            predictions_result, model_version = predictor.predict_health(data, models=models), models.version
+        logger.debug("Prediction result: %s", predictions_result)
 
         # Return the results in the format expected by the frontend
-        return jsonify({"predictions": predictions_result})
+        response = {"predictions": predictions_result, "model_version": model_version}
+        # Readings that name their patient also update that patient's sustained and trend rules
+        patient_id = data.get('device_id') or data.get('patient_id')
+        if evaluator is not None and patient_id is not None:
+            response["alerts"] = evaluator.update(str(patient_id), time.time(), data)
+        with timed('serialization'):
+            return jsonify(response)
+
+    except Exception as e:
+        logger.exception("Error during /predict handling: %s", e)
+        return jsonify({"error": "An internal error occurred during prediction."}), 500
+
+
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    global predictor
+    logger.debug("Received request for /predict/batch")
+
+    if predictor is None:
+        logger.error("Predictor not initialized.")
+        return jsonify({"error": "Prediction service is unavailable due to model loading issues."}), 500
+
+    if not request.is_json:
+        logger.debug("Request is not JSON.")
+        return jsonify({"error": "Request must be JSON"}), 400
+
+    data = request.get_json()
+    # Accept either a bare list of readings or {"readings": [...]}
+    readings = data.get('readings') if isinstance(data, dict) else data
+    if not isinstance(readings, list):
+        return jsonify({"error": "Request must be a list of readings or an object with a 'readings' list"}), 400
+    if len(readings) > app.config['MAX_BATCH_SIZE']:
+        return jsonify({"error": f"Batch too large: {len(readings)} readings, maximum is {app.config['MAX_BATCH_SIZE']}"}), 413
+    logger.debug("Received batch of %d readings for prediction", len(readings))
+
+    try:
+        models = predictor.models
+        predictions_result = predictor.predict_health_batch(readings, models=models)
+        with timed('serialization'):
+            return jsonify({"predictions": predictions_result, "model_version": models.version})
 
+    except ValueError as e:
+        logger.debug("Invalid batch: %s", e)
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
-        print(f"Error during /predict handling: {e}")
-        print(traceback.format_exc())
+        logger.exception("Error during /predict/batch handling: %s", e)
         return jsonify({"error": "An internal error occurred during prediction."}), 500
 
 
+@app.route('/predict/stats')
+def predict_stats():
+    """Batch size and queue wait histograms of the /predict micro-batcher, plus cache and early-warning counters."""
+    stats = {"enabled": False} if batcher is None else {"enabled": True, **batcher.stats()}
+    if predictor is not None and predictor.cache is not None:
+        stats['cache'] = predictor.cache.stats()
+    if evaluator is not None:
+        stats['early_warning'] = evaluator.stats()
+    return jsonify(stats)
+
+
+# --- Metrics and Profiling ---
+def collect_component_metrics():
+    """Counters the hub, micro-batcher, cache and early-warning evaluator keep themselves, read at scrape time."""
+    samples = []
+    if predictor is not None:
+        status = predictor.model_status
+        samples.append(('lifeline_model_info', 'gauge', "Model version being served and the state of each model",
+                        {'version': predictor.version, 'random_forest': status.get('random_forest'),
+                         'neural_network': status.get('neural_network')}, 1))
+        if predictor.cache is not None:
+            samples += stats_samples('lifeline_prediction_cache', predictor.cache.stats(), "Prediction cache",
+                                     predictor.cache.COUNTERS)
+    if batcher is not None:
+        samples += stats_samples('lifeline_microbatch', batcher.stats(), "/predict micro-batcher", batcher.COUNTERS)
+    hub_stats = hub.stats()
+    hub_stats.pop('timestamp')
+    samples += stats_samples('lifeline_ws', hub_stats, "WebSocket hub", hub.COUNTERS)
+    if hub.pipeline is not None:
+        samples += stats_samples('lifeline_stream_scoring', hub.pipeline.stats(), "WebSocket stream scoring",
+                                 hub.pipeline.COUNTERS)
+    if evaluator is not None:
+        samples += stats_samples('lifeline_early_warning', evaluator.stats(), "Early warnings", evaluator.COUNTERS)
+    return samples
+
+
+REGISTRY.add_collector(collect_component_metrics)
+
+
+@app.route('/metrics')
+def metrics():
+    """Every counter and histogram of this process in the Prometheus text format."""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/profiler')
+def profiler_stacks():
+    """Sampled stacks in the collapsed format (flamegraph.pl, speedscope), most frequent first."""
+    return Response(profiler.stacks(), mimetype='text/plain')
+
+
+@app.route('/profiler/start', methods=['POST'])
+def start_profiler():
+    """Starts sampling; {"reset": true} discards the stacks collected so far, "interval_ms" sets the period."""
+    data = request.get_json(silent=True) or {}
+    if data.get('reset'):
+        profiler.reset()
+    if 'interval_ms' in data:
+        try:
+            interval_ms = float(data['interval_ms'])
+        except (TypeError, ValueError):
+            interval_ms = 0
+        if interval_ms <= 0:
+            return jsonify({"error": "interval_ms must be a positive number"}), 400
+        profiler.interval = interval_ms / 1000.0  # Read by the sampling thread on every tick
+    profiler.start()
+    return jsonify(profiler.stats())
+
+
+@app.route('/profiler/stop', methods=['POST'])
+def stop_profiler():
+    profiler.stop()
+    return jsonify(profiler.stats())
+
+
 # --- Server Execution ---
-async def main():
-    # Start the WebSocket server
-    ws_server = websockets.serve(handle_websocket, '0.0.0.0', 5001)
-    # Run the Flask app
-    # Use host='0.0.0.0' to make it accessible on the network
-    # Debug=True is useful for development but should be False in production
-    print("Starting Flask server...")
-    # Use port 5001 to avoid potential conflicts if 5000 is common
-    await ws_server
-    app.run(debug=True, host='0.0.0.0', port=5000, use_reloader=False)
+def main():
+    # The WebSocket hub runs on the asyncio event loop and Flask is served from a thread pool
+    # next to it, so neither blocks the other. See serve.py for running several workers with gunicorn.
+    from serve import run_single_process
+    run_single_process(app, hub, host='0.0.0.0', http_port=5000, ws_port=5001)
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    main()
@@ -0,0 +1,42 @@
+"""
+Leveled logging that never makes a request wait on console output.
+
+configure_logging() gives the root logger a QueueHandler: the logging thread only formats
+the record and appends it to an in-memory queue, and a QueueListener thread writes it to
+stderr. Per-request details (payloads, prediction lists, static file fetches) are logged at
+DEBUG, so at the default INFO level they cost one level check and are never formatted.
+
+The level comes from LIFELINE_LOG_LEVEL (DEBUG, INFO, WARNING, ERROR), INFO by default.
+"""
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+
+LOG_FORMAT = '%(asctime)s %(levelname)s [%(name)s] %(message)s'
+
+_listener = None
+
+
+def configure_logging(level=None):
+    """
+    Routes the root logger through a queue to stderr, once per process; later calls only
+    change the level. Call it after forking (gunicorn workers import app.py after the fork),
+    the listener thread does not survive one.
+    """
+    global _listener
+    level = level or os.environ.get('LIFELINE_LOG_LEVEL', 'INFO')
+    root = logging.getLogger()
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    if _listener is not None:
+        return _listener
+
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter(LOG_FORMAT))
+    records = queue.SimpleQueue()
+    root.addHandler(logging.handlers.QueueHandler(records))
+    _listener = logging.handlers.QueueListener(records, console, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)  # Writes out what is still queued
+    return _listener
@@ -0,0 +1,62 @@
+"""
+Per-sample cost of the early-warning evaluator with many concurrent patients.
+
+Every patient first gets a reading so all state rows exist, then readings from random
+patients are fed one at a time (the /predict path) and in batches (one stream scoring tick).
+
+Run from the Lifeline-System directory:
+    python benchmarks/bench_early_warning.py --patients 10000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from early_warning import EarlyWarningEvaluator  # noqa: E402
+
+MEANS = [80, 120, 80, 95, 37.0, 100]
+SPREAD = [20, 20, 10, 4, 1.0, 30]
+
+
+def run(evaluator, patient_ids, rng, batch_size, samples, clock):
+    """Microseconds per sample feeding `samples` readings in batches of batch_size."""
+    vitals = rng.normal(MEANS, SPREAD, (samples, len(MEANS)))
+    # Distinct patients per batch, as in one tick of 1 Hz devices
+    picks = [rng.choice(len(patient_ids), batch_size, replace=False) for _ in range(samples // batch_size)]
+    started_at = time.perf_counter()
+    for b, pick in enumerate(picks):
+        clock += 1.0
+        rows = slice(b * batch_size, (b + 1) * batch_size)
+        evaluator.update_batch([patient_ids[i] for i in pick], np.full(batch_size, clock), vitals[rows])
+    return (time.perf_counter() - started_at) / (len(picks) * batch_size) * 1e6, clock
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--patients', type=int, default=10000)
+    parser.add_argument('--samples', type=int, default=20000, help="Readings fed per batch size")
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    evaluator = EarlyWarningEvaluator(max_gap=1e9)
+    patient_ids = [f"patient-{i}" for i in range(args.patients)]
+    clock = 0.0
+    evaluator.update_batch(patient_ids, np.zeros(args.patients), rng.normal(MEANS, SPREAD, (args.patients, len(MEANS))))
+
+    print(f"{args.patients} patients, "
+          f"{len(evaluator.sustained_rules)} sustained and {len(evaluator.trend_rules)} trend rules")
+    print(f"{'batch size':>10}{'us/sample':>12}")
+    for batch_size in (1, 16, 64, 256, 1024):
+        if batch_size > args.patients:
+            break
+        samples = min(args.samples, 5000) if batch_size == 1 else args.samples  # Single updates are slow to feed
+        usec, clock = run(evaluator, patient_ids, rng, batch_size, samples, clock)
+        print(f"{batch_size:>10}{usec:>12.2f}")
+    print(evaluator.stats())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Memory used by the models across worker processes, per loading mode.
+
+Starts --workers fresh processes (like gunicorn workers without preload_app), has each load
+the models and score some readings, and reads their memory from /proc while all of them are
+alive. Modes:
+
+    joblib  sklearn Random Forest unpickled with joblib.load in every process (the original path)
+    npz     compiled RF / NumPy NN arrays read into every process
+    mmap    the same arrays mapped read-only from the files (LIFELINE_MMAP_MODELS=1)
+
+"private" is what loading added to each process that no other process shares; "PSS" is the
+proportional set size summed over all workers, i.e. the physical memory they really cost.
+Linux only. Run from the Lifeline-System directory:
+    python benchmarks/bench_model_memory.py --workers 8
+    python benchmarks/bench_model_memory.py --workers 8 --synthetic-rows 200000   # a larger forest
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import warnings
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rf_engine import CompiledForest, export_forest  # noqa: E402
+from nn_engine import DenseNetwork  # noqa: E402
+
+MODES = ('joblib', 'npz', 'mmap')
+LOW = [30, 70, 40, 70, 34.0, 40]
+HIGH = [180, 200, 130, 100, 41.0, 400]
+
+
+def memory(pid='self'):
+    """Rss, Pss and private bytes of a process, from /proc/<pid>/smaps_rollup."""
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1]) * 1024
+    return {'rss': fields['Rss'], 'pss': fields['Pss'],
+            'private': fields['Private_Clean'] + fields['Private_Dirty']}
+
+
+def load(mode, paths):
+    if mode == 'joblib':
+        import joblib
+        warnings.filterwarnings('ignore', message='X does not have valid feature names')
+        rf = joblib.load(paths['rf'])
+    else:
+        rf = CompiledForest.load(paths['compiled_rf'], mmap=mode == 'mmap')
+    nn = DenseNetwork.load(paths['numpy_nn'], mmap=mode == 'mmap') if paths.get('numpy_nn') else None
+    return rf, nn
+
+
+def worker(mode, paths, results, release):
+    before = memory()
+    rf, nn = load(mode, paths)
+    # Score enough readings to reach every node, as a worker does after serving for a while
+    X = np.random.default_rng(os.getpid()).uniform(LOW, HIGH, size=(4096, len(LOW)))
+    rf.predict_proba(X)
+    if nn is not None:
+        nn.predict(X)
+    results.put((os.getpid(), before, memory()))
+    release.wait()
+
+
+def measure(mode, paths, workers):
+    context = multiprocessing.get_context('spawn')
+    results, release = context.Queue(), context.Event()
+    processes = [context.Process(target=worker, args=(mode, paths, results, release)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    try:
+        reports = [results.get(timeout=300) for _ in processes]
+        # Read while every worker still holds its models, so shared pages are split between all of them
+        total_pss = sum(memory(pid)['pss'] for pid, _, _ in reports)
+        private = [after['private'] - before['private'] for _, before, after in reports]
+    finally:
+        release.set()
+        for process in processes:
+            process.join()
+    return float(np.mean(private)), total_pss
+
+
+def synthetic_models(directory, rows):
+    """Trains a 100-tree forest on random readings and exports it, for a model of realistic size."""
+    import joblib
+    from sklearn.ensemble import RandomForestClassifier
+
+    rng = np.random.default_rng(0)
+    X = rng.uniform(LOW, HIGH, size=(rows, len(LOW)))
+    y = (X[:, 0] + rng.normal(0, 20, rows) > 110).astype(int)
+    rf = RandomForestClassifier(n_estimators=100, random_state=0, n_jobs=-1).fit(X, y)
+    paths = {'rf': os.path.join(directory, 'random_forest.pkl'), 'compiled_rf': os.path.join(directory, 'random_forest.npz')}
+    joblib.dump(rf, paths['rf'])
+    export_forest(rf).save(paths['compiled_rf'])
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--models-dir', default='models')
+    parser.add_argument('--synthetic-rows', type=int, default=0,
+                        help="Train a forest on this many random rows instead of using --models-dir")
+    parser.add_argument('--modes', default=','.join(MODES))
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.synthetic_rows:
+            paths = synthetic_models(tmp, args.synthetic_rows)
+        else:
+            paths = {name: os.path.join(args.models_dir, file) for name, file in
+                     (('rf', 'random_forest.pkl'), ('compiled_rf', 'random_forest.npz'), ('numpy_nn', 'neural_network.npz'))}
+            paths = {name: path for name, path in paths.items() if os.path.exists(path)}
+            if 'compiled_rf' not in paths and 'rf' in paths:
+                import joblib
+                paths['compiled_rf'] = os.path.join(tmp, 'random_forest.npz')
+                export_forest(joblib.load(paths['rf'])).save(paths['compiled_rf'])
+        sizes = ', '.join(f"{os.path.basename(path)} {os.path.getsize(path) / 2**20:.1f} MB" for path in paths.values())
+        print(f"{args.workers} workers, {sizes}")
+        print(f"{'mode':>8}{'private MB/worker':>20}{'total PSS MB':>15}")
+        for mode in args.modes.split(','):
+            if mode == 'joblib' and 'rf' not in paths:
+                continue
+            private, total_pss = measure(mode, paths, args.workers)
+            print(f"{mode:>8}{private / 2**20:>20.2f}{total_pss / 2**20:>15.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Micro-benchmarks of the prediction pipeline stages at batch sizes 1 to 4096.
+
+For every batch size, times each stage on its own:
+
+    preprocess  validate_batch + FeaturePreprocessor.transform_batch (preprocess_data for 1 reading)
+    rf          Random Forest probabilities
+    nn          neural network probabilities
+    rules       condition rules mapping (RulesEngine.evaluate)
+    predict     predict_health_batch end to end, without the prediction cache
+
+and reports microseconds per call and per reading. Run from the Lifeline-System directory:
+    python benchmarks/bench_predictor.py --output results/predictor.json
+    python benchmarks/bench_predictor.py --sklearn --keras    # the pickled / Keras models
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from health_ai import HealthAIPredictor  # noqa: E402
+from common import reading, write_results  # noqa: E402
+
+BATCH_SIZES = (1, 4, 16, 64, 256, 1024, 4096)
+STAGES = ('preprocess', 'rf', 'nn', 'rules', 'predict')
+
+
+def best_of(fn, repeat, min_time):
+    """Best per-call time in microseconds; each of `repeat` runs lasts at least min_time seconds."""
+    timer = timeit.Timer(fn)
+    number = 1
+    while timer.timeit(number) < min_time:
+        number *= 2
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e6
+
+
+def stage_calls(predictor, readings):
+    """One zero-argument callable per stage, all working on the same batch."""
+    models = predictor.models
+    raw = predictor.validate_batch(readings)
+    features = models.preprocessor.transform_batch(raw)
+    probabilities = predictor._model_probabilities(models, features)
+    rf_features = features if models.rf_scaler is None else models.rf_scaler.transform(features)
+    nn_features = features if models.nn_scaler is None else models.nn_scaler.transform(features)
+
+    if len(readings) == 1:
+        preprocess = lambda: predictor.preprocess_data(readings[0])  # noqa: E731
+    else:
+        preprocess = lambda: models.preprocessor.transform_batch(predictor.validate_batch(readings))  # noqa: E731
+    return {
+        'preprocess': preprocess,
+        'rf': lambda: models.rf_model.predict_proba(predictor._rf_input(models, rf_features)),
+        'nn': lambda: models.nn_model.predict(nn_features, verbose=0),
+        'rules': lambda: predictor.rules.evaluate(raw, probabilities),
+        'predict': lambda: predictor.predict_health_batch(readings),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch-sizes', default=','.join(map(str, BATCH_SIZES)))
+    parser.add_argument('--sklearn', action='store_true', help="Score with the pickled sklearn forest")
+    parser.add_argument('--keras', action='store_true', help="Run the neural network with Keras")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--min-time', type=float, default=0.1, help="Seconds each timing run lasts at least")
+    parser.add_argument('--output', help="Write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    predictor = HealthAIPredictor(compiled_rf=not args.sklearn, numpy_nn=not args.keras)
+    if predictor.nn_model is None:
+        raise SystemExit("The neural network did not load, nothing to benchmark for it.")
+    rng = random.Random(0)
+
+    results = {'models': {'rf': type(predictor.rf_model).__name__, 'nn': type(predictor.nn_model).__name__,
+                          'version': predictor.version}, 'batches': {}}
+    print(f"{'batch':>6}" + ''.join(f"{stage + ' us':>16}" for stage in STAGES) + f"{'predict us/reading':>20}")
+    for batch_size in [int(size) for size in args.batch_sizes.split(',')]:
+        readings = [reading(rng) for _ in range(batch_size)]
+        timings = {}
+        for stage, call in stage_calls(predictor, readings).items():
+            usec = best_of(call, args.repeat, args.min_time)
+            timings[stage] = {'us_per_call': usec, 'us_per_reading': usec / batch_size}
+        results['batches'][str(batch_size)] = timings
+        print(f"{batch_size:>6}" + ''.join(f"{timings[stage]['us_per_call']:>16.1f}" for stage in STAGES)
+              + f"{timings['predict']['us_per_reading']:>20.2f}")
+
+    write_results(args.output, 'bench_predictor', results)
+    return results
+
+
+if __name__ == '__main__':
+    main()
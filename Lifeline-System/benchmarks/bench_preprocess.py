@@ -0,0 +1,76 @@
+"""
+Micro-benchmark of FeaturePreprocessor against the previous pandas based preprocess_data.
+
+Run from the Lifeline-System directory:
+    python benchmarks/bench_preprocess.py
+"""
+import os
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from preprocessing import FeaturePreprocessor  # noqa: E402
+
+FEATURE_NAMES = ['heart_rate', 'systolic_bp', 'diastolic_bp', 'spo2', 'temperature', 'glucose']
+SAMPLE_METRICS = {
+    'heart_rate': 75,
+    'blood_pressure_systolic': 120,
+    'blood_pressure_diastolic': 80,
+    'spo2': 98,
+    'temperature': 36.6,
+    'glucose': 100
+}
+
+
+def legacy_preprocess(metrics, feature_names=FEATURE_NAMES):
+    """The DataFrame based preprocess_data this module replaced, kept for comparison."""
+    data = {
+        'heart_rate': metrics.get('heart_rate'),
+        'systolic_bp': metrics.get('blood_pressure_systolic'),
+        'diastolic_bp': metrics.get('blood_pressure_diastolic'),
+        'spo2': metrics.get('spo2'),
+        'temperature': metrics.get('temperature'),
+        'glucose': metrics.get('glucose', 100)
+    }
+    features = pd.DataFrame([data], columns=feature_names)
+    features = features.astype(float)
+    features = features.fillna(0)
+    features['heart_rate'] = features['heart_rate'].clip(0, 200)
+    features['systolic_bp'] = features['systolic_bp'].clip(0, 300)
+    features['diastolic_bp'] = features['diastolic_bp'].clip(0, 200)
+    features['spo2'] = features['spo2'].clip(0, 100)
+    features['temperature'] = features['temperature'].clip(30, 45)
+    features['glucose'] = features['glucose'].clip(0, 500)
+    return features
+
+
+def best_of(stmt, number, repeat=5):
+    """Best per-call time in microseconds over `repeat` runs of `number` calls."""
+    return min(timeit.repeat(stmt, number=number, repeat=repeat)) / number * 1e6
+
+
+def main():
+    preprocessor = FeaturePreprocessor(FEATURE_NAMES)
+    row = preprocessor.empty()
+
+    # Both implementations must agree before their timings mean anything
+    expected = legacy_preprocess(SAMPLE_METRICS).to_numpy()
+    assert np.array_equal(preprocessor.transform(SAMPLE_METRICS), expected)
+
+    results = {
+        'pandas DataFrame (legacy)': best_of(lambda: legacy_preprocess(SAMPLE_METRICS), 200),
+        'FeaturePreprocessor.transform': best_of(lambda: preprocessor.transform(SAMPLE_METRICS), 20000),
+        'FeaturePreprocessor.transform (out=)': best_of(lambda: preprocessor.transform(SAMPLE_METRICS, out=row), 20000),
+    }
+
+    baseline = results['pandas DataFrame (legacy)']
+    print(f"{'implementation':<40}{'us/reading':>12}{'speedup':>10}")
+    for name, usec in results.items():
+        print(f"{name:<40}{usec:>12.2f}{baseline / usec:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Helpers shared by the benchmarks: synthetic device readings and JSON result files, so runs
+can be compared between commits.
+
+Every result file holds {"benchmark": name, "meta": {...}, "results": {...}}: meta records the
+commit, machine and library versions the numbers were measured with, results the numbers
+themselves (nested dicts of metrics). compare.py diffs two such files.
+"""
+import datetime
+import json
+import os
+import platform
+import subprocess
+
+import numpy as np
+
+# Vitals ranges of the simulated devices: normal readings with the odd abnormal one
+READING_RANGES = {
+    'heart_rate': (55, 110),
+    'blood_pressure_systolic': (100, 150),
+    'blood_pressure_diastolic': (60, 95),
+    'spo2': (90, 100),
+    'temperature': (36.0, 38.5),
+    'glucose': (80, 180),
+}
+
+
+def reading(rng):
+    """One reading with the fields of the Arduino sketch's JSON (Project-Lifeline-01.ino); rng is a random.Random."""
+    values = {key: rng.randint(low, high) for key, (low, high) in READING_RANGES.items() if key != 'temperature'}
+    values['temperature'] = round(rng.uniform(*READING_RANGES['temperature']), 1)
+    return {key: values[key] for key in READING_RANGES}
+
+
+def git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_metadata():
+    return {
+        'commit': git_commit(),
+        'date': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'host': platform.node(),
+        'cpu_count': os.cpu_count(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+    }
+
+
+def percentiles(samples_ms):
+    """p50/p95/p99/max/mean of a list of latencies in milliseconds."""
+    samples = np.asarray(samples_ms, dtype=np.float64)
+    if len(samples) == 0:
+        return {'p50': None, 'p95': None, 'p99': None, 'max': None, 'mean': None}
+    p50, p95, p99, top = np.percentile(samples, [50, 95, 99, 100])
+    return {'p50': float(p50), 'p95': float(p95), 'p99': float(p99), 'max': float(top), 'mean': float(samples.mean())}
+
+
+def write_results(path, benchmark, results):
+    """Writes one result file (creating its directory) and returns the document written."""
+    document = {'benchmark': benchmark, 'meta': run_metadata(), 'results': results}
+    if path:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(document, f, indent=2)
+        print(f"Wrote {path}")
+    return document
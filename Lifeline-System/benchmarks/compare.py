@@ -0,0 +1,82 @@
+"""
+Compares two benchmark result files (see common.py) and flags regressions.
+
+Every numeric metric present in both files is listed with its relative change. Latencies and
+per-call times are better lower, rates (*_per_s) better higher; a change for the worse larger
+than --threshold percent is a regression and makes the script exit with status 1.
+
+    python benchmarks/compare.py results/base.json results/new.json --threshold 10
+"""
+import argparse
+import json
+import sys
+
+LOWER_IS_BETTER = ('us_per_call', 'us_per_reading', 'latency_ms', 'us/sample')
+HIGHER_IS_BETTER = ('_per_s',)
+
+
+def flatten(results, prefix=''):
+    """{'a': {'b': 1}} -> {'a.b': 1}, numeric leaves only."""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def direction(name):
+    """-1 when lower is better, 1 when higher is better, 0 for counters that are neither."""
+    if any(token in name for token in LOWER_IS_BETTER):
+        return -1
+    if any(name.endswith(token) for token in HIGHER_IS_BETTER):
+        return 1
+    return 0
+
+
+def compare(base, new, threshold, show_all=False):
+    base_flat, new_flat = flatten(base['results']), flatten(new['results'])
+    regressions = []
+    rows = []
+    for name in sorted(set(base_flat) & set(new_flat)):
+        sign = direction(name)
+        if sign == 0 and not show_all:
+            continue
+        old, cur = base_flat[name], new_flat[name]
+        change = (cur - old) / old * 100.0 if old else 0.0
+        worse = sign != 0 and -sign * change > threshold
+        if worse:
+            regressions.append(name)
+        rows.append((name, old, cur, change, 'REGRESSION' if worse else ''))
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('base')
+    parser.add_argument('new')
+    parser.add_argument('--threshold', type=float, default=10.0, help="Percent change for the worse that counts as a regression")
+    parser.add_argument('--all', action='store_true', help="Also list counters that are neither better lower nor higher")
+    args = parser.parse_args(argv)
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    print(f"base: {base['meta'].get('commit')} {base['meta'].get('date')}   new: {new['meta'].get('commit')} {new['meta'].get('date')}")
+    if base['meta'].get('host') != new['meta'].get('host'):
+        print("Warning: the runs come from different hosts, timings are not directly comparable.")
+
+    rows, regressions = compare(base, new, args.threshold, args.all)
+    width = max([len(row[0]) for row in rows] + [6])
+    print(f"{'metric':<{width}}{'base':>14}{'new':>14}{'change':>10}")
+    for name, old, cur, change, flag in rows:
+        print(f"{name:<{width}}{old:>14.3f}{cur:>14.3f}{change:>+9.1f}%  {flag}")
+    print(f"{len(regressions)} regression(s) above {args.threshold:.0f}%")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
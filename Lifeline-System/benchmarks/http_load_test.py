@@ -0,0 +1,193 @@
+"""
+HTTP load generator for /predict.
+
+--processes x --threads keep-alive connections each send device readings as fast as the
+server answers them (closed loop), or at a fixed total --rate. After --warmup seconds,
+every request is timed for --duration seconds; the report has requests per second,
+latency percentiles (ms), status codes, errors and the model versions that answered.
+
+Run from the Lifeline-System directory, against the app served in-process (loads models/*):
+    python benchmarks/http_load_test.py --threads 16 --duration 10 --output results/http.json
+or against a running server, e.g. gunicorn with several workers:
+    python benchmarks/http_load_test.py --url http://localhost:5000 --processes 4 --threads 16
+/predict/batch with 64 readings per request:
+    python benchmarks/http_load_test.py --batch-size 64
+"""
+import argparse
+import collections
+import contextlib
+import http.client
+import json
+import logging
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import percentiles, reading, write_results  # noqa: E402
+
+
+def run_connection(host, port, path, make_body, interval, start_at, stop_at, shard):
+    """One keep-alive connection sending requests back to back (or every `interval` seconds)."""
+    connection = None
+    next_send = time.time()
+    while True:
+        now = time.time()
+        if now >= stop_at:
+            break
+        if interval:
+            time.sleep(max(0.0, next_send - now))
+            next_send += interval
+        body = make_body()
+        started_at = time.perf_counter()
+        sent_at = time.time()
+        try:
+            if connection is None:
+                connection = http.client.HTTPConnection(host, port, timeout=30)
+            connection.request('POST', path, body=body, headers={'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            payload = response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            with shard['lock']:
+                shard['errors'] += 1
+            if connection is not None:
+                connection.close()
+            connection = None
+            continue
+        latency_ms = (time.perf_counter() - started_at) * 1000.0
+        if sent_at < start_at:
+            continue  # Warmup
+        version = None
+        if status == 200:
+            try:
+                version = json.loads(payload).get('model_version')
+            except ValueError:
+                pass
+        with shard['lock']:
+            shard['latencies'].append(latency_ms)
+            shard['statuses'][str(status)] += 1
+            shard['versions'][str(version)] += 1
+    if connection is not None:
+        connection.close()
+
+
+def shard_main(url, path, threads, batch_size, with_ids, interval, start_at, stop_at, seed, results):
+    """One load generator process: `threads` connections."""
+    parts = urlsplit(url)
+    shard = {'latencies': [], 'statuses': collections.Counter(), 'versions': collections.Counter(),
+             'errors': 0, 'lock': threading.Lock()}
+
+    def body_maker(index):
+        rng = random.Random(seed * 1000 + index)
+        device_id = f"device-{seed}-{index}"
+
+        def make_body():
+            if batch_size:
+                return json.dumps({'readings': [reading(rng) for _ in range(batch_size)]})
+            payload = reading(rng)
+            if with_ids:
+                payload['device_id'] = device_id
+            return json.dumps(payload)
+        return make_body
+
+    workers = [threading.Thread(target=run_connection, args=(parts.hostname, parts.port or 80, path, body_maker(i),
+                                                             interval, start_at, stop_at, shard))
+               for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    del shard['lock']
+    results.put(shard)
+
+
+@contextlib.contextmanager
+def local_server():
+    """Serves app.py from a thread of this process, without the per-request access log."""
+    from werkzeug.serving import make_server
+
+    import app as lifeline_app
+    if lifeline_app.predictor is None:
+        raise SystemExit("The predictor failed to load, see the log above")
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, lifeline_app.app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}", lifeline_app
+    finally:
+        server.shutdown()
+
+
+def run(args, url, app_module=None):
+    path = '/predict/batch' if args.batch_size else '/predict'
+    connections = args.processes * args.threads
+    interval = connections / args.rate if args.rate else 0.0
+    start_at = time.time() + args.warmup
+    stop_at = start_at + args.duration
+
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Queue()
+    processes = [ctx.Process(target=shard_main, args=(url, path, args.threads, args.batch_size, args.with_ids,
+                                                      interval, start_at, stop_at, i, results))
+                 for i in range(args.processes)]
+    for process in processes:
+        process.start()
+    shards = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    latencies = [latency for shard in shards for latency in shard['latencies']]
+    statuses, versions = collections.Counter(), collections.Counter()
+    for shard in shards:
+        statuses.update(shard['statuses'])
+        versions.update(shard['versions'])
+    report = {
+        'url': url,
+        'path': path,
+        'connections': connections,
+        'batch_size': args.batch_size or 1,
+        'duration_s': args.duration,
+        'requests': len(latencies),
+        'requests_per_s': round(len(latencies) / args.duration, 1),
+        'readings_per_s': round(len(latencies) * (args.batch_size or 1) / args.duration, 1),
+        'errors': sum(shard['errors'] for shard in shards),
+        'statuses': dict(statuses),
+        'model_versions': dict(versions),
+        'latency_ms': percentiles(latencies),
+    }
+    if app_module is not None and app_module.batcher is not None:
+        report['microbatch'] = app_module.batcher.stats()
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help="Server to load, e.g. http://localhost:5000 (default: app.py in-process)")
+    parser.add_argument('--processes', type=int, default=2, help="Load generator processes")
+    parser.add_argument('--threads', type=int, default=8, help="Connections per process")
+    parser.add_argument('--rate', type=float, default=0.0, help="Total requests per second, 0 sends back to back")
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--warmup', type=float, default=2.0)
+    parser.add_argument('--batch-size', type=int, default=0, help="Post this many readings per request to /predict/batch")
+    parser.add_argument('--with-ids', action='store_true', help="Send a device_id, so the early-warning rules run too")
+    parser.add_argument('--output', help="Write the report to this JSON file")
+    args = parser.parse_args(argv)
+
+    if args.url:
+        report = run(args, args.url.rstrip('/'))
+    else:
+        with local_server() as (url, app_module):
+            report = run(args, url, app_module)
+    print(json.dumps(report, indent=2))
+    write_results(args.output, 'http_load_test', report)
+    return report
+
+
+if __name__ == '__main__':
+    main()
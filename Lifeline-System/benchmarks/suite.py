@@ -0,0 +1,49 @@
+"""
+Runs the predictor micro-benchmarks, the HTTP load test and the WebSocket load test with
+settings short enough for every commit, and writes them to one result file.
+
+Run from the Lifeline-System directory:
+    python benchmarks/suite.py                    # writes benchmarks/results/<commit>.json
+    python benchmarks/compare.py benchmarks/results/<base>.json benchmarks/results/<new>.json
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import bench_predictor  # noqa: E402
+import http_load_test  # noqa: E402
+import ws_load_test  # noqa: E402
+from common import git_commit, write_results  # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', help="Result file (default: benchmarks/results/<commit>.json)")
+    parser.add_argument('--duration', type=float, default=5.0, help="Seconds each load test runs")
+    parser.add_argument('--skip', default='', help="Comma-separated parts to skip: predictor, http, ws")
+    args = parser.parse_args(argv)
+    skip = set(args.skip.split(','))
+
+    results = {}
+    if 'predictor' not in skip:
+        print("--- Predictor micro-benchmarks ---")
+        results['bench_predictor'] = bench_predictor.main([])
+    if 'http' not in skip:
+        print("--- HTTP /predict load test ---")
+        results['http_load_test'] = http_load_test.main(['--duration', str(args.duration)])
+    if 'ws' not in skip:
+        print("--- WebSocket load test ---")
+        ws_args = ws_load_test.parse_args(['--score', '--devices', '50', '--clients', '500',
+                                           '--duration', str(args.duration)])
+        results['ws_load_test'] = asyncio.run(ws_load_test.main(ws_args))
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{git_commit() or 'local'}.json")
+    write_results(output, 'suite', results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+"""
+Local load test of the WebSocket hub with simulated devices and dashboard clients.
+
+Devices send the Arduino payload (see Project-Lifeline-01.ino) at a fixed rate, clients
+subscribe to a few devices (or to all of them) and measure delivery latency. A share of
+the clients never read, to check that slow consumers do not hold back everyone else.
+Devices and clients are spread over --processes worker processes so the load generator
+does not compete with the hub for one event loop.
+
+Run from the Lifeline-System directory, against an in-process hub:
+    python benchmarks/ws_load_test.py --devices 50 --clients 1000 --duration 10
+with readings scored before they are relayed, as the server does (loads models/*):
+    python benchmarks/ws_load_test.py --score --output results/ws.json
+or against a running server:
+    python benchmarks/ws_load_test.py --url ws://localhost:5001
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+import numpy as np
+import websockets
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ws_hub import BroadcastHub  # noqa: E402
+from common import percentiles, reading, write_results  # noqa: E402
+
+
+def device_payload(device_id, rng):
+    """Same fields as the Arduino sketch's JSON, plus the ids the hub routes on."""
+    return {'device_id': device_id, **reading(rng), 'sent_at': time.time()}
+
+
+async def run_device(url, device_id, interval, start_at, stop_at, counters):
+    rng = random.Random(device_id)
+    # Subscribed to a device id nobody uses, so the hub never queues anything for it
+    async with websockets.connect(f"{url}/?device_id={device_id}&subscribe=__none__", close_timeout=1) as ws:
+        await asyncio.sleep(max(0.0, start_at - time.time()))
+        next_send = time.time()
+        while next_send < stop_at:
+            await ws.send(json.dumps(device_payload(device_id, rng)))
+            counters['sent'] += 1
+            next_send += interval
+            await asyncio.sleep(max(0.0, next_send - time.time()))
+
+
+async def run_client(url, topics, stop_at, latencies, counters, slow=False):
+    query = f"?subscribe={','.join(topics)}" if topics else ''
+    try:
+        async with websockets.connect(f"{url}/{query}", max_queue=1 if slow else None, close_timeout=1) as ws:
+            if slow:
+                # Never read: the hub must drop for or disconnect this client, not stall
+                await asyncio.sleep(max(0.0, stop_at - time.time()))
+                return
+            while time.time() < stop_at:
+                try:
+                    message = await asyncio.wait_for(ws.recv(), timeout=max(0.01, stop_at - time.time()))
+                except asyncio.TimeoutError:
+                    break
+                data = json.loads(message)
+                latencies.append(time.time() - data['sent_at'])
+                counters['received'] += 1
+    except websockets.exceptions.ConnectionClosed:
+        counters['disconnected'] += 1
+
+
+async def run_shard(url, devices, clients, rate, start_at, stop_at):
+    """One worker process: its share of devices and clients."""
+    latencies, counters = [], {'sent': 0, 'received': 0, 'disconnected': 0}
+    client_tasks = [asyncio.ensure_future(run_client(url, topics, stop_at + 1.0, latencies, counters, slow))
+                    for topics, slow in clients]
+    await asyncio.gather(*[run_device(url, d, 1.0 / rate, start_at, stop_at, counters) for d in devices])
+    await asyncio.gather(*client_tasks)
+    return {'latencies': latencies, **counters}
+
+
+def shard_main(url, devices, clients, rate, start_at, stop_at, results):
+    results.put(asyncio.run(run_shard(url, devices, clients, rate, start_at, stop_at)))
+
+
+def plan_clients(args, devices):
+    """(topics, slow) for every client: topics None means every device."""
+    rng = random.Random(0)
+    n_slow = int(args.clients * args.slow_fraction)
+    plan = []
+    for i in range(args.clients):
+        topics = None if rng.random() < args.all_fraction else rng.sample(devices, min(args.topics_per_client, len(devices)))
+        plan.append((topics, i < n_slow))
+    return plan
+
+
+async def main(args):
+    server = None
+    hub = None
+    url = args.url
+    if url is None:
+        hub = BroadcastHub(queue_size=args.queue_size, send_timeout=args.send_timeout)
+        if args.score:
+            from health_ai import HealthAIPredictor
+            from stream_scoring import StreamScorer
+            hub.pipeline = StreamScorer(hub, HealthAIPredictor(compiled_rf=True, numpy_nn=True), tick_ms=args.tick_ms)
+        server = await websockets.serve(hub.handle, '127.0.0.1', 0, max_queue=None)
+        port = next(iter(server.sockets)).getsockname()[1]
+        url = f"ws://127.0.0.1:{port}"
+
+    devices = [f"device-{i}" for i in range(args.devices)]
+    clients = plan_clients(args, devices)
+    start_at = time.time() + args.warmup  # Clients connect during warmup, devices send afterwards
+    stop_at = start_at + args.duration
+
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Queue()
+    workers = [ctx.Process(target=shard_main, args=(url, devices[i::args.processes], clients[i::args.processes],
+                                                    args.rate, start_at, stop_at, results))
+               for i in range(args.processes)]
+    for worker in workers:
+        worker.start()
+
+    loop = asyncio.get_running_loop()
+    shards = [await loop.run_in_executor(None, results.get) for _ in workers]
+    for worker in workers:
+        worker.join()
+
+    latencies_ms = np.array([latency for shard in shards for latency in shard['latencies']]) * 1000.0
+    sent = sum(shard['sent'] for shard in shards)
+    received = sum(shard['received'] for shard in shards)
+    report = {
+        'devices': args.devices,
+        'clients': args.clients,
+        'slow_clients': sum(slow for _, slow in clients),
+        'duration_s': args.duration,
+        'messages_sent': sent,
+        'messages_received': received,
+        'readings_per_s': round(sent / args.duration, 1),
+        'deliveries_per_s': round(received / args.duration, 1),
+        'clients_disconnected': sum(shard['disconnected'] for shard in shards),
+        'scored': bool(args.score and hub is not None),
+        'latency_ms': percentiles(latencies_ms),
+    }
+    if hub is not None:
+        report['hub'] = hub.stats()
+        if hub.pipeline is not None:
+            report['scoring'] = hub.pipeline.stats()
+        server.close()
+        await server.wait_closed()
+    print(json.dumps(report, indent=2))
+    write_results(args.output, 'ws_load_test', report)
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help="WebSocket server to test, e.g. ws://localhost:5001 (default: in-process hub)")
+    parser.add_argument('--devices', type=int, default=20)
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument('--rate', type=float, default=5.0, help="Readings per second per device")
+    parser.add_argument('--duration', type=float, default=5.0, help="Seconds devices keep sending")
+    parser.add_argument('--warmup', type=float, default=3.0, help="Seconds allowed for clients to connect")
+    parser.add_argument('--processes', type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                        help="Load generator processes")
+    parser.add_argument('--topics-per-client', type=int, default=3)
+    parser.add_argument('--all-fraction', type=float, default=0.1, help="Share of clients subscribed to every device")
+    parser.add_argument('--slow-fraction', type=float, default=0.05, help="Share of clients that never read")
+    parser.add_argument('--queue-size', type=int, default=256)
+    parser.add_argument('--send-timeout', type=float, default=2.0)
+    parser.add_argument('--score', action='store_true', help="Score readings before relaying them (in-process hub only)")
+    parser.add_argument('--tick-ms', type=float, default=20.0, help="Stream scoring tick with --score")
+    parser.add_argument('--output', help="Write the report to this JSON file")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,183 @@
+"""
+Local message broker linking the WebSocket hubs of several worker processes.
+
+With more than one worker, a device and the dashboards watching it may be connected to
+different processes. Every hub connects to this broker over a Unix socket and forwards the
+readings its own devices publish; the broker relays each frame to every other hub, which
+delivers it to its local subscribers.
+
+The broker also keeps the reading history (timeseries.py) of every device on the host, so
+it is held once instead of once per worker: it records each relayed reading, and workers
+send it their /history queries.
+
+A frame is a 4-byte topic length, a 4-byte message length (both big-endian), the UTF-8
+topic and the already serialized message. Topics starting with a NUL character are control
+frames between the hubs and the broker, never relayed.
+"""
+import asyncio
+import concurrent.futures
+import itertools
+import json
+import logging
+import os
+import struct
+
+from async_logging import configure_logging
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct('!II')
+# Bytes buffered for a peer that is not reading before frames to it are dropped
+MAX_BUFFERED = 8 * 1024 * 1024
+CONTROL_PREFIX = '\0'
+HISTORY_QUERY = CONTROL_PREFIX + 'history'  # {"id", and TimeSeriesStore.query() arguments}
+HISTORY_REPLY = CONTROL_PREFIX + 'history-reply'  # {"id", "result"}, sent back to the asking peer only
+
+
+def encode_frame(topic, message):
+    topic_bytes = topic.encode('utf-8')
+    message_bytes = message.encode('utf-8')
+    return _HEADER.pack(len(topic_bytes), len(message_bytes)) + topic_bytes + message_bytes
+
+
+async def read_frame(reader):
+    """Returns (topic, message); raises asyncio.IncompleteReadError once the peer is gone."""
+    topic_length, message_length = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    payload = await reader.readexactly(topic_length + message_length)
+    return payload[:topic_length].decode('utf-8'), payload[topic_length:].decode('utf-8')
+
+
+# --- Broker ---
+class LocalBroker:
+    """Relays every frame received from one peer to all the other peers, recording readings in `store`."""
+
+    def __init__(self, path, store=None):
+        self.path = path
+        self.store = store  # timeseries.TimeSeriesStore, None when history is disabled
+        self.peers = set()
+        self.frames_relayed = 0
+
+    async def serve(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # Left over from a previous run
+        server = await asyncio.start_unix_server(self._handle_peer, path=self.path)
+        logger.info("Broker listening on %s", self.path)
+        async with server:
+            await server.serve_forever()
+
+    async def _handle_peer(self, reader, writer):
+        self.peers.add(writer)
+        try:
+            while True:
+                topic, message = await read_frame(reader)
+                if topic == HISTORY_QUERY:
+                    asyncio.ensure_future(self._answer_history(writer, message))
+                    continue
+                frame = encode_frame(topic, message)
+                for peer in list(self.peers):
+                    if peer is not writer and peer.transport.get_write_buffer_size() < MAX_BUFFERED:
+                        peer.write(frame)
+                self.frames_relayed += 1
+                if self.store is not None:
+                    self.store.record(topic, json.loads(message))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.peers.discard(writer)
+            writer.close()
+
+    async def _answer_history(self, writer, message):
+        query = json.loads(message)
+        query_id = query.pop('id')
+        result = None
+        if self.store is not None:
+            # Off the event loop: reading and downsampling a long history must not hold up relaying
+            result = await asyncio.get_running_loop().run_in_executor(None, lambda: self.store.query(**query))
+        if not writer.is_closing():
+            writer.write(encode_frame(HISTORY_REPLY, json.dumps({'id': query_id, 'result': result})))
+
+
+def run_broker(path, history=None):
+    """Entry point for a dedicated broker process; `history` holds TimeSeriesStore options, None disables it."""
+    configure_logging()
+    store = None
+    if history is not None:
+        from timeseries import TimeSeriesStore
+        store = TimeSeriesStore(**history)
+    try:
+        asyncio.run(LocalBroker(path, store).serve())
+    except KeyboardInterrupt:
+        pass
+
+
+# --- Hub side ---
+class BrokerLink:
+    """
+    Connects a BroadcastHub to the broker: readings published by the hub's own devices are
+    forwarded, readings from other workers are delivered to local subscribers only.
+    """
+
+    def __init__(self, hub, path, retry_delay=1.0, history=False):
+        # history: the broker keeps the reading history, ask it for /history
+        self.hub = hub
+        self.path = path
+        self.retry_delay = retry_delay
+        self.history = history
+        self._writer = None
+        self._task = None
+        self._loop = None
+        self._ids = itertools.count()
+        self._pending = {}  # Query id -> concurrent.futures.Future of its reply
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._task = asyncio.ensure_future(self._run())
+        return self
+
+    def _send(self, topic, message):
+        writer = self._writer
+        if writer is not None and writer.transport.get_write_buffer_size() < MAX_BUFFERED:
+            writer.write(encode_frame(topic, message))
+
+    def forward(self, topic, message):
+        """Sends a locally published message to the other workers; dropped while disconnected."""
+        if not topic.startswith(CONTROL_PREFIX):  # Device ids come from clients
+            self._send(topic, message)
+
+    def query_history(self, timeout=5.0, **query):
+        """
+        The broker's TimeSeriesStore.query(**query) result; called from HTTP threads. Raises
+        TimeoutError when the broker does not answer, e.g. while disconnected.
+        """
+        future = concurrent.futures.Future()
+        query_id = next(self._ids)
+        self._pending[query_id] = future
+        try:
+            self._loop.call_soon_threadsafe(self._send, HISTORY_QUERY, json.dumps({'id': query_id, **query}))
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            raise TimeoutError("The broker did not answer the history query") from None
+        finally:
+            self._pending.pop(query_id, None)
+
+    async def _run(self):
+        while True:
+            try:
+                reader, self._writer = await asyncio.open_unix_connection(self.path)
+                logger.info("Connected to broker at %s", self.path)
+                while True:
+                    topic, message = await read_frame(reader)
+                    if topic == HISTORY_REPLY:
+                        reply = json.loads(message)
+                        future = self._pending.get(reply['id'])
+                        if future is not None and not future.done():
+                            future.set_result(reply['result'])
+                        continue
+                    self.hub.publish_remote(topic, message)
+            except (OSError, asyncio.IncompleteReadError) as e:
+                logger.warning("Broker connection unavailable (%s), retrying in %ss", e, self.retry_delay)
+            finally:
+                if self._writer is not None:
+                    self._writer.close()
+                    self._writer = None
+            await asyncio.sleep(self.retry_delay)
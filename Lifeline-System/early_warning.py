@@ -0,0 +1,292 @@
+"""
+Incremental early-warning rules evaluated over each patient's stream of readings.
+
+The condition rules in health_ai judge every reading on its own, so a single noisy sample
+raises an alert. The rules here keep per-patient state instead:
+
+- sustained rules fire once a vital has stayed beyond a threshold for a minimum duration,
+  e.g. spo2 < 92 for 30 s. The state is the time the condition started holding.
+- trend rules fire when a vital's slope passes a threshold. The slope is an exponentially
+  weighted least-squares fit whose sums are decayed and shifted on every sample, so it
+  needs no history.
+
+Both cost O(1) per sample whatever the number of patients or the window lengths. State is
+kept as one NumPy array per quantity with a row per patient, so a batch of readings from
+different patients is evaluated in a few vectorized operations.
+
+A gap longer than max_gap between two readings of a patient resets that patient's state:
+a condition is never considered sustained across missing data. So does a reading older than
+the patient's previous one, which would otherwise grow the decayed trend sums instead of
+shrinking them. The same rule frees the state
+of patients that stopped sending, so it never grows with every id a client ever sent; beyond
+max_patients, the least recently updated patient is forgotten to make room.
+"""
+import collections
+import threading
+
+import numpy as np
+
+from preprocessing import INPUT_KEYS
+
+# Defaults to be tuned with clinicians; durations and windows are in seconds
+SUSTAINED_RULES = [
+    {'condition': 'Sustained Hypoxia', 'key': 'spo2', 'op': '<', 'threshold': 92, 'duration': 30,
+     'probability': 0.9, 'severity': 'critical', 'icon': 'fas fa-lungs'},
+    {'condition': 'Sustained Tachycardia', 'key': 'heart_rate', 'op': '>=', 'threshold': 100, 'duration': 60,
+     'probability': 0.8, 'severity': 'high', 'icon': 'fas fa-heartbeat'},
+    {'condition': 'Sustained Bradycardia', 'key': 'heart_rate', 'op': '<=', 'threshold': 50, 'duration': 60,
+     'probability': 0.8, 'severity': 'high', 'icon': 'fas fa-heartbeat'},
+    {'condition': 'Sustained Hypotension', 'key': 'blood_pressure_systolic', 'op': '<', 'threshold': 90, 'duration': 60,
+     'probability': 0.8, 'severity': 'high', 'icon': 'fas fa-tint'},
+    {'condition': 'Sustained Hypertension', 'key': 'blood_pressure_systolic', 'op': '>=', 'threshold': 140, 'duration': 300,
+     'probability': 0.7, 'severity': 'medium', 'icon': 'fas fa-heart'},
+    {'condition': 'Sustained Fever', 'key': 'temperature', 'op': '>=', 'threshold': 38, 'duration': 300,
+     'probability': 0.7, 'severity': 'medium', 'icon': 'fas fa-thermometer-half'},
+]
+TREND_RULES = [
+    {'condition': 'Falling SpO2', 'key': 'spo2', 'op': '<', 'slope_per_min': -2.0, 'window': 60,
+     'probability': 0.8, 'severity': 'high', 'icon': 'fas fa-lungs'},
+    {'condition': 'Rising Heart Rate', 'key': 'heart_rate', 'op': '>', 'slope_per_min': 10.0, 'window': 120,
+     'probability': 0.6, 'severity': 'medium', 'icon': 'fas fa-heartbeat'},
+    {'condition': 'Falling Blood Pressure', 'key': 'blood_pressure_systolic', 'op': '<', 'slope_per_min': -10.0, 'window': 120,
+     'probability': 0.7, 'severity': 'high', 'icon': 'fas fa-tint'},
+    {'condition': 'Rising Temperature', 'key': 'temperature', 'op': '>', 'slope_per_min': 0.05, 'window': 600,
+     'probability': 0.6, 'severity': 'medium', 'icon': 'fas fa-thermometer-quarter'},
+]
+
+OPS = {'<': np.less, '<=': np.less_equal, '>': np.greater, '>=': np.greater_equal}
+
+
+def _op_groups(rules):
+    """[(ufunc, rule indices)] so each comparison operator is applied once per batch."""
+    return [(OPS[op], np.array([i for i, rule in enumerate(rules) if rule['op'] == op]))
+            for op in sorted({rule['op'] for rule in rules})]
+
+
+def _compare(groups, left, right, n_rules):
+    result = np.zeros((len(left), n_rules), dtype=bool)
+    for ufunc, idx in groups:
+        result[:, idx] = ufunc(left[:, idx], right[idx])
+    return result
+
+
+# --- Early Warning Evaluator ---
+class EarlyWarningEvaluator:
+    """Per-patient sustained-duration and trend rules, updated incrementally with each reading."""
+
+    COUNTERS = ('samples', 'alerts_raised', 'patients_evicted')  # stats() keys that only go up
+
+    def __init__(self, keys=None, sustained_rules=None, trend_rules=None, max_gap=15.0, min_trend_samples=5,
+                 initial_capacity=1024, max_patients=100000):
+        # keys: payload key of each column of the vitals matrices passed to update_batch
+        # max_gap: seconds without a reading after which a patient's state is reset, and freed
+        # min_trend_samples: readings needed since the last reset before trend rules can fire
+        # max_patients: patients kept at most; a new one replaces the least recently updated
+        self.keys = list(keys or INPUT_KEYS.values())
+        self.sustained_rules = list(SUSTAINED_RULES if sustained_rules is None else sustained_rules)
+        self.trend_rules = list(TREND_RULES if trend_rules is None else trend_rules)
+        self.max_gap = max_gap
+        self.min_trend_samples = min_trend_samples
+        self.max_patients = max_patients
+
+        # --- Compiled rule tables ---
+        sustained, trend = self.sustained_rules, self.trend_rules
+        self._s_columns = np.array([self.keys.index(rule['key']) for rule in sustained], dtype=np.intp)
+        self._s_threshold = np.array([rule['threshold'] for rule in sustained], dtype=np.float64)
+        self._s_duration = np.array([rule['duration'] for rule in sustained], dtype=np.float64)
+        self._s_groups = _op_groups(sustained)
+        self._t_columns = np.array([self.keys.index(rule['key']) for rule in trend], dtype=np.intp)
+        self._t_threshold = np.array([rule['slope_per_min'] / 60.0 for rule in trend], dtype=np.float64)
+        self._t_window = np.array([rule['window'] for rule in trend], dtype=np.float64)
+        self._t_groups = _op_groups(trend)
+
+        # --- Per-patient state, one row per patient ---
+        self._slots = collections.OrderedDict()  # Patient id -> row, least recently updated first
+        self._free = []  # Rows of patients that were freed
+        self._used = 0  # Rows handed out so far
+        self._capacity = 0
+        self._state = {}
+        self._grow(initial_capacity)
+        self._lock = threading.Lock()
+        self._next_sweep = -np.inf
+        self.samples = 0
+        self.alerts_raised = 0  # Rules that went from quiet to firing
+        self.patients_evicted = 0
+
+    def _grow(self, capacity):
+        n_sustained, n_trend = len(self.sustained_rules), len(self.trend_rules)
+        shapes = {
+            'last_time': ((), np.nan),
+            'since': ((n_sustained,), np.nan),  # When each sustained condition started holding
+            's_active': ((n_sustained,), False),
+            # Exponentially weighted sums of weight, x, x^2, v and x*v, with x = time relative to the last reading
+            'sw': ((n_trend,), 0.0), 'sx': ((n_trend,), 0.0), 'sxx': ((n_trend,), 0.0),
+            'sv': ((n_trend,), 0.0), 'sxv': ((n_trend,), 0.0),
+            'count': ((n_trend,), 0),
+            't_active': ((n_trend,), False),
+        }
+        for name, (shape, fill) in shapes.items():
+            grown = np.full((capacity,) + shape, fill)
+            if name in self._state:
+                grown[:self._capacity] = self._state[name]
+            self._state[name] = grown
+        self._capacity = capacity
+
+    def _release(self, patient_id):
+        slot = self._slots.pop(patient_id)
+        state = self._state
+        state['last_time'][slot] = np.nan  # The next reading in this row starts over, as after a gap
+        state['s_active'][slot] = False
+        state['t_active'][slot] = False
+        self._free.append(slot)
+
+    def _slot(self, patient_id, batch_ids):
+        """The patient's row, marked most recently used; `batch_ids` are the patients already placed in this batch."""
+        slot = self._slots.get(patient_id)
+        if slot is not None:
+            self._slots.move_to_end(patient_id)
+            return slot
+        while len(self._slots) >= self.max_patients:
+            oldest = next(iter(self._slots))
+            if oldest in batch_ids:  # Its row is in use by this batch, exceed the cap until a later one
+                break
+            self._release(oldest)
+            self.patients_evicted += 1
+        if self._free:
+            slot = self._free.pop()
+        else:
+            slot = self._used
+            self._used += 1
+            if slot == self._capacity:
+                self._grow(self._capacity * 2)
+        self._slots[patient_id] = slot
+        return slot
+
+    def _evict_idle(self, now):
+        """Frees the rows of patients whose state the next reading would reset anyway."""
+        last_time = self._state['last_time']
+        while self._slots:
+            patient_id, slot = next(iter(self._slots.items()))
+            if last_time[slot] >= now - self.max_gap:
+                break
+            self._release(patient_id)
+            self.patients_evicted += 1
+
+    def update_batch(self, patient_ids, timestamps, vitals):
+        """
+        Feeds one reading per row of `vitals` (columns in self.keys order, NaN where missing)
+        and returns the alerts firing after each reading, as lists of dicts.
+        Several readings of the same patient are applied in order.
+        """
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        vitals = np.asarray(vitals, dtype=np.float64)
+        with self._lock:
+            if len(timestamps) and timestamps.max() >= self._next_sweep:
+                self._evict_idle(timestamps.max())
+                self._next_sweep = timestamps.max() + self.max_gap
+            slots = np.empty(len(patient_ids), dtype=np.intp)
+            # Rows of one patient go into successive rounds; the rows within a round are independent
+            rounds = np.empty(len(patient_ids), dtype=np.intp)
+            seen = {}
+            for i, patient_id in enumerate(patient_ids):
+                slots[i] = self._slot(patient_id, seen)
+                rounds[i] = seen.get(patient_id, 0)
+                seen[patient_id] = rounds[i] + 1
+            if len(rounds) and rounds.max() > 0:
+                s_fired = np.zeros((len(slots), len(self.sustained_rules)), dtype=bool)
+                since = np.zeros((len(slots), len(self.sustained_rules)))
+                t_fired = np.zeros((len(slots), len(self.trend_rules)), dtype=bool)
+                slopes = np.zeros((len(slots), len(self.trend_rules)))
+                for r in range(rounds.max() + 1):
+                    rows = np.flatnonzero(rounds == r)
+                    s_fired[rows], since[rows], t_fired[rows], slopes[rows] = \
+                        self._update(slots[rows], timestamps[rows], vitals[rows])
+            else:
+                s_fired, since, t_fired, slopes = self._update(slots, timestamps, vitals)
+            self.samples += len(slots)
+        return self._alerts(timestamps, s_fired, since, t_fired, slopes)
+
+    def update(self, patient_id, timestamp, metrics):
+        """update_batch for a single reading given as a request payload; non-numeric vitals count as missing."""
+        row = np.full((1, len(self.keys)), np.nan)
+        for j, key in enumerate(self.keys):
+            value = metrics.get(key)
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                row[0, j] = value
+        return self.update_batch([patient_id], [timestamp], row)[0]
+
+    def _update(self, slots, t, vitals):
+        """Applies one reading to each of `slots` (all distinct) and returns which rules fire."""
+        state = self._state
+        gap = t - state['last_time'][slots]
+        reset = ~((gap >= 0) & (gap <= self.max_gap))  # Also true for a patient's first reading (NaN gap)
+
+        # --- Sustained rules ---
+        holding = _compare(self._s_groups, vitals[:, self._s_columns], self._s_threshold, len(self.sustained_rules))
+        since = np.where(reset[:, None], np.nan, state['since'][slots])
+        since = np.where(holding, np.where(np.isnan(since), t[:, None], since), np.nan)
+        s_fired = holding & (t[:, None] - since >= self._s_duration)
+        state['since'][slots] = since
+
+        # --- Trend rules: decay the sums and move x = 0 to this reading ---
+        dt = np.where(reset, 0.0, gap)[:, None]
+        decay = np.exp(-dt / self._t_window)
+        keep = ~reset[:, None]
+        sw, sx, sxx = state['sw'][slots], state['sx'][slots], state['sxx'][slots]
+        sv, sxv = state['sv'][slots], state['sxv'][slots]
+        sxx = np.where(keep, decay * (sxx - 2.0 * dt * sx + dt * dt * sw), 0.0)
+        sxv = np.where(keep, decay * (sxv - dt * sv), 0.0)
+        sx = np.where(keep, decay * (sx - dt * sw), 0.0)
+        sw = np.where(keep, decay * sw, 0.0)
+        sv = np.where(keep, decay * sv, 0.0)
+        count = np.where(keep, state['count'][slots], 0)
+
+        values = vitals[:, self._t_columns]
+        present = ~np.isnan(values)
+        sw = sw + present
+        sv = sv + np.where(present, values, 0.0)
+        count = count + present
+        with np.errstate(invalid='ignore', divide='ignore'):
+            slopes = (sw * sxv - sx * sv) / (sw * sxx - sx * sx)  # Units per second
+        t_fired = (count >= self.min_trend_samples) & np.isfinite(slopes) & \
+            _compare(self._t_groups, slopes, self._t_threshold, len(self.trend_rules))
+
+        state['sw'][slots], state['sx'][slots], state['sxx'][slots] = sw, sx, sxx
+        state['sv'][slots], state['sxv'][slots], state['count'][slots] = sv, sxv, count
+
+        # Count rules that start firing, not every reading they keep firing on
+        self.alerts_raised += int((s_fired & ~state['s_active'][slots]).sum() + (t_fired & ~state['t_active'][slots]).sum())
+        state['s_active'][slots] = s_fired
+        state['t_active'][slots] = t_fired
+        state['last_time'][slots] = t
+        return s_fired, since, t_fired, slopes
+
+    def _alerts(self, timestamps, s_fired, since, t_fired, slopes):
+        alerts = [[] for _ in range(len(timestamps))]
+        for i, r in zip(*np.nonzero(s_fired)):
+            rule = self.sustained_rules[r]
+            alerts[i].append({'condition': rule['condition'], 'probability': rule['probability'],
+                              'severity': rule['severity'], 'icon': rule['icon'],
+                              'since': float(since[i, r]), 'duration_s': float(timestamps[i] - since[i, r])})
+        for i, r in zip(*np.nonzero(t_fired)):
+            rule = self.trend_rules[r]
+            alerts[i].append({'condition': rule['condition'], 'probability': rule['probability'],
+                              'severity': rule['severity'], 'icon': rule['icon'],
+                              'slope_per_min': float(slopes[i, r] * 60.0)})
+        return alerts
+
+    def forget(self, patient_id):
+        """Resets a patient's state and frees its row."""
+        with self._lock:
+            if patient_id in self._slots:
+                self._release(patient_id)
+
+    def stats(self):
+        return {
+            'patients': len(self._slots),
+            'samples': self.samples,
+            'alerts_raised': self.alerts_raised,
+            'patients_evicted': self.patients_evicted,
+            'sustained_rules': len(self.sustained_rules),
+            'trend_rules': len(self.trend_rules),
+        }
@@ -0,0 +1,48 @@
+# gunicorn settings for `python serve.py --workers N` (or `gunicorn -c gunicorn.conf.py app:app`).
+# Every worker serves HTTP on a thread pool and runs its own WebSocket server on the shared
+# port; the workers' hubs exchange device readings through the local broker (broker.py),
+# which the master starts before forking.
+import multiprocessing
+import os
+
+from serve import default_broker_path, start_websocket_thread
+
+bind = os.environ.get('LIFELINE_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('LIFELINE_WORKERS', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('LIFELINE_HTTP_THREADS', 8))
+# Each worker loads its own predictor after forking: the micro-batcher and model loader threads do not survive a fork
+preload_app = False
+
+ws_host = os.environ.get('LIFELINE_WS_HOST', '0.0.0.0')
+ws_port = int(os.environ.get('LIFELINE_WS_PORT', 5001))
+broker_path = os.environ.get('LIFELINE_BROKER_SOCKET', default_broker_path(ws_port))
+# Reading history, kept once in the broker process rather than in every worker; same settings as app.py
+history = None if os.environ.get('LIFELINE_HISTORY', '1') == '0' else {
+    'capacity': int(os.environ.get('LIFELINE_HISTORY_CAPACITY', 3600)),
+    'spill_dir': os.environ.get('LIFELINE_HISTORY_SPILL_DIR'),
+    'max_series': int(os.environ.get('LIFELINE_HISTORY_MAX_SERIES', 10000)),
+    'idle_timeout': float(os.environ.get('LIFELINE_HISTORY_IDLE_TIMEOUT', 3600.0)),
+}
+
+_broker_process = None
+
+
+def on_starting(server):
+    global _broker_process
+    if workers > 1:
+        from broker import run_broker
+        _broker_process = multiprocessing.Process(target=run_broker, args=(broker_path, history), name='lifeline-broker', daemon=True)
+        _broker_process.start()
+
+
+def post_worker_init(worker):
+    import app
+    start_websocket_thread(app.hub, ws_host, ws_port, reuse_port=workers > 1,
+                           broker_path=broker_path if workers > 1 else None)
+
+
+def on_exit(server):
+    if _broker_process is not None:
+        _broker_process.terminate()
+        _broker_process.join(5)
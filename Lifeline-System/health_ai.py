@@ -1,198 +1,497 @@
+import logging
+import os
+import threading
+import time
 import numpy as np
-from sklearn.ensemble import RandomForestClassifier
-import numpy as np
-from sklearn.ensemble import RandomForestClassifier
 # Removed Flask imports, will be in app.py
-from tensorflow import keras
-import joblib
-import pandas as pd
-import traceback # Import traceback for detailed error logging
+# TensorFlow, sklearn/joblib and pandas are imported where they are first needed: TensorFlow
+# alone takes several seconds to import and the compiled RF path needs none of them
+
+from metrics import timed
+from preprocessing import CLIP_BOUNDS, FeaturePreprocessor, FeatureScaler, INPUT_KEYS, REQUIRED_KEYS
+from rf_engine import CompiledForest, export_forest
+from nn_engine import DenseNetwork, export_h5_model
+from prediction_cache import PredictionCache
+from rules_engine import RulesEngine
+
+logger = logging.getLogger(__name__)
+
+RF_MODEL_PATH = 'models/random_forest.pkl'
+COMPILED_RF_PATH = 'models/random_forest.npz'  # Written by train_models.py or `python rf_engine.py`
+NN_MODEL_PATH = 'models/neural_network.h5'
+NUMPY_NN_PATH = 'models/neural_network.npz'  # Written by train_models.py or `python nn_engine.py`
+SCALER_PATH = 'models/scaler.npz'  # Training feature mean/scale, written by train_models.py
+RULES_PATH = 'condition_rules.json'  # Condition table, reloaded when edited
+# Version reported for models loaded from the paths above rather than from a registry
+UNVERSIONED = 'unversioned'
+FEATURE_NAMES = ['heart_rate', 'systolic_bp', 'diastolic_bp', 'spo2', 'temperature', 'glucose'] # Define expected features
+
+
+def artifact_paths(registry=None, version=None):
+    """Model file paths of a registry version, or the fixed paths above without one."""
+    if registry is None or version is None:
+        return {'rf': RF_MODEL_PATH, 'compiled_rf': COMPILED_RF_PATH, 'nn': NN_MODEL_PATH, 'numpy_nn': NUMPY_NN_PATH,
+                'scaler': SCALER_PATH}
+    return {
+        'rf': registry.path(version, 'random_forest.pkl'),
+        'compiled_rf': registry.path(version, 'random_forest.npz'),
+        'nn': registry.path(version, 'neural_network.h5'),
+        'numpy_nn': registry.path(version, 'neural_network.npz'),
+        'scaler': registry.path(version, 'scaler.npz'),
+    }
+
+
+class ModelVersion:
+    """
+    One loaded set of models. A request uses the set that was active when it started, so
+    swapping in another version never changes the models under a request in flight.
+
+    Both models were trained on scaled features. The compiled RF and the NumPy NN take the
+    scaling folded into their thresholds / first layer and score the clipped readings as they
+    are; the sklearn and Keras models get the features scaled on the way in.
+    """
+
+    def __init__(self, version, scaler=None):
+        self.version = version
+        self.scaler = scaler  # FeatureScaler of the training features, None for models trained unscaled
+        self.rf_model = None
+        self.rf_scaler = None  # Scaling still to apply to the RF input
+        self.nn_model = None  # May be attached later by the background loader
+        self.nn_scaler = None
+        self.feature_names = FEATURE_NAMES
+        self.preprocessor = None
+
+    def set_rf_model(self, rf_model, feature_names):
+        if self.scaler is not None:
+            scaler = self.scaler.reorder(feature_names)
+            if not isinstance(rf_model, CompiledForest):
+                self.rf_scaler = scaler
+            elif not rf_model.raw_input:
+                rf_model = rf_model.fold_input_scaling(scaler)
+        self.rf_model = rf_model
+        self.feature_names = feature_names
+        self.preprocessor = FeaturePreprocessor(feature_names)
+
+    def set_nn_model(self, nn_model):
+        # The NN takes its inputs in training order, the order the scaler was saved in
+        if self.scaler is not None and isinstance(nn_model, DenseNetwork):
+            nn_model = nn_model.fold_input_scaling(self.scaler)
+        elif self.scaler is not None:
+            self.nn_scaler = self.scaler  # Set first: scoring threads check nn_model, then nn_scaler
+        self.nn_model = nn_model
+
 
 # --- Health AI Predictor Class ---
 class HealthAIPredictor:
-    def __init__(self):
-        self.rf_model = None
-        self.nn_model = None
-        self.feature_names = ['heart_rate', 'systolic_bp', 'diastolic_bp', 'spo2', 'temperature', 'glucose'] # Define expected features
+    def __init__(self, compiled_rf=False, numpy_nn=False, background_nn=False,
+                 cache_size=0, cache_ttl=60.0, cache_quantization=None, registry=None, mmap_models=False):
+        # compiled_rf: score the Random Forest with rf_engine.CompiledForest instead of sklearn
+        # numpy_nn: run the neural network with nn_engine.DenseNetwork instead of Keras
+        # background_nn: return once the RF is loaded and let the NN join the ensemble when ready
+        # cache_size: memoize up to this many model probabilities (prediction_cache.py), 0 disables
+        # registry: model_registry.ModelRegistry to serve its active version from, instead of the fixed paths
+        # mmap_models: map the compiled RF / NumPy NN arrays read-only so worker processes share them (mapped_arrays.py)
+        self.compiled_rf = compiled_rf
+        self.numpy_nn = numpy_nn
+        self.background_nn = background_nn
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.cache_quantization = cache_quantization
+        self.registry = registry
+        self.mmap_models = mmap_models
+        self.cache = None
+        self.models = None  # The active ModelVersion
+        self.previous_models = None  # The version it replaced, kept for an instant rollback
+        self.rules = None
+        self.model_status = {'random_forest': 'not_loaded', 'neural_network': 'not_loaded'}
+        self.swap_status = {'version': None, 'state': 'idle', 'error': None}
+        self.nn_loaded = threading.Event()  # Set once NN loading has finished, successfully or not
+        self._swap_lock = threading.Lock()
         self.load_models()
 
+    # The active version's models, for callers that do not hold a ModelVersion themselves
+    @property
+    def rf_model(self):
+        return self.models.rf_model if self.models is not None else None
+
+    @property
+    def nn_model(self):
+        return self.models.nn_model if self.models is not None else None
+
+    @property
+    def feature_names(self):
+        return self.models.feature_names if self.models is not None else FEATURE_NAMES
+
+    @property
+    def preprocessor(self):
+        return self.models.preprocessor if self.models is not None else None
+
+    @property
+    def version(self):
+        return self.models.version if self.models is not None else None
+
     def load_models(self):
+        nn_thread = None
+        version = self.registry.active_version() if self.registry is not None else None
+        paths = artifact_paths(self.registry, version)
+        models = ModelVersion(version or UNVERSIONED)
         try:
             # Load pre-trained models if they exist
-            print("Loading models...")
-            self.rf_model = joblib.load('models/random_forest.pkl')
-            try:
-                self.nn_model = keras.models.load_model('models/neural_network.h5')
-                print("Neural Network Model loaded successfully.")
-
-            except ValueError as e:
-                print(f"Error loading Neural Network model: {e}")
-                print("Using Random Forest model as fallback.")
-                self.nn_model = None # Ensure nn_model is None if loading fails
-
-            print("Random Forest Model loaded successfully.")
-            # Check if the loaded RF model has feature names (important for consistency)
-            if hasattr(self.rf_model, 'feature_names_in_'):
-                self.feature_names = self.rf_model.feature_names_in_
-                print(f"Using feature names from loaded RF model: {self.feature_names}")
-            else:
-                 print(f"Warning: Loaded RF model missing feature names. Using default: {self.feature_names}")
+            logger.info("Loading models (version %s)...", models.version)
+            if version is not None:
+                self.registry.verify(version)
+            models.scaler = self._read_scaler(paths)
+            if self.background_nn:
+                # Start the slow TensorFlow import first so it overlaps with the RF load
+                nn_thread = threading.Thread(target=self.load_nn_model, args=(models, paths), name='nn-model-loader', daemon=True)
+                self.model_status['neural_network'] = 'loading'
+                nn_thread.start()
+
+            self.model_status['random_forest'] = 'loading'
+            rf_model = self.load_rf_model(paths)
+            models.set_rf_model(rf_model, self._rf_feature_names(rf_model))
+            self.model_status['random_forest'] = 'loaded'
+            logger.info("Random Forest Model loaded successfully.")
+
+            if self.cache is not None:
+                self.cache.clear()  # Nothing scored by the previously loaded models survives a reload
+            elif self.cache_size:
+                self.cache = PredictionCache(models.feature_names, max_size=self.cache_size, ttl=self.cache_ttl,
+                                             quantization=self.cache_quantization)
+            # The rules read raw readings in the same column order validate_batch produces
+            self.rules = RulesEngine(RULES_PATH, [INPUT_KEYS[name] for name in models.feature_names])
+            self.models = models
+
+            if nn_thread is None:
+                self.load_nn_model(models, paths)
 
         except FileNotFoundError:
-            print("Model files not found. Please ensure 'models/random_forest.pkl' and 'models/neural_network.h5' exist.")
-            print("You may need to run 'train_models.py' first.")
+            if models.rf_model is None:
+                self.model_status['random_forest'] = 'failed'
+            logger.error("Model files not found. Please ensure 'models/random_forest.pkl', 'models/neural_network.h5' and "
+                         "'condition_rules.json' exist. You may need to run 'train_models.py' first.")
             # You might want to raise an error or exit if models are essential
             raise SystemExit("Essential model files missing.")
         except Exception as e:
-            print(f"An unexpected error occurred loading models: {e}")
-            print(traceback.format_exc())
+            if models.rf_model is None:
+                self.model_status['random_forest'] = 'failed'
+            logger.exception("An unexpected error occurred loading models: %s", e)
             raise SystemExit("Failed to load models due to an unexpected error.")
 
+    def _rf_feature_names(self, rf_model):
+        # Check if the loaded RF model has feature names (important for consistency)
+        if hasattr(rf_model, 'feature_names_in_'):
+            logger.info("Using feature names from loaded RF model: %s", rf_model.feature_names_in_)
+            return rf_model.feature_names_in_
+        elif getattr(rf_model, 'feature_names', None) is not None:
+            logger.info("Using feature names from compiled RF model: %s", rf_model.feature_names)
+            return rf_model.feature_names
+        else:
+             logger.warning("Loaded RF model missing feature names. Using default: %s", FEATURE_NAMES)
+             return FEATURE_NAMES
+
+    def load_rf_model(self, paths=None):
+        """
+        Loads the Random Forest. With compiled_rf the flat array export is preferred, which
+        avoids importing sklearn; if it is missing the pickled model is compiled in memory.
+        """
+        paths = paths or artifact_paths()
+        if self.compiled_rf and os.path.exists(paths['compiled_rf']):
+            logger.info("Loading compiled Random Forest from %s", paths['compiled_rf'])
+            return CompiledForest.load(paths['compiled_rf'], mmap=self.mmap_models)
+
+        import joblib
+        if not self.compiled_rf:
+            return joblib.load(paths['rf'])
+
+        logger.info("%s not found, compiling %s in memory.", paths['compiled_rf'], paths['rf'])
+        return export_forest(joblib.load(paths['rf']))
+
+    def _read_scaler(self, paths):
+        if not os.path.exists(paths['scaler']):
+            logger.warning("%s not found, the models will receive unscaled features.", paths['scaler'])
+            return None
+        return FeatureScaler.load(paths['scaler'])
+
+    def _read_nn_model(self, paths):
+        if self.numpy_nn and os.path.exists(paths['numpy_nn']):
+            return DenseNetwork.load(paths['numpy_nn'], mmap=self.mmap_models)
+        elif self.numpy_nn:
+            logger.info("%s not found, reading weights from %s.", paths['numpy_nn'], paths['nn'])
+            return export_h5_model(paths['nn'])
+        from tensorflow import keras
+        return keras.models.load_model(paths['nn'])
+
+    def load_nn_model(self, models, paths=None):
+        """
+        Loads the neural network into `models`: the NumPy kernel with numpy_nn, otherwise the
+        Keras model, importing TensorFlow on first use. Runs on a background thread when
+        background_nn is set; the RF keeps serving on its own until this finishes and on failure.
+        """
+        try:
+            models.set_nn_model(self._read_nn_model(paths or artifact_paths()))
+            self.model_status['neural_network'] = 'loaded'
+            if self.cache is not None:
+                self.cache.clear()  # RF-only entries are under another namespace and never read again
+            logger.info("Neural Network Model loaded successfully.")
+
+        except Exception as e:
+            self.model_status['neural_network'] = 'failed'
+            # Nothing can catch errors on the loader thread, so it always falls back to the RF
+            if not self.background_nn and not isinstance(e, ValueError):
+                raise
+            logger.error("Error loading Neural Network model: %s. Using Random Forest model as fallback.", e)
+        finally:
+            self.nn_loaded.set()
+
+    # --- Version swaps ---
+    def warm_up(self, models, rows=64):
+        """Scores synthetic readings so the first real requests do not pay for lazy initialization."""
+        rng = np.random.default_rng(0)
+        bounds = np.array([CLIP_BOUNDS[name] for name in models.feature_names], dtype=np.float64)
+        raw = rng.uniform(bounds[:, 0], bounds[:, 1], size=(rows, len(bounds)))
+        for n in (1, rows):
+            self._model_probabilities(models, models.preprocessor.transform_batch(raw[:n]))
+
+    def _load_version(self, version):
+        """Loads every model of a registry version into a new ModelVersion; raises if any of it fails."""
+        self.registry.verify(version)
+        paths = artifact_paths(self.registry, version)
+        models = ModelVersion(version, self._read_scaler(paths))
+        rf_model = self.load_rf_model(paths)
+        feature_names = self._rf_feature_names(rf_model)
+        # Everything downstream (validation, rules, alerts) is laid out for the served features
+        if list(feature_names) != list(self.feature_names):
+            raise ValueError(f"Model version {version} expects features {list(feature_names)}, "
+                             f"the served version uses {list(self.feature_names)}")
+        models.set_rf_model(rf_model, feature_names)
+        models.set_nn_model(self._read_nn_model(paths))
+        return models
+
+    def swap_to(self, version):
+        """
+        Loads, warms up and activates a registry version; returns True once it serves.
+        Requests already running finish on the version they started with.
+        """
+        with self._swap_lock:
+            if self.version == version:
+                return True
+            self.swap_status = {'version': version, 'state': 'loading', 'error': None}
+            try:
+                if self.previous_models is not None and self.previous_models.version == version:
+                    models = self.previous_models  # Rolling back to the version just replaced: already loaded and warm
+                else:
+                    models = self._load_version(version)
+                    self.swap_status['state'] = 'warming'
+                    self.warm_up(models)
+            except Exception as e:
+                self.swap_status = {'version': version, 'state': 'failed', 'error': str(e)}
+                logger.exception("Error loading model version %s, keeping version %s: %s", version, self.version, e)
+                return False
+            # A single reference swap: new requests see the new version, running ones keep theirs
+            self.previous_models, self.models = self.models, models
+            self.model_status = {'random_forest': 'loaded', 'neural_network': 'loaded'}
+            self.swap_status['state'] = 'active'
+            logger.info("Now serving model version %s", version)
+            return True
+
+    def load_version(self, version):
+        """swap_to() on a background thread, so the caller does not wait for loading and warm-up."""
+        thread = threading.Thread(target=self.swap_to, args=(version,), name='model-swap', daemon=True)
+        thread.start()
+        return thread
+
+    def watch_registry(self, interval=2.0):
+        """
+        Follows the registry's active version from a daemon thread, so every worker process
+        picks up activations and rollbacks made from any of them or from the CLI.
+        """
+        def watch():
+            failed = None  # Not retried until another version is activated
+            while True:
+                time.sleep(interval)
+                try:
+                    version = self.registry.active_version()
+                except (OSError, ValueError) as e:
+                    logger.warning("Error reading the model registry: %s", e)
+                    continue
+                if version is not None and version != self.version and version != failed:
+                    failed = None if self.swap_to(version) else version
+
+        thread = threading.Thread(target=watch, name='model-registry-watch', daemon=True)
+        thread.start()
+        return thread
+
+    def is_ready(self):
+        """True once the predictor can serve requests, which only needs the RF."""
+        return self.rf_model is not None and self.preprocessor is not None and self.rules is not None
+
     def preprocess_data(self, metrics):
         """
-        Prepares the input metrics dictionary into a Pandas DataFrame suitable for the models.
+        Prepares the input metrics dictionary into a (1, n_features) NumPy array suitable for the models.
         Ensures the columns match the order expected by the trained models.
         """
         try:
-            # Use the keys sent by the frontend
-            data = {
-                'heart_rate': metrics.get('heart_rate'),
-                'systolic_bp': metrics.get('blood_pressure_systolic'),
-                'diastolic_bp': metrics.get('blood_pressure_diastolic'),
-                'spo2': metrics.get('spo2'),
-                'temperature': metrics.get('temperature'),
-                'glucose': metrics.get('glucose', 100) # Provide a default if not sent
-            }
-            # Create DataFrame with the specific column order
-            features = pd.DataFrame([data], columns=self.feature_names)
-
-            # Basic validation/conversion (could be more robust)
-            features = features.astype(float) # Ensure numeric types
-            # Replace NaN values with 0
-            features = features.fillna(0)
-            # Ensure values are within a reasonable range
-            features['heart_rate'] = features['heart_rate'].clip(0, 200)
-            features['systolic_bp'] = features['systolic_bp'].clip(0, 300)
-            features['diastolic_bp'] = features['diastolic_bp'].clip(0, 200)
-            features['spo2'] = features['spo2'].clip(0, 100)
-            features['temperature'] = features['temperature'].clip(30, 45)
-            features['glucose'] = features['glucose'].clip(0, 500)
-
-            if features.isnull().values.any():
-                 print(f"Warning: Missing values detected in input: {data}")
-                 # Handle missing values if necessary (e.g., imputation)
-                 # For now, we'll let the model handle it or potentially error
-            return features
+            return self.preprocessor.transform(metrics)
 
         except Exception as e:
-            print(f"Error during preprocessing: {e}")
-            print(f"Input metrics: {metrics}")
-            print(traceback.format_exc())
+            logger.exception("Error during preprocessing: %s. Input metrics: %s", e, metrics)
             return None
 
-    def predict_health(self, metrics):
+    def _rf_input(self, models, features):
+        """
+        Wraps a feature matrix in a DataFrame when the RF was fitted with column names,
+        the only model that checks them. Everything else works on the NumPy matrix directly.
+        """
+        if hasattr(models.rf_model, 'feature_names_in_'):
+            import pandas as pd
+            return pd.DataFrame(features, columns=models.feature_names)
+        return features
+
+    def _model_probabilities(self, models, features, nn_model=None):
+        """
+        Probability of an adverse condition (class 1) for every row of the feature matrix.
+        `nn_model` is the models.nn_model the caller read, by default read here.
+        """
+        # --- Get predictions (example logic, adapt to your models) ---
+        # This part needs to be adapted based on what your models actually predict.
+        # Assuming models predict probability of *some* adverse condition.
+        # You'll need to map these probabilities to specific conditions.
+
+        if nn_model is None:
+            nn_model = models.nn_model  # May be attached by the background loader at any time
+        rf_features = features if models.rf_scaler is None else models.rf_scaler.transform(features)
+        with timed('rf'):
+            rf_prob = models.rf_model.predict_proba(self._rf_input(models, rf_features))[:, 1] # Probability of class 1 (adverse)
+        if nn_model is None:
+            return rf_prob
+
+        with timed('nn'):
+            nn_features = features if models.nn_scaler is None else models.nn_scaler.transform(features)
+            nn_prob = nn_model.predict(nn_features, verbose=0)[:, 0]      # Probability from NN
+
+        # Simple Averaging Ensemble
+        return (rf_prob + nn_prob) / 2
+
+    def score_features(self, features, models=None):
+        """
+        Ensemble probability for every row of the feature matrix, from `models` or the active
+        version. With a prediction cache, only rows whose quantized features have not been
+        seen recently by the same version reach the models.
+        """
+        models = models or self.models
+        cache = self.cache
+        if cache is None:
+            return self._model_probabilities(models, features)
+
+        # Read once: the background loader may attach the NN while this runs, and an RF-only
+        # probability must never be cached where requests scored by the ensemble look
+        nn_model = models.nn_model
+        keys = cache.keys(features, namespace=(models.version, nn_model is not None))
+        cached = cache.get_many(keys)
+        missing = [i for i, probability in enumerate(cached) if probability is None]
+        if not missing:
+            return np.array(cached, dtype=np.float64)
+
+        probabilities = np.empty(len(keys), dtype=np.float64)
+        fresh = self._model_probabilities(models, features[missing], nn_model)
+        probabilities[missing] = fresh
+        hit = [i for i in range(len(keys)) if cached[i] is not None]
+        probabilities[hit] = [cached[i] for i in hit]
+        # Duplicate keys within one batch are all scored, the last one is kept
+        cache.put_many([keys[i] for i in missing], fresh.tolist())
+        return probabilities
+
+    def predict_health(self, metrics, models=None):
         """
         Makes health predictions based on the input metrics using loaded models.
         Returns a list of prediction dictionaries as expected by the frontend.
+        `models` pins the ModelVersion to use, by default the active one.
         """
         predictions_list = []
+        models = models or self.models
         try:
-            features = self.preprocess_data(metrics)
+            with timed('preprocess'):
+                features = self.preprocess_data(metrics)
             if features is None:
                  return [{'condition': 'Processing Error', 'probability': 0, 'severity': 'unknown'}]
 
             # Ensure models are loaded
-            if self.rf_model is None:
-                print("Error: Random Forest Model is not loaded.")
+            if models is None or models.rf_model is None:
+                logger.error("Random Forest Model is not loaded.")
                 return [{'condition': 'Model Loading Error', 'probability': 0, 'severity': 'unknown'}]
 
-            # --- Get predictions (example logic, adapt to your models) ---
-            # This part needs to be adapted based on what your models actually predict.
-            # Assuming models predict probability of *some* adverse condition.
-            # You'll need to map these probabilities to specific conditions.
-
-            if self.nn_model is not None:
-                rf_prob = self.rf_model.predict_proba(features)[0][1] # Probability of class 1 (adverse)
-                nn_prob = self.nn_model.predict(features)[0][0]      # Probability from NN
-
-                # Simple Averaging Ensemble
-                combined_prob = (rf_prob + nn_prob) / 2
-            else:
-                rf_prob = self.rf_model.predict_proba(features)[0][1]
-            combined_prob = rf_prob
+            # Probability of an adverse condition from the ensemble, memoized when a cache is configured
+            combined_prob = self.score_features(features, models)[0]
 
             # --- Map probability/metrics to conditions and severity ---
-            # This is a crucial step requiring domain knowledge or defined rules.
-            # Example Rules:
-            hr = metrics.get('heart_rate', 80)
-            sys_bp = metrics.get('blood_pressure_systolic', 120)
-            dias_bp = metrics.get('blood_pressure_diastolic', 80)
-            spo2 = metrics.get('spo2', 98)
-            temp = metrics.get('temperature', 36.6)
-            glucose = metrics.get('glucose', 100)
-
-            predictions_list = []
-
-            # Blood Pressure
-            if sys_bp >= 180 or dias_bp >= 120:
-                predictions_list.append({'condition': 'Hypertensive Crisis', 'probability': 0.95, 'severity': 'critical', 'icon': 'fas fa-heart-attack'})
-            elif sys_bp >= 140 or dias_bp >= 90:
-                predictions_list.append({'condition': 'Hypertension', 'probability': combined_prob * 0.8, 'severity': 'high', 'icon': 'fas fa-heart'})
-            elif sys_bp < 90 or dias_bp < 60:
-                predictions_list.append({'condition': 'Hypotension', 'probability': combined_prob * 0.7, 'severity': 'medium', 'icon': 'fas fa-tint'})
-            elif sys_bp > 120 and sys_bp < 140 or dias_bp > 80 and dias_bp < 90:
-                predictions_list.append({'condition': 'Elevated Blood Pressure', 'probability': combined_prob * 0.6, 'severity': 'medium', 'icon': 'fas fa-arrow-up'})
-
-            # Oxygen Saturation
-            if spo2 < 88:
-                predictions_list.append({'condition': 'Severe Hypoxia', 'probability': 0.9, 'severity': 'critical', 'icon': 'fas fa-lungs'})
-            elif spo2 < 92:
-                predictions_list.append({'condition': 'Hypoxia', 'probability': combined_prob * 0.7, 'severity': 'high', 'icon': 'fas fa-lungs'})
-            elif spo2 < 95:
-                predictions_list.append({'condition': 'Low Oxygen Saturation', 'probability': combined_prob * 0.5, 'severity': 'medium', 'icon': 'fas fa-thermometer-quarter'})
-
-            # Temperature
-            if temp >= 41:
-                predictions_list.append({'condition': 'Hyperthermia', 'probability': combined_prob * 0.7, 'severity': 'critical', 'icon': 'fas fa-thermometer-full'})
-            elif temp >= 39.5:
-                predictions_list.append({'condition': 'Hyperthermia', 'probability': combined_prob * 0.7, 'severity': 'high', 'icon': 'fas fa-thermometer-half'})
-            elif temp >= 38:
-                predictions_list.append({'condition': 'Fever', 'probability': combined_prob * 0.5, 'severity': 'medium', 'icon': 'fas fa-thermometer-quarter'})
-            elif temp < 35:
-                predictions_list.append({'condition': 'Hypothermia', 'probability': combined_prob * 0.6, 'severity': 'medium', 'icon': 'fas fa-snowflake'})
-
-            # Glucose
-            if glucose >= 300:
-                predictions_list.append({'condition': 'Severe Hyperglycemia', 'probability': 0.9, 'severity': 'critical', 'icon': 'fas fa-burn'})
-            elif glucose >= 200:
-                predictions_list.append({'condition': 'Hyperglycemia', 'probability': combined_prob * 0.7, 'severity': 'high', 'icon': 'fas fa-burn'})
-            elif glucose < 70:
-                predictions_list.append({'condition': 'Hypoglycemia', 'probability': combined_prob * 0.7, 'severity': 'medium', 'icon': 'fas fa-burn'})
-
-            # Heart Rate
-            if hr >= 150:
-                predictions_list.append({'condition': 'Severe Tachycardia', 'probability': 0.85, 'severity': 'critical', 'icon': 'fas fa-heartbeat'})
-            elif hr >= 100:
-                predictions_list.append({'condition': 'Tachycardia', 'probability': combined_prob * 0.6, 'severity': 'medium', 'icon': 'fas fa-heartbeat'})
-            elif hr <= 40:
-                predictions_list.append({'condition': 'Severe Bradycardia', 'probability': 0.85, 'severity': 'critical', 'icon': 'fas fa-heartbeat'})
-            elif hr <= 60:
-                predictions_list.append({'condition': 'Bradycardia', 'probability': combined_prob * 0.6, 'severity': 'medium', 'icon': 'fas fa-heartbeat'})
-
-            # Combine conditions if multiple are true
-            if not predictions_list:
-                predictions_list.append({'condition': 'Normal', 'probability': 1.0 - combined_prob, 'severity': 'low', 'icon': 'fas fa-check-circle'})
-
-            print(f"Generated predictions: {predictions_list}")
-            return predictions_list
+            # Rules come from the condition table (condition_rules.json, see rules_engine.py) and
+            # are applied to the raw metrics; keys missing here fall back to typical values.
+            with timed('rules'):
+                predictions_list = self.rules.evaluate(self.rules.row(metrics), combined_prob)[0]
 
-            print(f"Generated predictions: {predictions_list}")
+            logger.debug("Generated predictions: %s", predictions_list)
             return predictions_list
 
         except Exception as e:
-            print(f"Prediction error: {e}")
-            print(f"Input metrics: {metrics}")
-            print(traceback.format_exc())
+            logger.exception("Prediction error: %s. Input metrics: %s", e, metrics)
             return [{'condition': 'Unable to provide a prediction with current data. Please check input values.', 'probability': 0, 'severity': 'unknown'}]
 
+    def validate_batch(self, list_of_metrics):
+        """
+        Checks a batch of input metrics dictionaries and converts it into a NumPy matrix
+        of raw readings, one column per entry of self.feature_names.
+        Raises ValueError describing the first invalid reading.
+        """
+        if not isinstance(list_of_metrics, (list, tuple)):
+            raise ValueError("Batch must be a list of readings.")
+
+        columns = [INPUT_KEYS[name] for name in self.feature_names]
+        raw = np.empty((len(list_of_metrics), len(columns)), dtype=np.float64)
+        for i, metrics in enumerate(list_of_metrics):
+            if not isinstance(metrics, dict):
+                raise ValueError(f"Reading {i} must be a JSON object.")
+            missing_keys = [key for key in REQUIRED_KEYS if key not in metrics]
+            if missing_keys:
+                raise ValueError(f"Reading {i} is missing required keys: {missing_keys}")
+            for j, key in enumerate(columns):
+                value = metrics.get(key, 100) if key == 'glucose' else metrics[key]
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    raise ValueError(f"Reading {i} has a non-numeric value for '{key}': {value!r}")
+                raw[i, j] = value
+        return raw
+
+    def predict_health_batch(self, list_of_metrics, models=None):
+        """
+        Makes health predictions for a batch of input metrics dictionaries.
+        Both models run once over the whole batch and the condition rules are matched for
+        every reading with a few vectorized operations. Returns one prediction list per
+        reading, identical to what predict_health returns for that reading whatever else is in
+        the batch (with the compiled RF and the NumPy NN; Keras' float32 output may differ in
+        the last digit). test_batch_parity.py checks it.
+        `models` pins the ModelVersion to use, by default the active one.
+        Raises ValueError if any reading in the batch is invalid.
+        """
+        models = models or self.models
+        with timed('preprocess'):
+            raw = self.validate_batch(list_of_metrics)
+            if len(raw) == 0:
+                return []
+
+            if models is None or models.rf_model is None:
+                logger.error("Random Forest Model is not loaded.")
+                return [[{'condition': 'Model Loading Error', 'probability': 0, 'severity': 'unknown'}] for _ in range(len(raw))]
+
+            # Same cleanup as preprocess_data, applied to the whole matrix
+            features = models.preprocessor.transform_batch(raw)
+
+        combined_prob = self.score_features(features, models)
+
+        # Same condition table as predict_health, matched for the whole batch at once
+        with timed('rules'):
+            batch_predictions = self.rules.evaluate(raw, combined_prob)
+
+        logger.debug("Generated predictions for a batch of %d readings", len(batch_predictions))
+        return batch_predictions
+
 # Note: Flask app setup and routes have been moved to app.py
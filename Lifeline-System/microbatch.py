@@ -0,0 +1,153 @@
+"""
+Request coalescing in front of HealthAIPredictor.
+
+Scoring a 64-row matrix costs about the same as scoring one row, so concurrent /predict
+calls are queued and a worker thread scores them together with predict_health_batch.
+A batch is dispatched once it holds max_batch_size readings or max_wait_ms after its first
+reading arrived, whichever comes first, which bounds the extra latency per request.
+A reading gets the same predictions whichever batch it lands in (see nn_engine.py).
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class _PendingRequest:
+    __slots__ = ('metrics', 'future', 'enqueued_at')
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+# --- Micro Batcher ---
+class MicroBatcher:
+    """Collects predict_health calls from many threads and scores them as one batch."""
+
+    COUNTERS = ('batches_total', 'fallback_batches_total', 'invalid_readings_total')  # stats() keys that only go up
+
+    def __init__(self, predictor, max_batch_size=64, max_wait_ms=2.0):
+        self.predictor = predictor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self.batch_size = Histogram([1, 2, 4, 8, 16, 32, 64, 128, 256, 512])
+        self.queue_wait_seconds = Histogram([0.0001, 0.00025, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1])
+        self.batches_total = 0
+        self.fallback_batches_total = 0  # Batches holding invalid readings, which were set apart before scoring the rest
+        self.invalid_readings_total = 0
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='predict-microbatcher', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """Scores everything already queued, then stops the worker thread."""
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, metrics):
+        """Queues one reading and returns a Future resolving to (prediction list, model version)."""
+        request = _PendingRequest(metrics)
+        self._queue.put(request)
+        return request.future
+
+    def predict(self, metrics, timeout=None):
+        """
+        Blocking equivalent of predictor.predict_health(metrics), scored in a shared batch.
+        Returns (prediction list, version of the models that produced it).
+        """
+        return self.submit(metrics).result(timeout)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'batches_total': self.batches_total,
+                'fallback_batches_total': self.fallback_batches_total,
+                'invalid_readings_total': self.invalid_readings_total,
+                'queue_depth': self._queue.qsize(),
+                'batch_size': self.batch_size.snapshot(),
+                'queue_wait_seconds': self.queue_wait_seconds.snapshot(),
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000.0,
+            }
+
+    def _collect(self, first):
+        """Gathers readings until the batch is full or the first one has waited max_wait."""
+        batch = [first]
+        deadline = first.enqueued_at + self.max_wait
+        stop = False
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                stop = True
+                break
+            batch.append(item)
+        return batch, stop
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch, stop = self._collect(first)
+            self._score(batch)
+            if stop:
+                return
+
+    def _score(self, batch):
+        started_at = time.perf_counter()
+        scored, invalid = batch, []
+        models = self.predictor.models  # The whole batch is scored by one model version
+        try:
+            try:
+                results = self.predictor.predict_health_batch([request.metrics for request in batch], models=models)
+            except ValueError:
+                # One malformed reading must not fail its neighbours: set the invalid ones apart
+                # and score the rest as one batch
+                scored = []
+                for request in batch:
+                    try:
+                        self.predictor.validate_batch([request.metrics])
+                        scored.append(request)
+                    except ValueError:
+                        invalid.append(request)
+                results = self.predictor.predict_health_batch([request.metrics for request in scored], models=models)
+            version = models.version if models is not None else None
+            for request, result in zip(scored, results):
+                request.future.set_result((result, version))
+            for request in invalid:
+                # The same error response as the unbatched path, which fails in preprocessing
+                request.future.set_result((self.predictor.predict_health(request.metrics, models=models), version))
+        except Exception as e:
+            logger.exception("Error scoring batch of %d readings: %s", len(batch), e)
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(e)
+
+        with self._stats_lock:
+            self.batches_total += 1
+            self.fallback_batches_total += bool(invalid)
+            self.invalid_readings_total += len(invalid)
+            self.batch_size.observe(len(batch))
+            for request in batch:
+                self.queue_wait_seconds.observe(started_at - request.enqueued_at)
@@ -0,0 +1,207 @@
+"""
+Versioned local model registry.
+
+Every trained model set is published as a version: a directory under models/registry
+holding the artifacts and a metadata.json with their SHA-256 checksums, creation time and
+whatever the trainer recorded (accuracy, dataset, ...). active.json names the version
+being served and the ones served before it, which is what rollback goes back to.
+
+Servers watch active.json and swap to a newly activated version without restarting.
+
+    python model_registry.py publish --activate   # publish models/* as a new version
+    python model_registry.py list
+    python model_registry.py activate 20261018-142301
+    python model_registry.py rollback
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+
+from async_logging import configure_logging
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_DIR = 'models/registry'
+# Files a version may hold, named as in the models directory
+ARTIFACTS = ('random_forest.pkl', 'random_forest.npz', 'neural_network.h5', 'neural_network.npz', 'scaler.npz')
+MAX_HISTORY = 20  # Previously active versions remembered for rollback
+
+
+def file_checksum(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _write_json(path, data):
+    """Writes through a temporary file so readers never see a partial file."""
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+# --- Model Registry ---
+class ModelRegistry:
+    """A directory of model versions plus the record of which one is active."""
+
+    def __init__(self, root=REGISTRY_DIR):
+        self.root = root
+        self.active_path = os.path.join(root, 'active.json')
+
+    def path(self, version, name):
+        return os.path.join(self.root, version, name)
+
+    def metadata(self, version):
+        with open(self.path(version, 'metadata.json')) as f:
+            return json.load(f)
+
+    def versions(self):
+        """Metadata of every published version, oldest first."""
+        if not os.path.isdir(self.root):
+            return []
+        found = [self.metadata(name) for name in os.listdir(self.root)
+                 if os.path.isfile(self.path(name, 'metadata.json'))]
+        return sorted(found, key=lambda meta: meta['created_at'])
+
+    def publish(self, files, version=None, metadata=None):
+        """
+        Copies the artifacts in `files` ({artifact name: source path}) into a new version
+        and returns its name. The version only appears once it is complete.
+        """
+        unknown = set(files) - set(ARTIFACTS)
+        if unknown:
+            raise ValueError(f"Unknown artifacts: {sorted(unknown)}, expected some of {list(ARTIFACTS)}")
+        if version is None:
+            version = time.strftime('%Y%m%d-%H%M%S')
+            suffix = 1
+            while os.path.exists(os.path.join(self.root, version)):
+                suffix += 1
+                version = f"{time.strftime('%Y%m%d-%H%M%S')}-{suffix}"
+        target = os.path.join(self.root, version)
+        if os.path.exists(target):
+            raise ValueError(f"Version {version} already exists")
+
+        staging = os.path.join(self.root, f".staging-{version}")
+        os.makedirs(staging)
+        try:
+            checksums = {}
+            for name, source in files.items():
+                shutil.copyfile(source, os.path.join(staging, name))
+                checksums[name] = file_checksum(os.path.join(staging, name))
+            _write_json(os.path.join(staging, 'metadata.json'), {
+                **(metadata or {}),
+                'version': version,
+                'created_at': time.time(),
+                'files': checksums,
+            })
+            os.rename(staging, target)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        logger.info("Published model version %s to %s", version, target)
+        return version
+
+    def verify(self, version):
+        """Raises ValueError unless every artifact of the version matches its recorded checksum."""
+        try:
+            files = self.metadata(version)['files']
+        except FileNotFoundError:
+            raise ValueError(f"Unknown model version {version}") from None
+        for name, checksum in files.items():
+            path = self.path(version, name)
+            if not os.path.exists(path):
+                raise ValueError(f"Model version {version} is missing {name}")
+            if file_checksum(path) != checksum:
+                raise ValueError(f"Checksum mismatch for {name} in model version {version}")
+
+    # --- Active version ---
+    def _state(self):
+        try:
+            with open(self.active_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'active': None, 'history': []}
+
+    def active_version(self):
+        return self._state()['active']
+
+    def history(self):
+        """Previously active versions, most recent last."""
+        return self._state()['history']
+
+    def activate(self, version):
+        self.verify(version)
+        state = self._state()
+        if state['active'] == version:
+            return version
+        history = state['history'] + ([state['active']] if state['active'] else [])
+        _write_json(self.active_path, {'active': version, 'history': history[-MAX_HISTORY:]})
+        logger.info("Activated model version %s", version)
+        return version
+
+    def rollback(self):
+        """Re-activates the previously active version and returns it."""
+        state = self._state()
+        if not state['history']:
+            raise ValueError("No previous model version to roll back to")
+        version = state['history'][-1]
+        self.verify(version)
+        _write_json(self.active_path, {'active': version, 'history': state['history'][:-1]})
+        logger.info("Rolled back to model version %s", version)
+        return version
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the local model registry.")
+    parser.add_argument('--root', default=REGISTRY_DIR)
+    commands = parser.add_subparsers(dest='command', required=True)
+    publish = commands.add_parser('publish', help="Publish the artifacts of a models directory as a new version")
+    publish.add_argument('--models-dir', default='models')
+    publish.add_argument('--version')
+    publish.add_argument('--activate', action='store_true')
+    commands.add_parser('list', help="List versions")
+    activate = commands.add_parser('activate', help="Serve a version")
+    activate.add_argument('version')
+    commands.add_parser('rollback', help="Serve the previously active version again")
+    verify = commands.add_parser('verify', help="Check a version's checksums")
+    verify.add_argument('version')
+    args = parser.parse_args(argv)
+
+    configure_logging()
+    registry = ModelRegistry(args.root)
+    try:
+        if args.command == 'publish':
+            files = {name: os.path.join(args.models_dir, name) for name in ARTIFACTS
+                     if os.path.exists(os.path.join(args.models_dir, name))}
+            version = registry.publish(files, version=args.version)
+            if args.activate:
+                registry.activate(version)
+        elif args.command == 'list':
+            active = registry.active_version()
+            for meta in registry.versions():
+                marker = '*' if meta['version'] == active else ' '
+                created = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(meta['created_at']))
+                print(f"{marker} {meta['version']:<24}{created}  {', '.join(sorted(meta['files']))}")
+        elif args.command == 'activate':
+            registry.activate(args.version)
+        elif args.command == 'rollback':
+            registry.rollback()
+        elif args.command == 'verify':
+            registry.verify(args.version)
+            print(f"Model version {args.version} is intact")
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,153 @@
+"""
+Pure-NumPy inference for the Dense neural network.
+
+The serving model is a small stack of Dense layers (Dropout is a no-op at inference), so a
+forward pass is a couple of matrix products. DenseNetwork runs it straight from the
+weights, without TensorFlow or Keras' per-call predict() setup.
+
+Export the weights of a saved model with (needs h5py only, not TensorFlow):
+    python nn_engine.py models/neural_network.h5 models/neural_network.npz
+"""
+import json
+import sys
+
+import numpy as np
+
+from mapped_arrays import load_arrays, save_arrays
+
+
+def _sigmoid(x):
+    # exp(-x) overflows to inf for very negative x, which still gives the right limit of 0
+    with np.errstate(over='ignore'):
+        return 1 / (1 + np.exp(-x))
+
+
+# Activations supported in exported layers
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0, out=x),
+    'sigmoid': _sigmoid,
+    'tanh': np.tanh,
+}
+# Layers that do nothing at inference time
+PASSTHROUGH_LAYERS = ('InputLayer', 'Dropout')
+
+
+def _check_activation(activation):
+    if activation not in ACTIVATIONS:
+        raise ValueError(f"Unsupported activation '{activation}'. Supported: {sorted(ACTIVATIONS)}")
+    return activation
+
+
+def export_keras_model(model):
+    """Builds a DenseNetwork from an in-memory Keras model."""
+    weights, biases, activations = [], [], []
+    for layer in model.layers:
+        kind = type(layer).__name__
+        if kind in PASSTHROUGH_LAYERS:
+            continue
+        if kind != 'Dense':
+            raise ValueError(f"Unsupported layer type '{kind}' in layer '{layer.name}'.")
+        kernel, bias = layer.get_weights()
+        weights.append(kernel)
+        biases.append(bias)
+        activations.append(_check_activation(layer.get_config()['activation']))
+    return DenseNetwork(weights, biases, activations)
+
+
+def export_h5_model(h5_path):
+    """
+    Builds a DenseNetwork from a model saved with model.save('*.h5'), reading the layer
+    list and weights directly with h5py so TensorFlow is not needed.
+    """
+    import h5py
+
+    weights, biases, activations = [], [], []
+    with h5py.File(h5_path, 'r') as f:
+        config = json.loads(f.attrs['model_config'])
+        layers = config['config']['layers'] if isinstance(config['config'], dict) else config['config']
+        weights_root = f['model_weights'] if 'model_weights' in f else f
+
+        for layer in layers:
+            kind = layer['class_name']
+            if kind in PASSTHROUGH_LAYERS:
+                continue
+            name = layer['config']['name']
+            if kind != 'Dense':
+                raise ValueError(f"Unsupported layer type '{kind}' in layer '{name}'.")
+
+            group = weights_root[name]
+            # weight_names lists the layer's variables in order: kernel, then bias
+            kernel_name, bias_name = [w.decode() if isinstance(w, bytes) else w for w in group.attrs['weight_names']]
+            weights.append(group[kernel_name][()])
+            biases.append(group[bias_name][()])
+            activations.append(_check_activation(layer['config']['activation']))
+    return DenseNetwork(weights, biases, activations)
+
+
+# --- Dense Network ---
+class DenseNetwork:
+    """
+    Forward pass of a Dense layer stack with float32 weights, the precision Keras stores them in.
+
+    The products are accumulated in float64 and the output rounded to float32. BLAS sums a
+    single row in another order than a block of rows, which in float32 moves about 1% of
+    outputs by one unit in the last place; in float64 the order changes the sums by about
+    1e-16, far below float32 resolution, so a row gets the same output whatever batch it is in.
+    """
+
+    def __init__(self, weights, biases, activations):
+        self.weights = [np.ascontiguousarray(w, dtype=np.float32) for w in weights]
+        self.biases = [np.ascontiguousarray(b, dtype=np.float32) for b in biases]
+        self.activations = list(activations)
+        # Exact float64 copies used by predict(); a few hundred KB at most for these networks
+        self._weights64 = [w.astype(np.float64) for w in self.weights]
+        self._biases64 = [b.astype(np.float64) for b in self.biases]
+
+    def save(self, path):
+        """Writes the weights to an uncompressed .npz file that load() can map (mapped_arrays.py)."""
+        arrays = {'activations': np.array(self.activations, dtype=str)}
+        for i, (w, b) in enumerate(zip(self.weights, self.biases)):
+            arrays[f'kernel_{i}'] = w
+            arrays[f'bias_{i}'] = b
+        save_arrays(path, arrays)
+
+    @classmethod
+    def load(cls, path, mmap=False):
+        """Reads weights written by save(); with mmap the kernels stay read-only views of the file."""
+        data = load_arrays(path, mmap=mmap)
+        activations = data['activations'].tolist()
+        weights = [data[f'kernel_{i}'] for i in range(len(activations))]
+        biases = [data[f'bias_{i}'] for i in range(len(activations))]
+        return cls(weights, biases, activations)
+
+    def fold_input_scaling(self, scaler):
+        """
+        A network taking raw features that matches this one on scaler.transform(raw), with the
+        scaling folded into the first layer: (x * coef + offset) @ W + b = x @ (coef * W) + (offset @ W + b).
+        """
+        first = self.weights[0].astype(np.float64)
+        weights = [scaler.coef[:, np.newaxis] * first] + self.weights[1:]
+        biases = [scaler.offset @ first + self.biases[0]] + self.biases[1:]
+        return DenseNetwork(weights, biases, self.activations)
+
+    def predict(self, X, verbose=0):
+        """
+        Returns the network output for a (n_rows, n_features) matrix, shape (n_rows, n_units).
+        `verbose` is accepted for call compatibility with keras.Model.predict and ignored.
+        """
+        x = np.asarray(X, dtype=np.float32).astype(np.float64)  # Inputs rounded to float32 as Keras sees them
+        for w, b, activation in zip(self._weights64, self._biases64, self.activations):
+            x = x @ w
+            x += b
+            x = ACTIVATIONS[activation](x)
+        return x.astype(np.float32)
+
+
+if __name__ == '__main__':
+    h5_path = sys.argv[1] if len(sys.argv) > 1 else 'models/neural_network.h5'
+    npz_path = sys.argv[2] if len(sys.argv) > 2 else 'models/neural_network.npz'
+
+    network = export_h5_model(h5_path)
+    network.save(npz_path)
+    print(f"Exported {len(network.weights)} Dense layers ({' -> '.join(str(w.shape[1]) for w in network.weights)}) into {npz_path}")
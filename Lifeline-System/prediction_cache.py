@@ -0,0 +1,111 @@
+"""
+Memoization of model probabilities for HealthAIPredictor.
+
+Monitored patients report nearly the same vitals reading after reading, so the ensemble
+probability is cached keyed on the clipped feature vector rounded to a per-feature step
+(1 bpm, 0.1 °C, ...). Only the model output is cached: the condition rules still run on
+every raw reading, so a cache hit can shift a probability by at most what one quantization
+step changes in the models, never which conditions are reported.
+
+The cache is a bounded LRU with an optional time-to-live and is cleared whenever the models
+behind it change.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# Step each feature is rounded to before lookup; 0 keys on the exact value
+DEFAULT_QUANTIZATION = {
+    'heart_rate': 1.0,
+    'systolic_bp': 1.0,
+    'diastolic_bp': 1.0,
+    'spo2': 1.0,
+    'temperature': 0.1,
+    'glucose': 1.0,
+}
+
+
+# --- Prediction Cache ---
+class PredictionCache:
+    """Thread-safe LRU of feature vector -> probability with hit/miss/eviction counters."""
+
+    COUNTERS = ('hits', 'misses', 'evictions', 'expirations', 'invalidations')  # stats() keys that only go up
+
+    def __init__(self, feature_names, max_size=10000, ttl=60.0, quantization=None):
+        quantization = {**DEFAULT_QUANTIZATION, **(quantization or {})}
+        self.feature_names = list(feature_names)
+        self.steps = np.array([quantization.get(name, 0.0) for name in self.feature_names], dtype=np.float64)
+        self.max_size = max_size
+        self.ttl = ttl  # Seconds an entry stays valid, None to keep entries until evicted
+        self._entries = OrderedDict()  # key -> (probability, stored_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def keys(self, features, namespace=None):
+        """
+        One hashable key per row of the (n, n_features) feature matrix. Keys of different
+        namespaces (model version and which models scored them) never collide.
+        """
+        quantized = np.array(features, dtype=np.float64)
+        stepped = self.steps > 0
+        quantized[:, stepped] = np.rint(quantized[:, stepped] / self.steps[stepped])
+        if namespace is None:
+            return [row.tobytes() for row in quantized]
+        return [(namespace, row.tobytes()) for row in quantized]
+
+    def get_many(self, keys):
+        """Cached probability per key, None where there is no valid entry."""
+        now = time.monotonic()
+        found = []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and self.ttl is not None and now - entry[1] > self.ttl:
+                    del self._entries[key]
+                    self.expirations += 1
+                    entry = None
+                if entry is None:
+                    self.misses += 1
+                    found.append(None)
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    found.append(entry[0])
+        return found
+
+    def put_many(self, keys, probabilities):
+        now = time.monotonic()
+        with self._lock:
+            for key, probability in zip(keys, probabilities):
+                self._entries[key] = (probability, now)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drops every entry; called when the models are (re)loaded."""
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
@@ -0,0 +1,116 @@
+import numpy as np
+
+# Request payload key for each model feature
+INPUT_KEYS = {
+    'heart_rate': 'heart_rate',
+    'systolic_bp': 'blood_pressure_systolic',
+    'diastolic_bp': 'blood_pressure_diastolic',
+    'spo2': 'spo2',
+    'temperature': 'temperature',
+    'glucose': 'glucose',
+}
+# Keys a reading must provide to be scored in a batch (glucose falls back to 100)
+REQUIRED_KEYS = ['heart_rate', 'blood_pressure_systolic', 'blood_pressure_diastolic', 'spo2', 'temperature']
+# Value used when a key is absent from the payload (absent keys without a default become 0)
+INPUT_DEFAULTS = {
+    'glucose': 100,
+}
+# Clip bounds applied to each feature before it is fed to the models
+CLIP_BOUNDS = {
+    'heart_rate': (0, 200),
+    'systolic_bp': (0, 300),
+    'diastolic_bp': (0, 200),
+    'spo2': (0, 100),
+    'temperature': (30, 45),
+    'glucose': (0, 500),
+}
+
+
+# --- Feature Preprocessor ---
+class FeaturePreprocessor:
+    """
+    Turns input metrics into the clipped feature matrix the models expect.
+    The feature order, payload keys and clip bounds are resolved once into NumPy arrays so
+    each reading only costs filling one row and a single vectorized clip.
+    """
+
+    def __init__(self, feature_names, dtype=np.float64):
+        self.feature_names = list(feature_names)
+        self.dtype = np.dtype(dtype)
+        self.input_keys = [INPUT_KEYS[name] for name in self.feature_names]
+        self.defaults = [INPUT_DEFAULTS.get(key) for key in self.input_keys]
+        self.lower = np.array([CLIP_BOUNDS[name][0] for name in self.feature_names], dtype=self.dtype)
+        self.upper = np.array([CLIP_BOUNDS[name][1] for name in self.feature_names], dtype=self.dtype)
+
+    def empty(self, n_rows=1):
+        """Allocates a feature matrix that can be passed as `out` to transform()/transform_batch()."""
+        return np.empty((n_rows, len(self.feature_names)), dtype=self.dtype)
+
+    def transform(self, metrics, out=None):
+        """
+        Converts one metrics dictionary into a (1, n_features) array, filling `out` in place
+        when given. Missing or NaN values become 0 (glucose defaults to 100) before clipping.
+        Raises ValueError/TypeError if a value cannot be converted to a number.
+        """
+        row = self.empty() if out is None else out
+        values = row[0]
+        for j, key in enumerate(self.input_keys):
+            value = metrics.get(key, self.defaults[j])
+            value = 0.0 if value is None else float(value)
+            values[j] = 0.0 if value != value else value  # NaN -> 0
+        np.clip(row, self.lower, self.upper, out=row)
+        return row
+
+    def transform_batch(self, raw, out=None):
+        """
+        Cleans a (n_rows, n_features) matrix of raw numeric readings, already in feature
+        order: NaN becomes 0 and every column is clipped in one call.
+        """
+        features = np.empty(raw.shape, dtype=self.dtype) if out is None else out
+        np.copyto(features, raw, casting='unsafe')
+        features[np.isnan(features)] = 0.0
+        np.clip(features, self.lower, self.upper, out=features)
+        return features
+
+
+# --- Feature Scaler ---
+class FeatureScaler:
+    """
+    The StandardScaler the models were trained behind, as the affine map x * coef + offset
+    precomputed in the models' feature order. Where a model can absorb it (compiled RF
+    thresholds, first Dense layer) it is folded in at load time instead of applied per request.
+    """
+
+    def __init__(self, feature_names, mean, scale):
+        self.feature_names = list(feature_names)
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        if np.any(self.scale <= 0):
+            raise ValueError("Scaler scale must be positive")
+        self.coef = 1.0 / self.scale
+        self.offset = -self.mean / self.scale
+
+    def save(self, path):
+        from mapped_arrays import save_arrays
+        save_arrays(path, {'feature_names': np.array(self.feature_names, dtype=str),
+                           'mean': self.mean, 'scale': self.scale})
+
+    @classmethod
+    def load(cls, path):
+        from mapped_arrays import load_arrays
+        data = load_arrays(path, mmap=False)
+        return cls(data['feature_names'].tolist(), data['mean'], data['scale'])
+
+    def reorder(self, feature_names):
+        """The same scaler for features in another order; raises ValueError if one is missing."""
+        missing = [name for name in feature_names if name not in self.feature_names]
+        if missing:
+            raise ValueError(f"Scaler has no statistics for features {missing}")
+        order = [self.feature_names.index(str(name)) for name in feature_names]
+        return FeatureScaler(feature_names, self.mean[order], self.scale[order])
+
+    def transform(self, features):
+        """Scaled copy of a (n_rows, n_features) matrix: one multiply-add, no division."""
+        scaled = np.multiply(features, self.coef)
+        scaled += self.offset
+        return scaled
@@ -0,0 +1,217 @@
+"""
+Array-backed inference engine for the Random Forest.
+
+export_forest() flattens a fitted sklearn RandomForestClassifier into a handful of
+contiguous NumPy arrays, and CompiledForest walks all trees for all rows at once with
+plain array indexing. Probabilities match sklearn's predict_proba, but a single reading
+skips sklearn's input validation and per-tree dispatch, and loading a saved forest does
+not import sklearn at all.
+
+Export a trained model with:
+    python rf_engine.py models/random_forest.pkl models/random_forest.npz
+"""
+import sys
+
+import numpy as np
+
+from mapped_arrays import load_arrays, save_arrays
+
+# Rows scored per pass, bounds the (rows x trees) node index matrix
+CHUNK_SIZE = 8192
+
+
+def export_forest(rf_model):
+    """
+    Flattens the trees of a fitted RandomForestClassifier into a CompiledForest.
+    Node indices of all trees are concatenated; leaves point to themselves and compare
+    against +inf, so walking a fixed number of steps always ends on a leaf.
+    """
+    if rf_model.n_outputs_ != 1:
+        raise ValueError("Only single-output forests can be compiled.")
+
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for estimator in rf_model.estimators_:
+        tree = estimator.tree_
+        node_ids = np.arange(tree.node_count)
+        is_leaf = tree.children_left < 0
+
+        features.append(np.where(is_leaf, 0, tree.feature))
+        thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+        lefts.append(np.where(is_leaf, node_ids, tree.children_left) + offset)
+        rights.append(np.where(is_leaf, node_ids, tree.children_right) + offset)
+
+        # Same normalization DecisionTreeClassifier.predict_proba applies to the leaf it lands on
+        value = tree.value[:, 0, :rf_model.n_classes_].astype(np.float64)
+        normalizer = value.sum(axis=1)[:, np.newaxis]
+        normalizer[normalizer == 0.0] = 1.0
+        values.append(value / normalizer)
+
+        roots.append(offset)
+        offset += tree.node_count
+        max_depth = max(max_depth, tree.max_depth)
+
+    feature_names = getattr(rf_model, 'feature_names_in_', None)
+    return CompiledForest(
+        feature=np.concatenate(features).astype(np.intp),
+        threshold=np.concatenate(thresholds).astype(np.float64),
+        left=np.concatenate(lefts).astype(np.intp),
+        right=np.concatenate(rights).astype(np.intp),
+        value=np.concatenate(values),
+        roots=np.array(roots, dtype=np.intp),
+        max_depth=max_depth,
+        classes=np.asarray(rf_model.classes_),
+        feature_names=None if feature_names is None else [str(name) for name in feature_names],
+    )
+
+
+def _ordered_bits(x):
+    """float64 -> int64 keys that sort like the floats (negative floats have their order reversed)."""
+    bits = np.asarray(x, dtype=np.float64).view(np.int64)
+    return np.where(bits < 0, -(bits & np.int64(0x7FFFFFFFFFFFFFFF)), bits)
+
+
+def _from_ordered_bits(keys):
+    bits = np.where(keys < 0, (-keys) | np.int64(-0x8000000000000000), keys)
+    return bits.view(np.float64)
+
+
+# --- Compiled Forest ---
+class CompiledForest:
+    """Tree-walking evaluator over the flat arrays produced by export_forest()."""
+
+    def __init__(self, feature, threshold, left, right, value, roots, max_depth, classes, feature_names=None,
+                 raw_input=False):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.classes_ = classes
+        self.feature_names = feature_names
+        self.raw_input = raw_input  # Thresholds already take unscaled features, see fold_input_scaling()
+        self.n_estimators = len(roots)
+
+    def save(self, path):
+        """Writes the forest arrays to an uncompressed .npz file that load() can map (mapped_arrays.py)."""
+        arrays = {
+            'feature': self.feature,
+            'threshold': self.threshold,
+            'left': self.left,
+            'right': self.right,
+            'value': self.value,
+            'roots': self.roots,
+            'max_depth': np.array(self.max_depth),
+            'classes': self.classes_,
+            'raw_input': np.array(self.raw_input),
+        }
+        if self.feature_names is not None:
+            arrays['feature_names'] = np.array(self.feature_names, dtype=str)
+        save_arrays(path, arrays)
+
+    @classmethod
+    def load(cls, path, mmap=False):
+        """
+        Reads a forest written by save(). With mmap the node arrays stay read-only views of
+        the file, shared by every process that maps it.
+        """
+        data = load_arrays(path, mmap=mmap)
+        return cls(
+            # copy=False keeps mapped arrays mapped when they already have the native dtype
+            feature=data['feature'].astype(np.intp, copy=False),
+            threshold=data['threshold'],
+            left=data['left'].astype(np.intp, copy=False),
+            right=data['right'].astype(np.intp, copy=False),
+            value=data['value'],
+            roots=data['roots'].astype(np.intp, copy=False),
+            max_depth=int(data['max_depth']),
+            classes=data['classes'],
+            feature_names=data['feature_names'].tolist() if 'feature_names' in data else None,
+            raw_input=bool(data['raw_input']) if 'raw_input' in data else False,
+        )
+
+    def fold_input_scaling(self, scaler):
+        """
+        A forest taking raw features that matches this one on scaler.transform(raw): a split
+        (x - mean) / scale <= t is the split x <= t * scale + mean. Leaves keep +inf.
+        train_models.py saves forests folded, so servers map them as they are.
+        """
+        if self.raw_input:
+            raise ValueError("Forest thresholds are already folded")
+        coef, offset = scaler.coef[self.feature], scaler.offset[self.feature]
+        split = self.threshold
+
+        def holds(x):
+            # The comparison the unfolded forest makes: features are scaled, then cast to float32
+            return (x * coef + offset).astype(np.float32) <= split
+
+        # Bisect for the largest float64 reading that still goes left, so readings on a split
+        # boundary go the same way as when they are scaled first. Searching the bit patterns
+        # as ordered integers takes at most 64 halvings.
+        with np.errstate(invalid='ignore', over='ignore'):
+            estimate = split * scaler.scale[self.feature] + scaler.mean[self.feature]
+            margin = 1e-3 * (np.abs(estimate) + 1.0)
+            low, high = _ordered_bits(estimate - margin), _ordered_bits(estimate + margin)
+            search = np.isfinite(estimate) & holds(estimate - margin) & ~holds(estimate + margin)
+            for _ in range(64):
+                middle = low + (high - low) // 2
+                left = holds(_from_ordered_bits(middle))
+                low = np.where(search & left, middle, low)
+                high = np.where(search & ~left, middle, high)
+                if not np.any(search & (high - low > 1)):
+                    break
+            threshold = np.where(search, _from_ordered_bits(low), estimate)
+        return CompiledForest(self.feature, threshold, self.left, self.right, self.value, self.roots,
+                              self.max_depth, self.classes_, self.feature_names, raw_input=True)
+
+    def apply(self, X):
+        """Returns the leaf reached in every tree, shape (n_rows, n_estimators)."""
+        # sklearn compares float32 inputs against float64 thresholds, do the same. Folded
+        # thresholds are exact for float64 readings, which sklearn only sees once scaled
+        X = np.asarray(X, dtype=np.float64 if self.raw_input else np.float32)
+        rows = np.arange(X.shape[0])[:, np.newaxis]
+        nodes = np.repeat(self.roots[np.newaxis, :], X.shape[0], axis=0)
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return nodes
+
+    def predict_proba(self, X):
+        """Class probabilities averaged over all trees, same as RandomForestClassifier.predict_proba."""
+        X = np.asarray(X)
+        proba = np.empty((X.shape[0], self.value.shape[1]), dtype=np.float64)
+        for start in range(0, X.shape[0], CHUNK_SIZE):
+            leaves = self.apply(X[start:start + CHUNK_SIZE])
+            # Summing over the tree axis accumulates tree by tree, in sklearn's order
+            chunk = self.value[leaves].sum(axis=1)
+            chunk /= self.n_estimators
+            proba[start:start + CHUNK_SIZE] = chunk
+        return proba
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+
+def verify_forest(rf_model, compiled, X):
+    """Returns the largest absolute difference between sklearn's and the compiled probabilities."""
+    return float(np.max(np.abs(rf_model.predict_proba(X) - compiled.predict_proba(X))))
+
+
+if __name__ == '__main__':
+    import joblib
+
+    pkl_path = sys.argv[1] if len(sys.argv) > 1 else 'models/random_forest.pkl'
+    npz_path = sys.argv[2] if len(sys.argv) > 2 else 'models/random_forest.npz'
+
+    rf_model = joblib.load(pkl_path)
+    compiled = export_forest(rf_model)
+    compiled.save(npz_path)
+    print(f"Compiled {compiled.n_estimators} trees ({len(compiled.feature)} nodes) into {npz_path}")
+
+    # Spot check against sklearn on random rows spanning the clipped input ranges
+    rng = np.random.default_rng(42)
+    X = rng.uniform([0, 0, 0, 0, 30, 0], [200, 300, 200, 100, 45, 500], size=(2000, 6))
+    print(f"Max probability difference vs sklearn: {verify_forest(rf_model, compiled, X)}")
@@ -0,0 +1,294 @@
+"""
+Table-driven condition rules.
+
+The rules mapping vitals to conditions live in condition_rules.json: groups of rules where
+the first matching rule of each group is reported, each rule being a list of alternatives
+of ANDed comparisons such as "spo2 < 92". The table is compiled once into arrays:
+
+- every threshold a vital is compared against goes into one sorted array per vital, so a
+  single np.searchsorted per vital places all readings between thresholds, and every
+  comparison becomes an integer comparison against the threshold's position;
+- alternatives and rules are 0/1 matrices, so which rules match for N readings is two
+  matrix products, and the first match of each group an argmax.
+
+The array set-up costs tens of microseconds, so up to SCALAR_ROWS readings are matched
+one at a time from the same thresholds instead: a bisect per vital gives the reading's
+region between that vital's thresholds, and each group's first matching rule is looked up
+in a table indexed by the regions of the vitals it reads, built once when compiling.
+
+The file is re-read when it changes (checked at most every check_interval seconds); a
+table that fails to compile is reported and the previous one stays in use.
+"""
+import bisect
+import json
+import logging
+import operator
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Value the rules use for a key missing from a single reading (predict_health)
+RULE_DEFAULTS = {
+    'heart_rate': 80,
+    'blood_pressure_systolic': 120,
+    'blood_pressure_diastolic': 80,
+    'spo2': 98,
+    'temperature': 36.6,
+    'glucose': 100,
+}
+
+# Readings up to which evaluate() matches one reading at a time instead of with arrays
+SCALAR_ROWS = 16
+# Largest lookup table built per group; beyond it (or for NaN) the group compares rule by rule
+MAX_LOOKUP = 4096
+
+OPERATORS = {'<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge}
+
+_COMPARISON = re.compile(r'^\s*(\w+)\s*(<=|>=|<|>)\s*(-?\d+(?:\.\d+)?)\s*$')
+
+
+def _parse_comparison(text):
+    match = _COMPARISON.match(text)
+    if match is None:
+        raise ValueError(f"Invalid comparison {text!r}, expected e.g. 'spo2 < 92'")
+    key, op, threshold = match.groups()
+    return key, op, float(threshold)
+
+
+def _first_match(start, alternatives, regions):
+    """Index of the first rule with an alternative whose comparisons all hold, -1 for none."""
+    for r, rule in enumerate(alternatives):
+        for alternative in rule:
+            if all(regions[column] is not None and op(regions[column], bound) for column, op, bound in alternative):
+                return start + r
+    return -1
+
+
+# --- Compiled rules ---
+class CompiledRules:
+    """One rules table compiled for readings whose columns are the payload keys in `columns`."""
+
+    def __init__(self, table, columns):
+        self.columns = list(columns)
+        self.rules = []  # (condition, probability or None, model_factor or None, severity, icon)
+        self.groups = []  # (name, first rule, end rule)
+        predicates = {}  # (column, op, threshold) -> predicate index
+        clauses = []  # Predicate indices per alternative
+        clause_rule = []  # Rule index per alternative
+        rule_clauses = []  # (column, op, threshold) comparisons per alternative, per rule
+
+        for group in table['groups']:
+            start = len(self.rules)
+            for rule in group['rules']:
+                if ('probability' in rule) == ('model_factor' in rule):
+                    raise ValueError(f"Rule {rule.get('condition')!r} needs exactly one of 'probability' or 'model_factor'")
+                rule_clauses.append([])
+                for alternative in rule['when']:
+                    indices, comparisons = [], []
+                    for text in alternative:
+                        key, op, threshold = _parse_comparison(text)
+                        if key not in self.columns:
+                            raise ValueError(f"Unknown vital {key!r} in rule {rule['condition']!r}")
+                        predicate = (self.columns.index(key), op, threshold)
+                        indices.append(predicates.setdefault(predicate, len(predicates)))
+                        comparisons.append(predicate)
+                    clauses.append(indices)
+                    clause_rule.append(len(self.rules))
+                    rule_clauses[-1].append(comparisons)
+                self.rules.append((rule['condition'], rule.get('probability'), rule.get('model_factor'),
+                                   rule['severity'], rule['icon']))
+            self.groups.append((group.get('name'), start, len(self.rules)))
+        normal = table['normal']
+        self.normal = (normal['condition'], normal['severity'], normal['icon'])
+
+        # --- Thresholds: one sorted array per vital, predicates as positions in it ---
+        n_predicates = len(predicates)
+        self.thresholds = {}
+        self.pred_column = np.empty(n_predicates, dtype=np.intp)
+        self.pred_position = np.empty(n_predicates, dtype=np.intp)
+        self.pred_left = np.empty(n_predicates, dtype=bool)  # Compare the left or the right insertion index
+        self.pred_above = np.empty(n_predicates, dtype=bool)  # True for > and >=
+        for (column, _, threshold) in predicates:
+            self.thresholds.setdefault(column, set()).add(threshold)
+        self.thresholds = {column: np.array(sorted(values)) for column, values in self.thresholds.items()}
+        for (column, op, threshold), k in predicates.items():
+            self.pred_column[k] = column
+            self.pred_position[k] = np.searchsorted(self.thresholds[column], threshold)
+            # x >= t <=> right index > pos, x > t <=> left index > pos; < and <= are their negations
+            self.pred_left[k] = op in ('>', '<=')
+            self.pred_above[k] = op in ('>', '>=')
+
+        # --- Alternatives and rules as 0/1 matrices ---
+        self.clause_matrix = np.zeros((n_predicates, len(clauses)), dtype=np.float32)
+        for c, indices in enumerate(clauses):
+            self.clause_matrix[indices, c] = 1.0
+        self.clause_sizes = self.clause_matrix.sum(axis=0)
+        self.rule_matrix = np.zeros((len(clauses), len(self.rules)), dtype=np.float32)
+        self.rule_matrix[np.arange(len(clauses)), clause_rule] = 1.0
+
+        # --- Scalar path: comparisons against regions between thresholds ---
+        # bisect_left + bisect_right over a vital's sorted thresholds is 2p + 1 exactly when the value
+        # equals the threshold at position p and even between thresholds, so x op t <=> region op 2p + 1
+        self.scalar_thresholds = [(column, thresholds.tolist()) for column, thresholds in self.thresholds.items()]
+        bounds = {(column, threshold): 2 * p + 1
+                  for column, thresholds in self.scalar_thresholds for p, threshold in enumerate(thresholds)}
+        self.scalar_groups = []  # Per group: ((column, stride) per vital it reads, lookup table or None, first rule, alternatives)
+        for _, start, end in self.groups:
+            alternatives = [[[(column, OPERATORS[op], bounds[column, threshold]) for column, op, threshold in comparisons]
+                             for comparisons in rule_clauses[r]] for r in range(start, end)]
+            group_columns = sorted({column for rule in alternatives for alternative in rule for column, _, _ in alternative})
+            strides, size = [], 1
+            for column in group_columns:
+                strides.append((column, size))
+                size *= 2 * len(self.thresholds[column]) + 1
+            table = None
+            if size <= MAX_LOOKUP:
+                table = [_first_match(start, alternatives, {column: index // stride % (2 * len(self.thresholds[column]) + 1)
+                                                            for column, stride in strides})
+                         for index in range(size)]
+            self.scalar_groups.append((strides, table, start, alternatives))
+
+    def match(self, raw):
+        """(n_readings, n_groups) index of the rule each group reports per reading, -1 for none."""
+        n = len(raw)
+        left = np.zeros((n, len(self.columns)), dtype=np.intp)
+        right = np.zeros((n, len(self.columns)), dtype=np.intp)
+        for column, thresholds in self.thresholds.items():
+            left[:, column] = np.searchsorted(thresholds, raw[:, column], side='left')
+            right[:, column] = np.searchsorted(thresholds, raw[:, column], side='right')
+        index = np.where(self.pred_left, left[:, self.pred_column], right[:, self.pred_column])
+        # NaN sorts after every threshold, but like the if/elif chain no comparison with NaN holds
+        holds = ((index > self.pred_position) == self.pred_above) & ~np.isnan(raw[:, self.pred_column])
+
+        clause_holds = (holds.astype(np.float32) @ self.clause_matrix) == self.clause_sizes
+        rule_holds = (clause_holds.astype(np.float32) @ self.rule_matrix) > 0
+        choices = np.full((n, len(self.groups)), -1, dtype=np.intp)
+        for g, (_, start, end) in enumerate(self.groups):
+            group = rule_holds[:, start:end]
+            choices[:, g] = np.where(group.any(axis=1), start + group.argmax(axis=1), -1)
+        return choices
+
+    def match_row(self, values):
+        """match() for one reading given as a list, without building arrays."""
+        regions = [None] * len(self.columns)
+        for column, thresholds in self.scalar_thresholds:
+            value = values[column]
+            if value == value:  # Like the array path, no comparison with NaN holds
+                regions[column] = bisect.bisect_left(thresholds, value) + bisect.bisect_right(thresholds, value)
+        choices = []
+        for strides, table, start, alternatives in self.scalar_groups:
+            if table is not None:
+                index = 0
+                for column, stride in strides:
+                    region = regions[column]
+                    if region is None:
+                        break
+                    index += region * stride
+                else:
+                    choices.append(table[index])
+                    continue
+            choices.append(_first_match(start, alternatives, regions))
+        return choices
+
+    def evaluate(self, raw, combined_prob):
+        """Prediction lists for every row of `raw`, given the model probability of each reading."""
+        if len(raw) <= SCALAR_ROWS:
+            choices = [self.match_row(values) for values in raw.tolist()]
+        else:
+            choices = self.match(raw).tolist()
+        normal_condition, normal_severity, normal_icon = self.normal
+        results = []
+        for i, row in enumerate(choices):
+            predictions_list = []
+            for r in row:
+                if r < 0:
+                    continue
+                condition, probability, factor, severity, icon = self.rules[r]
+                if probability is None:
+                    probability = combined_prob[i] * factor
+                predictions_list.append({'condition': condition, 'probability': probability, 'severity': severity, 'icon': icon})
+            if not predictions_list:
+                predictions_list.append({'condition': normal_condition, 'probability': 1.0 - combined_prob[i],
+                                         'severity': normal_severity, 'icon': normal_icon})
+            results.append(predictions_list)
+        return results
+
+
+# --- Rules engine ---
+class RulesEngine:
+    """The compiled rules of a table file, recompiled when the file changes."""
+
+    def __init__(self, path, columns, check_interval=1.0):
+        self.path = path
+        self.columns = list(columns)
+        self.check_interval = check_interval
+        self.rules = None
+        self.mtime = None
+        self.loaded_at = None
+        self.reloads = 0
+        self.reload_errors = 0
+        self._next_check = 0.0
+        self._failed_mtime = None
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """Compiles the table file and swaps it in; raises if the file is missing or invalid."""
+        with self._lock:
+            mtime = os.path.getmtime(self.path)
+            with open(self.path) as f:
+                rules = CompiledRules(json.load(f), self.columns)
+            # Callers holding the previous table finish with it
+            self.rules, self.mtime, self.loaded_at = rules, mtime, time.time()
+            self.reloads += 1
+        logger.info("Loaded %d condition rules from %s", len(rules.rules), self.path)
+        return rules
+
+    def maybe_reload(self):
+        """Reloads the table if its file changed; on error the current table is kept."""
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.check_interval
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return  # Briefly missing while an editor replaces it
+        if mtime == self.mtime or mtime == self._failed_mtime:
+            return
+        try:
+            self.load()
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            self._failed_mtime = mtime  # Retried once the file changes again
+            self.reload_errors += 1
+            logger.error("Error reloading condition rules from %s, keeping the previous rules: %r", self.path, e)
+
+    def row(self, metrics):
+        """A single reading as a (1, n_columns) raw matrix; keys it lacks take RULE_DEFAULTS."""
+        row = np.empty((1, len(self.columns)), dtype=np.float64)
+        for j, key in enumerate(self.columns):
+            value = metrics.get(key, RULE_DEFAULTS.get(key))
+            if not isinstance(value, (int, float)):
+                raise TypeError(f"'{key}' must be a number, got {value!r}")
+            row[0, j] = value
+        return row
+
+    def evaluate(self, raw, combined_prob):
+        self.maybe_reload()
+        return self.rules.evaluate(raw, np.asarray(combined_prob).reshape(-1))
+
+    def info(self):
+        rules = self.rules
+        return {
+            'path': self.path,
+            'rules': len(rules.rules),
+            'groups': [name for name, _, _ in rules.groups],
+            'loaded_at': self.loaded_at,
+            'reloads': self.reloads,
+            'reload_errors': self.reload_errors,
+        }
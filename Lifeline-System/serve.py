@@ -0,0 +1,116 @@
+"""
+Production entry point: HTTP and WebSocket served side by side.
+
+Single process (the default): the WebSocket hub runs on the asyncio event loop in the main
+thread and the Flask app is served by a WSGI server whose requests run on a fixed thread
+pool, so a slow /predict never blocks WebSocket relaying:
+    python serve.py --threads 16
+
+Several processes: gunicorn serves HTTP with N workers (gthread worker class). Each worker
+also runs the WebSocket server on its own event loop thread, all bound to the same port
+with SO_REUSEPORT, and their hubs are linked through a local broker (broker.py) so every
+dashboard sees every device whichever worker it landed on:
+    python serve.py --workers 4
+which runs `gunicorn -c gunicorn.conf.py app:app` with the matching settings.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import ThreadedWSGIServer
+
+logger = logging.getLogger(__name__)
+
+
+def default_broker_path(ws_port):
+    return os.path.join(tempfile.gettempdir(), f'lifeline-broker-{ws_port}.sock')
+
+
+# --- WebSocket server ---
+async def serve_websocket(hub, host, port, reuse_port=False, broker_path=None):
+    """Runs the WebSocket server for `hub` until cancelled, linked to the broker if given."""
+    import websockets
+    from broker import BrokerLink
+
+    if broker_path is not None:
+        # The broker records the history of every worker's devices; this worker asks it for /history
+        hub.bridge = BrokerLink(hub, broker_path, history=hub.store is not None).start()
+        hub.store = None
+    async with websockets.serve(hub.handle, host, port, reuse_port=reuse_port):
+        logger.info("WebSocket server listening on %s:%s (pid %d)", host, port, os.getpid())
+        await asyncio.Future()
+
+
+def start_websocket_thread(hub, host, port, reuse_port=False, broker_path=None):
+    """Runs serve_websocket() on its own event loop in a daemon thread, used inside gunicorn workers."""
+    thread = threading.Thread(target=asyncio.run, args=(serve_websocket(hub, host, port, reuse_port, broker_path),),
+                              name='websocket-server', daemon=True)
+    thread.start()
+    return thread
+
+
+# --- HTTP server ---
+class PooledWSGIServer(ThreadedWSGIServer):
+    """Werkzeug WSGI server that handles requests on a bounded thread pool instead of a thread per request."""
+
+    def __init__(self, host, port, app, threads=8):
+        super().__init__(host, port, app)
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='http')
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.process_request_thread, request, client_address)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=False)
+
+
+def run_single_process(flask_app, hub, host='0.0.0.0', http_port=5000, ws_port=5001, threads=8):
+    http_server = PooledWSGIServer(host, http_port, flask_app, threads)
+    threading.Thread(target=http_server.serve_forever, name='http-server', daemon=True).start()
+    logger.info("HTTP server listening on %s:%s with %d threads", host, http_port, threads)
+    try:
+        asyncio.run(serve_websocket(hub, host, ws_port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        http_server.shutdown()
+        http_server.server_close()
+
+
+def run_gunicorn(host, http_port, ws_port, workers, threads):
+    """Replaces this process with gunicorn, configured through gunicorn.conf.py."""
+    os.environ.update({
+        'LIFELINE_BIND': f'{host}:{http_port}',
+        'LIFELINE_WS_HOST': host,
+        'LIFELINE_WS_PORT': str(ws_port),
+        'LIFELINE_WORKERS': str(workers),
+        'LIFELINE_HTTP_THREADS': str(threads),
+    })
+    config = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gunicorn.conf.py')
+    os.execvp('gunicorn', ['gunicorn', '-c', config, 'app:app'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the Lifeline HTTP and WebSocket servers.")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--http-port', type=int, default=5000)
+    parser.add_argument('--ws-port', type=int, default=5001)
+    parser.add_argument('--workers', type=int, default=1, help="Worker processes; more than 1 runs under gunicorn")
+    parser.add_argument('--threads', type=int, default=8, help="HTTP request threads per worker")
+    args = parser.parse_args(argv)
+
+    if args.workers > 1:
+        run_gunicorn(args.host, args.http_port, args.ws_port, args.workers, args.threads)
+    else:
+        import app
+        run_single_process(app.app, app.hub, args.host, args.http_port, args.ws_port, args.threads)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,170 @@
+"""
+Streaming inference stage for the WebSocket hub.
+
+Device readings are scored as they arrive instead of waiting for the dashboard to POST
+them back to /predict. Readings are collected for one tick, scored together with
+predict_health_batch on a worker thread (never on the event loop), and each reading is
+then broadcast with "predictions" and "model_version" fields. With an early-warning evaluator, every scoreable
+reading also updates its device's sustained and trend rules and carries an "alerts" field.
+
+A device whose vitals have not moved beyond `tolerance` since its last scored reading
+reuses those predictions instead of being scored again. The default tolerance of 0 only
+skips exact repeats; a larger tolerance trades up to that much lag on threshold
+crossings for fewer model runs. The last reading of at most `max_devices` devices is kept,
+and a device silent for `idle_timeout` seconds is dropped.
+"""
+import asyncio
+import collections
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from preprocessing import INPUT_KEYS
+
+logger = logging.getLogger(__name__)
+
+# Allowed absolute change per vital before a device is re-scored
+DEFAULT_TOLERANCE = {key: 0.0 for key in INPUT_KEYS.values()}
+
+
+class _DeviceState:
+    __slots__ = ('vitals', 'predictions', 'version', 'seen_at')
+
+    def __init__(self, vitals, predictions, version=None, seen_at=0.0):
+        self.vitals = vitals
+        self.predictions = predictions  # None until the batch that scores it finishes
+        self.version = version  # Model version the predictions come from
+        self.seen_at = seen_at  # When the device's latest reading arrived
+
+
+# --- Stream Scorer ---
+class StreamScorer:
+    """Scores device readings in per-tick batches and hands them back to the hub to broadcast."""
+
+    # stats() keys that only go up
+    COUNTERS = ('readings_scored', 'readings_reused', 'readings_unscored', 'batches', 'devices_evicted')
+
+    def __init__(self, hub, predictor, tick_ms=20.0, tolerance=None, executor=None, evaluator=None,
+                 max_devices=100000, idle_timeout=600.0):
+        self.hub = hub
+        self.predictor = predictor
+        self.evaluator = evaluator  # early_warning.EarlyWarningEvaluator with keys in predictor.feature_names order
+        self.tick = tick_ms / 1000.0
+        tolerance = {**DEFAULT_TOLERANCE, **(tolerance or {})}
+        # Same column order as the vitals validate_batch returns
+        self.tolerance = np.array([tolerance[INPUT_KEYS[name]] for name in predictor.feature_names], dtype=np.float64)
+        self.executor = executor or ThreadPoolExecutor(max_workers=1, thread_name_prefix='stream-scoring')
+        self.max_devices = max_devices
+        self.idle_timeout = idle_timeout
+        self._pending = []
+        self._devices = collections.OrderedDict()  # Topic -> _DeviceState, least recently seen first
+        self._task = None
+        self.readings_scored = 0
+        self.readings_reused = 0
+        self.readings_unscored = 0
+        self.batches = 0
+        self.last_batch_ms = 0.0
+        self.devices_evicted = 0
+
+    def submit(self, topic, data, sender=None):
+        """Queues a reading for the next tick; called by the hub on the event loop."""
+        self._pending.append((topic, data, sender, time.time()))
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        while self._pending:
+            await asyncio.sleep(self.tick)
+            batch, self._pending = self._pending, []
+            try:
+                await self._score_and_publish(batch)
+            except Exception as e:
+                # Never lose readings: relay them without predictions
+                logger.exception("Error scoring streamed readings: %s", e)
+                self._devices = collections.OrderedDict(
+                    (topic, state) for topic, state in self._devices.items() if state.predictions is not None)
+                for topic, data, sender, _ in batch:
+                    self.hub.publish_reading(topic, data, sender=sender)
+
+    def _vitals(self, data):
+        """The reading's vitals as an array, or None if it cannot be scored."""
+        try:
+            return self.predictor.validate_batch([data])[0]
+        except ValueError:
+            return None
+
+    def _evaluate_and_score(self, models, readings, topics, times, vitals):
+        """Runs on the executor: early-warning rules for every scoreable reading, the models for `readings` only."""
+        alerts = self.evaluator.update_batch(topics, times, vitals) if self.evaluator is not None and topics else None
+        return self.predictor.predict_health_batch(readings, models=models) if readings else [], alerts
+
+    async def _score_and_publish(self, batch):
+        to_score = []  # Readings that need the models
+        refs = []      # Per reading: the _DeviceState its predictions come from, or None
+        valid = []     # (index in batch, topic, received at, vitals) of every scoreable reading
+        models = self.predictor.models
+        version = models.version if models is not None else None
+        for i, (topic, data, _, received_at) in enumerate(batch):
+            vitals = self._vitals(data)
+            if vitals is None:
+                refs.append(None)
+                continue
+            valid.append((i, topic, received_at, vitals))
+            state = self._devices.get(topic)
+            # Predictions of a model version that has since been replaced are never reused
+            if state is None or state.version != version or np.any(np.abs(vitals - state.vitals) > self.tolerance):
+                state = _DeviceState(vitals, None, version)
+                self._devices[topic] = state
+                to_score.append((data, state))
+            state.seen_at = received_at
+            self._devices.move_to_end(topic)
+            refs.append(state)
+        self._evict(time.time())
+
+        alerts = None
+        if to_score or (valid and self.evaluator is not None):
+            started_at = time.perf_counter()
+            loop = asyncio.get_running_loop()
+            results, alerts = await loop.run_in_executor(
+                self.executor, self._evaluate_and_score, models, [data for data, _ in to_score],
+                [topic for _, topic, _, _ in valid], [received_at for _, _, received_at, _ in valid],
+                [vitals for _, _, _, vitals in valid])
+            for (_, state), predictions in zip(to_score, results):
+                state.predictions = predictions
+            self.last_batch_ms = (time.perf_counter() - started_at) * 1000.0
+            self.batches += 1
+        if alerts is not None:
+            for (i, _, _, _), reading_alerts in zip(valid, alerts):
+                batch[i][1]['alerts'] = reading_alerts
+
+        for (topic, data, sender, _), state in zip(batch, refs):
+            if state is None:
+                self.readings_unscored += 1
+            else:
+                data['predictions'] = state.predictions
+                data['model_version'] = state.version
+            self.hub.publish_reading(topic, data, sender=sender)
+        self.readings_scored += len(to_score)
+        self.readings_reused += sum(state is not None for state in refs) - len(to_score)
+
+    def _evict(self, now):
+        """Drops devices silent for idle_timeout, then the least recently seen beyond max_devices."""
+        devices = self._devices
+        while devices and (len(devices) > self.max_devices
+                           or next(iter(devices.values())).seen_at < now - self.idle_timeout):
+            devices.popitem(last=False)  # Readings in flight keep their own reference to the state
+            self.devices_evicted += 1
+
+    def stats(self):
+        return {
+            'readings_scored': self.readings_scored,
+            'readings_reused': self.readings_reused,
+            'readings_unscored': self.readings_unscored,
+            'batches': self.batches,
+            'last_batch_ms': self.last_batch_ms,
+            'devices': len(self._devices),
+            'devices_evicted': self.devices_evicted,
+            'pending': len(self._pending),
+        }
@@ -0,0 +1,37 @@
+import numpy as np
+from health_ai import HealthAIPredictor
+
+N_READINGS = 500
+# Batch sizes a reading may land in: alone, in small micro-batches, in one large /predict/batch call
+BATCH_SIZES = [1, 2, 7, 64, N_READINGS]
+
+# Load the models as the server does, with the compiled forest and the NumPy network
+try:
+    health_predictor = HealthAIPredictor(compiled_rf=True, numpy_nn=True)
+except BaseException as e:
+    print(f"Error loading models: {e}")
+    exit(1)
+
+# Random readings spanning the clipped input ranges, rounded like device values
+rng = np.random.default_rng(42)
+keys = ['heart_rate', 'blood_pressure_systolic', 'blood_pressure_diastolic', 'spo2', 'temperature', 'glucose']
+values = rng.uniform([30, 70, 40, 70, 34, 40], [180, 200, 130, 100, 41, 400], size=(N_READINGS, len(keys))).round(1)
+readings = [dict(zip(keys, map(float, row))) for row in values]
+
+expected = [health_predictor.predict_health(metrics) for metrics in readings]
+
+failed = False
+for size in BATCH_SIZES:
+    actual = []
+    for start in range(0, N_READINGS, size):
+        actual.extend(health_predictor.predict_health_batch(readings[start:start + size]))
+    mismatches = [i for i in range(N_READINGS) if actual[i] != expected[i]]
+    status = "OK" if not mismatches else "FAILED"
+    failed = failed or bool(mismatches)
+    print(f"batches of {size}: {N_READINGS} readings, {len(mismatches)} differ from predict_health [{status}]")
+    for i in mismatches[:5]:
+        print(f"  {readings[i]}: expected {expected[i]}, got {actual[i]}")
+
+if failed:
+    exit(1)
+print("Batched predictions match single predictions.")
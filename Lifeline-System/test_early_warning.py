@@ -0,0 +1,50 @@
+import numpy as np
+from early_warning import EarlyWarningEvaluator
+
+KEYS = ['heart_rate', 'spo2', 'temperature', 'blood_pressure_systolic']
+NORMAL = [80, 98, 37, 120]
+
+
+def feed(evaluator, readings, patient_id='bed-1'):
+    """Alert conditions after each (timestamp, vitals) reading, one update_batch call per reading."""
+    return [[alert['condition'] for alert in evaluator.update_batch([patient_id], [t], [vitals])[0]]
+            for t, vitals in readings]
+
+
+failed = False
+
+
+def check(name, ok):
+    global failed
+    failed = failed or not ok
+    print(f"{name} [{'OK' if ok else 'FAILED'}]")
+
+
+# spo2 < 92 fires once it has held for 30 s, and not before
+hypoxia = [(t, [80, 88, 37, 120]) for t in range(0, 41, 5)]
+conditions = feed(EarlyWarningEvaluator(keys=KEYS), hypoxia)
+check("sustained rule fires after its duration",
+      all('Sustained Hypoxia' not in c for c in conditions[:6]) and all('Sustained Hypoxia' in c for c in conditions[6:]))
+
+# A gap longer than max_gap starts the duration over
+gapped = hypoxia[:5] + [(t + 60, vitals) for t, vitals in hypoxia[5:]]
+conditions = feed(EarlyWarningEvaluator(keys=KEYS, max_gap=15.0), gapped)
+check("gap longer than max_gap resets the patient", all('Sustained Hypoxia' not in c for c in conditions))
+
+# Heart rate climbing 30/min fires the trend rule
+rising = [(t, [80 + t / 2, 98, 37, 120]) for t in range(0, 61, 5)]
+conditions = feed(EarlyWarningEvaluator(keys=KEYS), rising)
+check("trend rule fires on a rising vital", 'Rising Heart Rate' in conditions[-1])
+
+# A reading older than the previous one resets the patient: what follows matches a patient starting with it
+stale = [(20, NORMAL)] + [(t, [80 + (t - 20) / 2, 98, 37, 120]) for t in range(25, 61, 5)]
+evaluator = EarlyWarningEvaluator(keys=KEYS)
+feed(evaluator, rising)
+actual = feed(evaluator, stale)
+expected = feed(EarlyWarningEvaluator(keys=KEYS), stale)
+slopes = [alert.get('slope_per_min', 0.0) for alert in evaluator.update_batch(['bed-1'], [65], [NORMAL])[0]]
+check("out-of-order reading resets the patient", actual == expected and all(np.isfinite(slopes)))
+
+if failed:
+    exit(1)
+print("Early-warning rules behave as expected.")
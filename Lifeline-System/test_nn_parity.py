@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+from tensorflow import keras
+from nn_engine import DenseNetwork, export_h5_model
+
+# Largest difference allowed between Keras and the NumPy kernel (both run in float32)
+TOLERANCE = 1e-5
+
+# Load the Keras model and the NumPy kernel (ensure the paths are correct)
+try:
+    keras_model = keras.models.load_model('models/neural_network.h5', compile=False)
+    try:
+        numpy_model = DenseNetwork.load('models/neural_network.npz')
+    except FileNotFoundError:
+        print("models/neural_network.npz not found, reading weights from the .h5 file instead.")
+        numpy_model = export_h5_model('models/neural_network.h5')
+except Exception as e:
+    print(f"Error loading models: {e}")
+    exit(1)
+
+# Compare on the training data and on random rows spanning the clipped input ranges
+data = pd.read_csv('health_data.csv')
+features = data[['heart_rate', 'systolic_bp', 'diastolic_bp', 'spo2', 'temperature', 'glucose']].fillna(0).to_numpy()
+rng = np.random.default_rng(42)
+random_rows = rng.uniform([0, 0, 0, 0, 30, 0], [200, 300, 200, 100, 45, 500], size=(1000, 6))
+
+failed = False
+for name, X in [('health_data.csv', features), ('random rows', random_rows), ('single row', features[:1])]:
+    expected = keras_model.predict(X, verbose=0)
+    actual = numpy_model.predict(X)
+    max_diff = float(np.max(np.abs(expected - actual)))
+    status = "OK" if expected.shape == actual.shape and max_diff <= TOLERANCE else "FAILED"
+    failed = failed or status == "FAILED"
+    print(f"{name}: {len(X)} rows, max abs difference {max_diff:.3g} [{status}]")
+
+if failed:
+    exit(1)
+print("NumPy kernel matches the Keras model.")
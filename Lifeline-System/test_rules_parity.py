@@ -0,0 +1,122 @@
+import numpy as np
+from preprocessing import INPUT_KEYS
+from rules_engine import RulesEngine, RULE_DEFAULTS, SCALAR_ROWS
+
+
+# The if/elif chain predict_health used before the rules moved to condition_rules.json
+def legacy_conditions(metrics, combined_prob):
+    hr = metrics.get('heart_rate', 80)
+    sys_bp = metrics.get('blood_pressure_systolic', 120)
+    dias_bp = metrics.get('blood_pressure_diastolic', 80)
+    spo2 = metrics.get('spo2', 98)
+    temp = metrics.get('temperature', 36.6)
+    glucose = metrics.get('glucose', 100)
+
+    predictions_list = []
+
+    # Blood Pressure
+    if sys_bp >= 180 or dias_bp >= 120:
+        predictions_list.append({'condition': 'Hypertensive Crisis', 'probability': 0.95, 'severity': 'critical', 'icon': 'fas fa-heart-attack'})
+    elif sys_bp >= 140 or dias_bp >= 90:
+        predictions_list.append({'condition': 'Hypertension', 'probability': combined_prob * 0.8, 'severity': 'high', 'icon': 'fas fa-heart'})
+    elif sys_bp < 90 or dias_bp < 60:
+        predictions_list.append({'condition': 'Hypotension', 'probability': combined_prob * 0.7, 'severity': 'medium', 'icon': 'fas fa-tint'})
+    elif sys_bp > 120 and sys_bp < 140 or dias_bp > 80 and dias_bp < 90:
+        predictions_list.append({'condition': 'Elevated Blood Pressure', 'probability': combined_prob * 0.6, 'severity': 'medium', 'icon': 'fas fa-arrow-up'})
+
+    # Oxygen Saturation
+    if spo2 < 88:
+        predictions_list.append({'condition': 'Severe Hypoxia', 'probability': 0.9, 'severity': 'critical', 'icon': 'fas fa-lungs'})
+    elif spo2 < 92:
+        predictions_list.append({'condition': 'Hypoxia', 'probability': combined_prob * 0.7, 'severity': 'high', 'icon': 'fas fa-lungs'})
+    elif spo2 < 95:
+        predictions_list.append({'condition': 'Low Oxygen Saturation', 'probability': combined_prob * 0.5, 'severity': 'medium', 'icon': 'fas fa-thermometer-quarter'})
+
+    # Temperature
+    if temp >= 41:
+        predictions_list.append({'condition': 'Hyperthermia', 'probability': combined_prob * 0.7, 'severity': 'critical', 'icon': 'fas fa-thermometer-full'})
+    elif temp >= 39.5:
+        predictions_list.append({'condition': 'Hyperthermia', 'probability': combined_prob * 0.7, 'severity': 'high', 'icon': 'fas fa-thermometer-half'})
+    elif temp >= 38:
+        predictions_list.append({'condition': 'Fever', 'probability': combined_prob * 0.5, 'severity': 'medium', 'icon': 'fas fa-thermometer-quarter'})
+    elif temp < 35:
+        predictions_list.append({'condition': 'Hypothermia', 'probability': combined_prob * 0.6, 'severity': 'medium', 'icon': 'fas fa-snowflake'})
+
+    # Glucose
+    if glucose >= 300:
+        predictions_list.append({'condition': 'Severe Hyperglycemia', 'probability': 0.9, 'severity': 'critical', 'icon': 'fas fa-burn'})
+    elif glucose >= 200:
+        predictions_list.append({'condition': 'Hyperglycemia', 'probability': combined_prob * 0.7, 'severity': 'high', 'icon': 'fas fa-burn'})
+    elif glucose < 70:
+        predictions_list.append({'condition': 'Hypoglycemia', 'probability': combined_prob * 0.7, 'severity': 'medium', 'icon': 'fas fa-burn'})
+
+    # Heart Rate
+    if hr >= 150:
+        predictions_list.append({'condition': 'Severe Tachycardia', 'probability': 0.85, 'severity': 'critical', 'icon': 'fas fa-heartbeat'})
+    elif hr >= 100:
+        predictions_list.append({'condition': 'Tachycardia', 'probability': combined_prob * 0.6, 'severity': 'medium', 'icon': 'fas fa-heartbeat'})
+    elif hr <= 40:
+        predictions_list.append({'condition': 'Severe Bradycardia', 'probability': 0.85, 'severity': 'critical', 'icon': 'fas fa-heartbeat'})
+    elif hr <= 60:
+        predictions_list.append({'condition': 'Bradycardia', 'probability': combined_prob * 0.6, 'severity': 'medium', 'icon': 'fas fa-heartbeat'})
+
+    if not predictions_list:
+        predictions_list.append({'condition': 'Normal', 'probability': 1.0 - combined_prob, 'severity': 'low', 'icon': 'fas fa-check-circle'})
+    return predictions_list
+
+
+# Readings concentrated on and around every threshold of the chain, plus NaN and missing vitals
+THRESHOLDS = {
+    'blood_pressure_systolic': [90, 120, 140, 180],
+    'blood_pressure_diastolic': [60, 80, 90, 120],
+    'spo2': [88, 92, 95],
+    'temperature': [35, 38, 39.5, 41],
+    'glucose': [70, 200, 300],
+    'heart_rate': [40, 60, 100, 150],
+}
+N_READINGS = 5000
+
+try:
+    engine = RulesEngine('condition_rules.json', list(INPUT_KEYS.values()))
+except Exception as e:
+    print(f"Error loading condition rules: {e}")
+    exit(1)
+
+rng = np.random.default_rng(42)
+readings = []
+for _ in range(N_READINGS):
+    metrics = {}
+    for key, thresholds in THRESHOLDS.items():
+        kind = rng.random()
+        if kind < 0.02:
+            continue  # Missing: both sides fall back to RULE_DEFAULTS
+        elif kind < 0.04:
+            metrics[key] = float('nan')
+        elif kind < 0.5:
+            metrics[key] = float(rng.choice(thresholds) + rng.choice([-1, -0.1, 0, 0, 0.1, 1]))
+        else:
+            metrics[key] = float(rng.uniform(0.5 * min(thresholds), 1.5 * max(thresholds)))
+    readings.append(metrics)
+combined_prob = rng.random(N_READINGS)
+
+expected = [legacy_conditions(metrics, combined_prob[i]) for i, metrics in enumerate(readings)]
+raw = np.vstack([engine.row(metrics) for metrics in readings])
+assert set(RULE_DEFAULTS) == set(engine.columns)
+
+failed = False
+checks = [
+    (f"one at a time ({SCALAR_ROWS} rows or fewer use the scalar path)",
+     [engine.evaluate(raw[i:i + 1], combined_prob[i:i + 1])[0] for i in range(N_READINGS)]),
+    ("one batch (array path)", engine.evaluate(raw, combined_prob)),
+]
+for name, actual in checks:
+    mismatches = [i for i in range(N_READINGS) if actual[i] != expected[i]]
+    status = "OK" if not mismatches else "FAILED"
+    failed = failed or bool(mismatches)
+    print(f"{name}: {N_READINGS} readings, {len(mismatches)} differ from the if/elif chain [{status}]")
+    for i in mismatches[:5]:
+        print(f"  {readings[i]}: expected {expected[i]}, got {actual[i]}")
+
+if failed:
+    exit(1)
+print("Condition rules match the if/elif chain.")
@@ -0,0 +1,486 @@
+"""
+In-process time-series store for device readings.
+
+Every device (or patient) gets a bounded ring buffer of (timestamp, vitals) rows, so
+memory stays flat however long it streams: the buffer grows with the first readings up to
+`capacity` rows, after which the oldest row is overwritten. The number of devices is bounded
+too: series idle for `idle_timeout` seconds are dropped, and at `max_series` the least
+recently updated one makes room for a new device. Optionally every row is also appended to a
+memory-mapped file per device, which keeps the full history on disk without holding it on the heap.
+Device ids come from clients, so the file is named after a hash of the id and the id itself is
+written next to it (<hash>.topic). Readings are recorded on event loops that relay frames for
+every client, so a store's spill files are opened and written by its own writer thread.
+
+Rolling statistics (count, mean, min, max, slope and EWMA per vital) are maintained
+incrementally for each configured time window: adding a reading and retiring the readings
+that left the window costs O(1) amortized, whatever the window length.
+"""
+import hashlib
+import logging
+import math
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+
+import numpy as np
+
+from preprocessing import INPUT_KEYS
+
+logger = logging.getLogger(__name__)
+
+# Vitals kept per reading, by payload key, in column order
+SERIES_KEYS = list(INPUT_KEYS.values())
+# Rolling statistics windows, in seconds
+DEFAULT_WINDOWS = (60.0, 300.0)
+INITIAL_ROWS = 64  # Rows a new series allocates; doubled as readings arrive, up to its capacity
+SPILL_QUEUE_SIZE = 100000  # Readings waiting for the spill writer before new ones are only kept in memory
+
+
+def _reading_values(data):
+    """The reading's vitals as floats, NaN where a key is missing or not a number."""
+    values = np.full(len(SERIES_KEYS), np.nan)
+    for j, key in enumerate(SERIES_KEYS):
+        value = data.get(key)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[j] = value
+    return values
+
+
+def spill_path(spill_dir, topic):
+    """Path of a device's spill file: a fixed-length name whatever the length or characters of the id."""
+    return os.path.join(spill_dir, hashlib.sha1(topic.encode('utf-8')).hexdigest() + '.bin')
+
+
+def downsample(times, values, max_points):
+    """
+    Averages the rows into at most max_points equal time buckets; empty buckets are left out
+    and a vital is NaN in a bucket where it was never reported.
+    """
+    if max_points is None or len(times) <= max_points:
+        return times, values
+    edges = np.linspace(times[0], times[-1], max_points + 1)[:-1]
+    starts = np.unique(np.searchsorted(times, edges))
+    counts = np.diff(np.append(starts, len(times)))
+    present = ~np.isnan(values)
+    sums = np.add.reduceat(np.where(present, values, 0.0), starts)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = sums / np.add.reduceat(present, starts)
+    return np.add.reduceat(times, starts) / counts, means
+
+
+# --- Rolling window ---
+class RollingWindow:
+    """
+    Running sums and monotonic min/max queues over the readings of the last `seconds`.
+    Readings are retired by sequence number, read back from the series' ring buffer. With six
+    vitals per reading, plain Python lists beat NumPy's per-call overhead here.
+    """
+
+    def __init__(self, series, seconds):
+        self.series = series
+        self.seconds = seconds
+        self.start = 0  # Sequence number of the oldest reading in the window
+        self.origin = None  # Timestamps are summed relative to this to keep the slope sums precise
+        n = len(SERIES_KEYS)
+        self.count = [0] * n
+        self.sum = [0.0] * n
+        self.sum_t = [0.0] * n
+        self.sum_tt = [0.0] * n
+        self.sum_tv = [0.0] * n
+        self.ewma = [None] * n
+        self.last_time = None
+        self._min = [deque() for _ in range(n)]  # (seq, value), values increasing
+        self._max = [deque() for _ in range(n)]  # (seq, value), values decreasing
+        self._removed = 0
+
+    def _accumulate(self, sign, timestamp, values):
+        t = timestamp - self.origin
+        for j, v in enumerate(values):
+            if v == v:  # Not NaN
+                self.count[j] += sign
+                self.sum[j] += sign * v
+                self.sum_t[j] += sign * t
+                self.sum_tt[j] += sign * t * t
+                self.sum_tv[j] += sign * t * v
+
+    def add(self, seq, timestamp, values):
+        if self.origin is None:
+            self.origin = timestamp
+        self._accumulate(1, timestamp, values)
+
+        # Time-aware EWMA with a time constant of one window
+        alpha = 1.0
+        if self.last_time is not None:
+            alpha = 1.0 - math.exp(-max(timestamp - self.last_time, 0.0) / self.seconds)
+        self.last_time = timestamp
+
+        for j, v in enumerate(values):
+            if v != v:
+                continue
+            ewma = self.ewma[j]
+            self.ewma[j] = v if ewma is None else ewma + alpha * (v - ewma)
+            queue = self._min[j]
+            while queue and queue[-1][1] >= v:
+                queue.pop()
+            queue.append((seq, v))
+            queue = self._max[j]
+            while queue and queue[-1][1] <= v:
+                queue.pop()
+            queue.append((seq, v))
+
+    def expire(self, now, first_kept, next_seq):
+        """Retires readings older than the window and those before first_kept, which the buffer overwrites."""
+        series = self.series
+        cutoff = now - self.seconds
+        while self.start < next_seq and (self.start < first_kept or series.times[self.start % series.capacity] < cutoff):
+            slot = self.start % series.capacity
+            self._accumulate(-1, series.times[slot], series.values[slot].tolist())
+            for queues in (self._min, self._max):
+                for queue in queues:
+                    if queue and queue[0][0] == self.start:
+                        queue.popleft()
+            self.start += 1
+            self._removed += 1
+        if self._removed >= series.capacity:
+            self._rebuild(next_seq)
+
+    def _rebuild(self, next_seq):
+        """Recomputes the sums from the buffer so rounding errors from add/remove never accumulate."""
+        series = self.series
+        self._removed = 0
+        slots = np.arange(self.start, next_seq) % series.capacity
+        self.origin = float(series.times[slots[0]]) if len(slots) else None
+        n = len(SERIES_KEYS)
+        self.count, self.sum, self.sum_t, self.sum_tt, self.sum_tv = [0] * n, [0.0] * n, [0.0] * n, [0.0] * n, [0.0] * n
+        for slot in slots:
+            self._accumulate(1, series.times[slot], series.values[slot].tolist())
+
+    def stats(self):
+        """Per vital: count, mean, min, max, slope (units per second) and EWMA over the window."""
+        result = {}
+        for j, key in enumerate(SERIES_KEYS):
+            count = self.count[j]
+            slope = None
+            if count > 1:
+                denominator = count * self.sum_tt[j] - self.sum_t[j] ** 2
+                if denominator > 0:
+                    slope = (count * self.sum_tv[j] - self.sum_t[j] * self.sum[j]) / denominator
+            result[key] = {
+                'count': count,
+                'mean': self.sum[j] / count if count else None,
+                'min': self._min[j][0][1] if self._min[j] else None,
+                'max': self._max[j][0][1] if self._max[j] else None,
+                'slope': slope,
+                'ewma': self.ewma[j],
+            }
+        return result
+
+
+# --- Spill file ---
+class SpillFile:
+    """
+    Append-only memory-mapped log of (timestamp, vitals) rows. The first row is a header
+    holding the row count, so an existing file is resumed rather than overwritten. A new file
+    records `topic` in a .topic file next to it.
+    """
+
+    def __init__(self, path, grow_rows=4096, topic=None):
+        self.path = path
+        self.grow_rows = grow_rows
+        self.n_columns = 1 + len(SERIES_KEYS)
+        if not os.path.exists(path):
+            if topic is not None:
+                with open(os.path.splitext(path)[0] + '.topic', 'w', encoding='utf-8') as f:
+                    f.write(topic)
+            with open(path, 'wb') as f:
+                f.truncate(8 * self.n_columns * (1 + grow_rows))
+        self._map()
+        self.count = int(self._rows[0, 0])
+
+    def _map(self):
+        self._rows = np.memmap(self.path, dtype=np.float64, mode='r+').reshape(-1, self.n_columns)
+
+    def append(self, timestamp, values):
+        if self.count + 1 >= len(self._rows):
+            self._rows.flush()
+            size = len(self._rows) + self.grow_rows
+            del self._rows
+            with open(self.path, 'r+b') as f:
+                f.truncate(8 * self.n_columns * size)
+            self._map()
+        row = self._rows[1 + self.count]
+        row[0] = timestamp
+        row[1:] = values
+        self.count += 1
+        self._rows[0, 0] = self.count
+
+    def read(self, start=None, end=None):
+        """(times, values) of the rows with start <= timestamp <= end."""
+        rows = self._rows[1:1 + self.count]
+        times = rows[:, 0]
+        lo = 0 if start is None else np.searchsorted(times, start, side='left')
+        hi = len(times) if end is None else np.searchsorted(times, end, side='right')
+        return np.array(times[lo:hi]), np.array(rows[lo:hi, 1:])
+
+    def close(self):
+        self._rows.flush()
+        del self._rows
+
+
+# --- Patient series ---
+class PatientSeries:
+    """
+    Ring buffer of one device's readings, its rolling windows and optional spill file. With a
+    `spill_queue` the spill file is opened, written and closed by whoever consumes the queue
+    (TimeSeriesStore's writer thread), else by the thread appending.
+    """
+
+    def __init__(self, capacity=3600, windows=DEFAULT_WINDOWS, spill_path=None, topic=None, spill_queue=None):
+        self.capacity = capacity
+        # Allocated rows; smaller than capacity until the first `capacity` readings, so slots never wrap before it is full
+        rows = min(capacity, INITIAL_ROWS)
+        self.times = np.zeros(rows, dtype=np.float64)
+        self.values = np.full((rows, len(SERIES_KEYS)), np.nan, dtype=np.float64)
+        self.next_seq = 0  # Sequence number of the next reading; the slot is next_seq % capacity
+        self.windows = {seconds: RollingWindow(self, seconds) for seconds in windows}
+        self.topic = topic
+        self.spill_path = spill_path or None  # None once closed, or when the file cannot be written
+        self.spill = None  # Opened with the first spilled reading
+        self.spill_dropped = 0  # Readings not spilled because the writer fell behind
+        self._spill_queue = spill_queue
+        self._spill_lock = threading.Lock()  # Guards the spill file; never held while self.lock is wanted
+        self.last_seen = time.monotonic()  # When the last reading was appended, for idle eviction
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return min(self.next_seq, self.capacity)
+
+    def _grow(self):
+        rows = min(self.capacity, 2 * len(self.times))
+        self.times = np.concatenate([self.times, np.zeros(rows - len(self.times))])
+        self.values = np.concatenate([self.values, np.full((rows - len(self.values), len(SERIES_KEYS)), np.nan)])
+
+    def append(self, timestamp, values):
+        with self.lock:
+            self.last_seen = time.monotonic()
+            for window in self.windows.values():
+                window.expire(timestamp, self.next_seq + 1 - self.capacity, self.next_seq)
+            if self.next_seq == len(self.times) < self.capacity:
+                self._grow()
+            slot = self.next_seq % self.capacity
+            self.times[slot] = timestamp
+            self.values[slot] = values
+            timestamp = float(timestamp)
+            for window in self.windows.values():
+                window.add(self.next_seq, timestamp, self.values[slot].tolist())
+            self.next_seq += 1
+            if self.spill_path is None:
+                return
+            if self._spill_queue is None:
+                self.write_spill(timestamp, values)
+                return
+            try:
+                self._spill_queue.put_nowait((self, timestamp, values))  # Under self.lock: spilled in append order
+            except queue.Full:
+                self.spill_dropped += 1
+
+    def write_spill(self, timestamp, values):
+        """Appends a reading to the spill file, opening it first; on error the series stops spilling."""
+        with self._spill_lock:
+            if self.spill_path is None:
+                return
+            try:
+                if self.spill is None:
+                    self.spill = SpillFile(self.spill_path, topic=self.topic)
+                self.spill.append(timestamp, values)
+            except OSError as e:
+                logger.error("Cannot write spill file %s for %r, keeping its history in memory only: %s",
+                             self.spill_path, self.topic, e)
+                self._close_spill()
+
+    def _close_spill(self):
+        # Called with self._spill_lock held
+        self.spill_path = None
+        if self.spill is not None:
+            self.spill.close()
+            self.spill = None
+
+    def close_spill(self):
+        with self._spill_lock:
+            self._close_spill()
+
+    def close(self):
+        """Closes the spill file once the readings queued before this call are written."""
+        if self._spill_queue is None:
+            self.close_spill()
+            return
+        try:
+            self._spill_queue.put_nowait((self, None, None))
+        except queue.Full:
+            self._spill_queue.put((self, None, None))  # Never leaks the open file
+
+    def read(self, start=None, end=None):
+        """(times, values) in time order; reaches into the spill file for rows the buffer no longer holds."""
+        with self.lock:
+            oldest = self.times[self.next_seq % self.capacity] if self.next_seq > self.capacity else self.times[0]
+            from_spill = self.spill_path is not None and self.next_seq > self.capacity and (start is None or start < oldest)
+            slots = np.arange(self.next_seq - len(self), self.next_seq) % self.capacity
+            times = self.times[slots]
+            values = self.values[slots]
+        if from_spill:
+            # Readings still queued for the writer are missing from the file; they are the latest ones
+            with self._spill_lock:
+                if self.spill is not None:
+                    return self.spill.read(start, end)
+        lo = 0 if start is None else np.searchsorted(times, start, side='left')
+        hi = len(times) if end is None else np.searchsorted(times, end, side='right')
+        return times[lo:hi], values[lo:hi]
+
+    def stats(self, now=None):
+        """Rolling statistics of every window, keyed by window length in seconds."""
+        now = time.time() if now is None else now
+        with self.lock:
+            for window in self.windows.values():
+                window.expire(now, self.next_seq - self.capacity, self.next_seq)
+            return {str(seconds): window.stats() for seconds, window in self.windows.items()}
+
+
+# --- Store ---
+class TimeSeriesStore:
+    """Per-topic PatientSeries, created on a device's first reading."""
+
+    def __init__(self, capacity=3600, windows=DEFAULT_WINDOWS, spill_dir=None, max_series=10000, idle_timeout=3600.0):
+        # capacity: readings kept in memory per device
+        # windows: rolling statistics windows in seconds
+        # spill_dir: directory for per-device append-only history files, None keeps memory only
+        # max_series: devices kept at most; a new one replaces the least recently updated
+        # idle_timeout: seconds without a reading after which a device's series is dropped (its spill file stays)
+        self.capacity = capacity
+        self.windows = tuple(windows)
+        self.spill_dir = spill_dir
+        self.max_series = max_series
+        self.idle_timeout = idle_timeout
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+        self.series = OrderedDict()  # Topic -> PatientSeries, least recently updated first
+        self._lock = threading.Lock()
+        self._next_sweep = time.monotonic() + idle_timeout
+        self.readings_recorded = 0
+        self.readings_ignored = 0
+        self.series_evicted = 0
+        self._spill_dropped_evicted = 0  # spill_dropped of the series evicted so far
+        self._spill_queue = None
+        if spill_dir:
+            self._spill_queue = queue.Queue(SPILL_QUEUE_SIZE)
+            threading.Thread(target=self._write_spills, name='history-spill', daemon=True).start()
+
+    def get(self, topic):
+        return self.series.get(topic)
+
+    def topics(self):
+        with self._lock:
+            return sorted(self.series)
+
+    def _write_spills(self):
+        while True:
+            series, timestamp, values = self._spill_queue.get()
+            try:
+                if timestamp is None:
+                    series.close_spill()
+                else:
+                    series.write_spill(timestamp, values)
+            except Exception as e:
+                logger.exception("Error writing the history of %r: %s", series.topic, e)
+            finally:
+                self._spill_queue.task_done()
+
+    def flush(self):
+        """Waits until every reading recorded so far is written to its spill file."""
+        if self._spill_queue is not None:
+            self._spill_queue.join()
+
+    def _evict(self, topics):
+        # Called with self._lock held
+        for topic in topics:
+            series = self.series.pop(topic)
+            series.close()
+            self._spill_dropped_evicted += series.spill_dropped
+        self.series_evicted += len(topics)
+
+    def evict_idle(self, now=None):
+        """Drops the series of devices that sent nothing for idle_timeout seconds."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._next_sweep = now + min(self.idle_timeout, 60.0)
+            idle = []
+            for topic, series in self.series.items():  # Least recently updated first
+                if now - series.last_seen <= self.idle_timeout:
+                    break
+                idle.append(topic)
+            self._evict(idle)
+
+    def _series_for(self, topic):
+        with self._lock:
+            series = self.series.get(topic)
+            if series is not None:
+                self.series.move_to_end(topic)
+                return series
+            if len(self.series) >= self.max_series:
+                self._evict([next(iter(self.series))])
+            path = spill_path(self.spill_dir, topic) if self.spill_dir else None
+            series = PatientSeries(self.capacity, self.windows, path, topic, self._spill_queue)
+            self.series[topic] = series
+        return series
+
+    def record(self, topic, data, timestamp=None):
+        """Appends a reading to its device's series; returns False if it carries no vitals."""
+        values = _reading_values(data)
+        if np.isnan(values).all():
+            self.readings_ignored += 1
+            return False
+        if time.monotonic() >= self._next_sweep:
+            self.evict_idle()
+        self._series_for(topic).append(time.time() if timestamp is None else timestamp, values)
+        self.readings_recorded += 1
+        return True
+
+    def history(self, topic, start=None, end=None, max_points=None):
+        """Readings of one device as JSON-ready rows [timestamp, *vitals], downsampled to max_points."""
+        series = self.series.get(topic)
+        if series is None:
+            return None
+        times, values = downsample(*series.read(start, end), max_points)
+        rows = np.column_stack([times, values]).tolist()
+        # JSON has no NaN: vitals a device did not report become null
+        return [[None if value != value else value for value in row] for row in rows]
+
+    def query(self, topic=None, start=None, end=None, max_points=None):
+        """
+        The /history response: without a topic the recorded devices and store counters,
+        else the device's readings and rolling statistics; None for an unknown device.
+        """
+        if topic is None:
+            return {'devices': self.topics(), **self.stats()}
+        series = self.series.get(topic)
+        readings = self.history(topic, start, end, max_points)
+        if series is None or readings is None:
+            return None
+        return {'device_id': topic, 'columns': ['timestamp'] + SERIES_KEYS, 'readings': readings, 'stats': series.stats()}
+
+    def stats(self):
+        with self._lock:
+            series = list(self.series.values())
+        return {
+            'series': len(series),
+            'capacity': self.capacity,
+            'max_series': self.max_series,
+            'windows': list(self.windows),
+            'readings_recorded': self.readings_recorded,
+            'readings_ignored': self.readings_ignored,
+            'series_evicted': self.series_evicted,
+            'spill_pending': self._spill_queue.qsize() if self._spill_queue is not None else 0,
+            'spill_dropped': self._spill_dropped_evicted + sum(s.spill_dropped for s in series),
+            'memory_bytes': sum(s.times.nbytes + s.values.nbytes for s in series),
+        }
@@ -1,77 +1,248 @@
+"""
+Trains the Random Forest and the neural network on health_data.csv and publishes them.
+
+The CSV is streamed in chunks with compact dtypes, so its size is not bounded by memory:
+each row is assigned to the training or test split as it is read, the scaler is fitted
+incrementally on training rows only, and a uniform sample of at most --max-train-rows
+training rows (--max-test-rows test rows) is kept for fitting.
+
+Retraining only some of the models (--models) keeps the others, so the data is then scaled
+with the statistics they were trained on (models/scaler.npz) instead of newly fitted ones.
+
+    python train_models.py                                  # both models, one after the other
+    python train_models.py --concurrent --n-jobs 8          # fit both at once, RF on 8 cores
+    python train_models.py --models rf --data history.csv --chunk-size 500000
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
 import pandas as pd
-from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.neural_network import MLPClassifier
 from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import accuracy_score
 import joblib
-import os
-
-# Create the models directory if it doesn't exist
-if not os.path.exists('models'):
-    os.makedirs('models')
-
-# 1. Load the data
-try:
-    data = pd.read_csv('health_data.csv')
-except FileNotFoundError:
-    print("Error: health_data.csv not found. Please create this file with appropriate data.")
-    exit()
-
-# 2. Preprocess the data
-# Handle missing values (replace with mean)
-data = data.fillna(data.mean())
-
-# Separate features and target variable
-X = data[['heart_rate', 'systolic_bp', 'diastolic_bp', 'spo2', 'temperature', 'glucose']]
-y = data['health_issue']
-
-# Scale features
-scaler = StandardScaler()
-X = scaler.fit_transform(X)
-
-# Split data into training and testing sets
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-
-# 3. Train the Random Forest Classifier
-rf_model = RandomForestClassifier(n_estimators=100, random_state=42)
-rf_model.fit(X_train, y_train)
-
-# 4. Train the Neural Network
-nn_model = MLPClassifier(hidden_layer_sizes=(64, 32), activation='relu', solver='adam', random_state=42, max_iter=500)
-nn_model.fit(X_train, y_train)
-
-# 5. Evaluate the models
-rf_predictions = rf_model.predict(X_test)
-nn_predictions = nn_model.predict(X_test)
-
-rf_accuracy = accuracy_score(y_test, rf_predictions)
-nn_accuracy = accuracy_score(y_test, nn_predictions)
-
-print(f"Random Forest Accuracy: {rf_accuracy}")
-print(f"Neural Network Accuracy: {nn_accuracy}")
-
-# Add feature names to the model
-X = pd.DataFrame(X, columns=['heart_rate', 'systolic_bp', 'diastolic_bp', 'spo2', 'temperature', 'glucose'])
-rf_model.feature_names_in_ = X.columns
-
-# 6. Save the trained models
-joblib.dump(rf_model, 'models/random_forest.pkl')
-
-from tensorflow import keras
-nn_model = keras.models.Sequential([
-    keras.layers.Dense(128, activation='relu', input_shape=(X_train.shape[1],)),
-    keras.layers.Dropout(0.2),
-    keras.layers.Dense(64, activation='relu'),
-    keras.layers.Dropout(0.2),
-    keras.layers.Dense(1, activation='sigmoid')  # Assuming binary classification
-])
-
-nn_model.compile(optimizer='adam', loss='binary_crossentropy', metrics=['accuracy'])
-
-nn_model.fit(X_train, y_train, epochs=10, batch_size=32, validation_split=0.1)
-
-nn_model.save('models/neural_network.h5')
-
 
-print("Models trained and saved successfully!")
+from rf_engine import export_forest
+from nn_engine import export_keras_model
+from preprocessing import FeatureScaler
+from model_registry import ARTIFACTS, ModelRegistry
+from async_logging import configure_logging
+
+FEATURES = ['heart_rate', 'systolic_bp', 'diastolic_bp', 'spo2', 'temperature', 'glucose']
+TARGET = 'health_issue'
+# Compact dtypes the CSV is parsed into: float32 vitals (NaN for missing values) and an int8 label
+DTYPES = {**{name: np.float32 for name in FEATURES}, TARGET: np.int8}
+MODELS = ('rf', 'nn')
+# Files each model is saved to in --models-dir
+MODEL_FILES = {'rf': ('random_forest.pkl', 'random_forest.npz'), 'nn': ('neural_network.h5', 'neural_network.npz')}
+
+timings = {}  # Stage name -> seconds, reported at the end and stored with the published version
+
+
+@contextmanager
+def stage(name):
+    started_at = time.perf_counter()
+    print(f"[{name}] started")
+    yield
+    timings[name] = time.perf_counter() - started_at
+    print(f"[{name}] done in {timings[name]:.2f} s")
+
+
+# --- Streaming ingestion ---
+class Reservoir:
+    """Uniform sample of at most `size` rows from a stream of row blocks (algorithm R, vectorized)."""
+
+    def __init__(self, size, n_features, rng):
+        self.X = np.empty((size, n_features), dtype=np.float32)
+        self.y = np.empty(size, dtype=np.int8)
+        self.size = size
+        self.seen = 0
+        self.rng = rng
+
+    def add(self, X, y):
+        free = max(self.size - self.seen, 0)
+        filled = min(free, len(X))
+        self.X[self.seen:self.seen + filled] = X[:filled]
+        self.y[self.seen:self.seen + filled] = y[:filled]
+        # Row number t (1-based) replaces a random slot with probability size / t
+        t = self.seen + np.arange(filled + 1, len(X) + 1)
+        slots = (self.rng.random(len(t)) * t).astype(np.int64)
+        keep = slots < self.size
+        # With repeated slots the later row wins, as it would row by row
+        self.X[slots[keep]] = X[filled:][keep]
+        self.y[slots[keep]] = y[filled:][keep]
+        self.seen += len(X)
+
+    def sample(self):
+        n = min(self.seen, self.size)
+        return self.X[:n], self.y[:n]
+
+
+def ingest(path, chunk_size, test_size, max_train_rows, max_test_rows, random_state, fixed_scaler=None):
+    """
+    Streams the CSV once: splits rows into train/test, fits the scaler on training rows and
+    samples both splits. Returns (FeatureScaler, X_train, y_train, X_test, y_test, rows read).
+    With `fixed_scaler` (a FeatureScaler in FEATURES order) the data is scaled with it instead.
+    """
+    rng = np.random.default_rng(random_state)
+    scaler = StandardScaler()
+    train = Reservoir(max_train_rows, len(FEATURES), rng)
+    test = Reservoir(max_test_rows, len(FEATURES), rng)
+    rows = 0
+    for chunk in pd.read_csv(path, usecols=FEATURES + [TARGET], dtype=DTYPES, chunksize=chunk_size):
+        X = chunk[FEATURES].to_numpy(dtype=np.float32)
+        y = chunk[TARGET].to_numpy(dtype=np.int8)
+        is_test = rng.random(len(chunk)) < test_size
+        if fixed_scaler is None:
+            scaler.partial_fit(X[~is_test])  # NaN values are ignored by the running statistics
+        train.add(X[~is_test], y[~is_test])
+        test.add(X[is_test], y[is_test])
+        rows += len(chunk)
+    if train.seen == 0:
+        raise ValueError(f"{path} has no training rows")
+    print(f"Read {rows} rows: {train.seen} train ({len(train.sample()[0])} kept), {test.seen} test ({len(test.sample()[0])} kept)")
+
+    def prepare(X):
+        # Missing values take the training mean, then everything is scaled with training statistics
+        if fixed_scaler is not None:
+            X = np.where(np.isnan(X), fixed_scaler.mean.astype(np.float32), X)
+            return ((X - fixed_scaler.mean) / fixed_scaler.scale).astype(np.float32)
+        X = np.where(np.isnan(X), scaler.mean_.astype(np.float32), X)
+        return scaler.transform(X).astype(np.float32)
+
+    X_train, y_train = train.sample()
+    X_test, y_test = test.sample()
+    feature_scaler = fixed_scaler if fixed_scaler is not None else FeatureScaler(FEATURES, scaler.mean_, scaler.scale_)
+    return feature_scaler, prepare(X_train), y_train, prepare(X_test), y_test, rows
+
+
+# --- Model fits ---
+def fit_rf(X_train, y_train, n_jobs, random_state):
+    with stage('fit_rf'):
+        rf_model = RandomForestClassifier(n_estimators=100, random_state=random_state, n_jobs=n_jobs)
+        rf_model.fit(X_train, y_train)
+    return rf_model
+
+
+def fit_nn(X_train, y_train, epochs, batch_size):
+    with stage('fit_nn'):
+        from tensorflow import keras
+        nn_model = keras.models.Sequential([
+            keras.layers.Dense(128, activation='relu', input_shape=(X_train.shape[1],)),
+            keras.layers.Dropout(0.2),
+            keras.layers.Dense(64, activation='relu'),
+            keras.layers.Dropout(0.2),
+            keras.layers.Dense(1, activation='sigmoid')  # Assuming binary classification
+        ])
+        nn_model.compile(optimizer='adam', loss='binary_crossentropy', metrics=['accuracy'])
+        nn_model.fit(X_train, y_train, epochs=epochs, batch_size=batch_size, validation_split=0.1, verbose=2)
+    return nn_model
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data', default='health_data.csv')
+    parser.add_argument('--models-dir', default='models')
+    parser.add_argument('--models', default=','.join(MODELS), help="Comma-separated models to train: rf, nn")
+    parser.add_argument('--concurrent', action='store_true', help="Fit the models at the same time instead of one after the other")
+    parser.add_argument('--n-jobs', type=int, default=-1, help="Cores used to fit the Random Forest, -1 for all")
+    parser.add_argument('--chunk-size', type=int, default=100000, help="CSV rows parsed at a time")
+    parser.add_argument('--test-size', type=float, default=0.2)
+    parser.add_argument('--max-train-rows', type=int, default=2000000, help="Training rows sampled for fitting")
+    parser.add_argument('--max-test-rows', type=int, default=500000, help="Test rows sampled for evaluation")
+    parser.add_argument('--epochs', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=32, help="Neural network batch size")
+    parser.add_argument('--random-state', type=int, default=42)
+    parser.add_argument('--no-publish', action='store_true', help="Do not publish the models to the registry")
+    args = parser.parse_args(argv)
+    configure_logging()  # The registry reports the published version through logging
+
+    selected = [name.strip() for name in args.models.split(',') if name.strip()]
+    unknown = set(selected) - set(MODELS)
+    if unknown or not selected:
+        parser.error(f"--models must list some of {', '.join(MODELS)}")
+    os.makedirs(args.models_dir, exist_ok=True)
+
+    # Models not retrained are published again as they are, so the retrained ones must share their scaler
+    scaler_path = os.path.join(args.models_dir, 'scaler.npz')
+    kept = [name for name in MODELS if name not in selected
+            and any(os.path.exists(os.path.join(args.models_dir, file)) for file in MODEL_FILES[name])]
+    kept_scaler = None
+    if kept:
+        if not os.path.exists(scaler_path):
+            parser.error(f"{scaler_path} not found, the existing {', '.join(kept)} model was trained on unscaled "
+                         f"features; retrain all models")
+        kept_scaler = FeatureScaler.load(scaler_path).reorder(FEATURES)
+
+    # 1. Stream the data: split, fit the scaler on the training split (unless kept), sample
+    try:
+        with stage('ingest'):
+            feature_scaler, X_train, y_train, X_test, y_test, rows = ingest(
+                args.data, args.chunk_size, args.test_size, args.max_train_rows, args.max_test_rows, args.random_state,
+                kept_scaler)
+    except FileNotFoundError:
+        print(f"Error: {args.data} not found. Please create this file with appropriate data.")
+        return 1
+
+    # 2. Fit the models, concurrently if asked (both release the GIL while fitting)
+    fits = {
+        'rf': lambda: fit_rf(X_train, y_train, args.n_jobs, args.random_state),
+        'nn': lambda: fit_nn(X_train, y_train, args.epochs, args.batch_size),
+    }
+    with stage('fit'):
+        if args.concurrent and len(selected) > 1:
+            with ThreadPoolExecutor(max_workers=len(selected)) as executor:
+                futures = {name: executor.submit(fits[name]) for name in selected}
+                models = {name: future.result() for name, future in futures.items()}
+        else:
+            models = {name: fits[name]() for name in selected}
+
+    # 3. Evaluate on the test split
+    metadata = {'dataset': args.data, 'rows': rows, 'train_rows': len(X_train), 'trained': selected,
+                'scaler': 'kept' if kept_scaler is not None else 'fitted'}
+    with stage('evaluate'):
+        if len(X_test) == 0:
+            print("Warning: empty test split, skipping evaluation.")
+        if 'rf' in models and len(X_test):
+            metadata['rf_accuracy'] = float(accuracy_score(y_test, models['rf'].predict(X_test)))
+            print(f"Random Forest Accuracy: {metadata['rf_accuracy']}")
+        if 'nn' in models and len(X_test):
+            nn_predictions = (models['nn'].predict(X_test, verbose=0)[:, 0] > 0.5).astype(np.int8)
+            metadata['nn_accuracy'] = float(accuracy_score(y_test, nn_predictions))
+            print(f"Neural Network Accuracy: {metadata['nn_accuracy']}")
+
+    # 4. Save the trained models
+    with stage('save'):
+        # The servers scale features with the statistics the models were trained on
+        if kept_scaler is None:
+            feature_scaler.save(scaler_path)
+        if 'rf' in models:
+            # Add feature names to the model, the server reads the column order from them
+            models['rf'].feature_names_in_ = np.array(FEATURES, dtype=object)
+            joblib.dump(models['rf'], os.path.join(args.models_dir, 'random_forest.pkl'))
+            # Flat array export used by HealthAIPredictor(compiled_rf=True), scaling folded into its thresholds
+            export_forest(models['rf']).fold_input_scaling(feature_scaler).save(os.path.join(args.models_dir, 'random_forest.npz'))
+        if 'nn' in models:
+            models['nn'].save(os.path.join(args.models_dir, 'neural_network.h5'))
+            # Weights-only export used by HealthAIPredictor(numpy_nn=True), no TensorFlow needed to serve it
+            export_keras_model(models['nn']).save(os.path.join(args.models_dir, 'neural_network.npz'))
+
+    print("Models trained and saved successfully!")
+    print("Timing: " + ", ".join(f"{name} {seconds:.2f} s" for name, seconds in timings.items()))
+
+    # 5. Publish the artifacts as a new registry version; running servers switch once it is activated
+    if not args.no_publish:
+        files = {name: os.path.join(args.models_dir, name) for name in ARTIFACTS
+                 if os.path.exists(os.path.join(args.models_dir, name))}
+        version = ModelRegistry(os.path.join(args.models_dir, 'registry')).publish(
+            files, metadata={**metadata, 'timings': timings})
+        print(f"Serve them with: python model_registry.py activate {version}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
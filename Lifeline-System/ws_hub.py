@@ -0,0 +1,257 @@
+"""
+WebSocket fan-out hub.
+
+Every connection is a subscriber with its own bounded outgoing queue and sender task, so
+a slow browser only delays itself. A reading is serialized once and the same string is
+queued for every subscriber interested in its device; when a queue is full the oldest
+message is dropped, and subscribers that stop keeping up are disconnected.
+
+Messages are routed by device: a reading's topic is its "device_id" (or "patient_id")
+field, else the device_id query parameter of the connection, else the peer address.
+Dashboards receive every device by default and can narrow that down by connecting with
+?subscribe=dev1,dev2 or by sending {"action": "subscribe", "devices": ["dev1"]}
+({"action": "unsubscribe", ...} removes devices, an empty subscribe list restores all).
+"""
+import asyncio
+import collections
+import json
+import logging
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import websockets
+
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+
+def request_path(websocket, path=None):
+    """Request path of a connection, for both the legacy and the new websockets APIs."""
+    if path is not None:
+        return path
+    if getattr(websocket, 'request', None) is not None:
+        return websocket.request.path
+    return getattr(websocket, 'path', '/') or '/'
+
+
+def _split_ids(values):
+    return {item.strip() for value in values for item in str(value).split(',') if item.strip()}
+
+
+# --- Subscriber ---
+class Subscriber:
+    """One connected client: its outgoing queue, device filter and drop counters."""
+
+    def __init__(self, websocket, queue_size):
+        self.websocket = websocket
+        self.queue = collections.deque(maxlen=queue_size)
+        self.wakeup = asyncio.Event()
+        self.topics = None  # None receives every device
+        self.source = None  # Topic for readings that do not name their device
+        self.dropped = 0
+        self.drops_since_send = 0
+        self.sender = None
+        self.closed = False
+
+    def enqueue(self, message):
+        """Queues a message, dropping the oldest one when the queue is full. Returns True if one was dropped."""
+        dropped = len(self.queue) == self.queue.maxlen
+        if dropped:
+            self.dropped += 1
+            self.drops_since_send += 1
+        self.queue.append(message)
+        self.wakeup.set()
+        return dropped
+
+
+# --- Broadcast Hub ---
+class BroadcastHub:
+    """Relays device readings to subscribed WebSocket clients."""
+
+    # stats() keys that only go up
+    COUNTERS = ('messages_received', 'messages_published', 'messages_sent', 'messages_dropped', 'slow_disconnects')
+
+    def __init__(self, queue_size=256, send_timeout=5.0, max_drops=1024):
+        # queue_size: messages buffered per subscriber before the oldest is dropped
+        # send_timeout: seconds a single send may take before the subscriber is disconnected
+        # max_drops: messages a subscriber may lose in a row before it is disconnected
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.max_drops = max_drops
+        self.subscribers = set()
+        self._wildcard = set()  # Subscribers receiving every device
+        self._by_topic = collections.defaultdict(set)
+        self.messages_received = 0
+        self.messages_published = 0
+        self.messages_sent = 0
+        self.messages_dropped = 0
+        self.slow_disconnects = 0
+        self.bridge = None  # broker.BrokerLink when several worker processes share devices
+        self.pipeline = None  # stream_scoring.StreamScorer that annotates readings before they are relayed
+        self.store = None  # timeseries.TimeSeriesStore keeping the history of every device
+
+    # --- Connection handling ---
+    async def handle(self, websocket, path=None):
+        """websockets.serve() handler: registers the connection and relays what it sends."""
+        subscriber = Subscriber(websocket, self.queue_size)
+        query = parse_qs(urlsplit(request_path(websocket, path)).query)
+        subscriber.source = next(iter(_split_ids(query.get('device_id', []))), None)
+        if subscriber.source is None and websocket.remote_address:
+            subscriber.source = str(websocket.remote_address[0])
+        self._add(subscriber, _split_ids(query.get('subscribe', [])) or None)
+        logger.debug("New WebSocket connection from %s (%d connected)", websocket.remote_address, len(self.subscribers))
+
+        subscriber.sender = asyncio.ensure_future(self._send_loop(subscriber))
+        try:
+            async for message in websocket:
+                self.on_message(subscriber, message)
+        except websockets.exceptions.ConnectionClosedError as e:
+            logger.debug("WebSocket connection closed: %s", e)
+        except Exception as e:
+            logger.exception("Error in WebSocket handler: %s", e)
+        finally:
+            self._remove(subscriber)
+            subscriber.sender.cancel()
+
+    def on_message(self, subscriber, message):
+        """Handles one incoming frame: a control message or a reading to relay."""
+        self.messages_received += 1
+        try:
+            data = json.loads(message)
+        except json.JSONDecodeError:
+            logger.warning("Error decoding JSON: %s", message)
+            return
+        if not isinstance(data, dict):
+            logger.warning("Ignoring non-object WebSocket message: %s", message)
+            return
+
+        action = data.get('action')
+        if action in ('subscribe', 'unsubscribe'):
+            self.update_subscription(subscriber, action, _split_ids(data.get('devices', [])))
+            return
+
+        topic = str(data.get('device_id') or data.get('patient_id') or subscriber.source)
+        data.setdefault('device_id', topic)
+        if self.store is not None:
+            self.store.record(topic, data)
+        if self.pipeline is not None:
+            self.pipeline.submit(topic, data, sender=subscriber)
+        else:
+            self.publish_reading(topic, data, sender=subscriber)
+
+    def publish_reading(self, topic, data, sender=None):
+        """Relays one parsed reading to its subscribers, in this process and in the other workers."""
+        with timed('serialization'):
+            message = json.dumps(data)
+        with timed('ws_relay'):
+            self.publish(topic, message, sender=sender)
+            if self.bridge is not None:
+                self.bridge.forward(topic, message)
+
+    def publish_remote(self, topic, message):
+        """Delivers a reading relayed from another worker to local subscribers and records it."""
+        with timed('ws_relay'):
+            self.publish(topic, message)
+        if self.store is not None:
+            self.store.record(topic, json.loads(message))
+
+    # --- Subscriptions ---
+    def _add(self, subscriber, topics):
+        self.subscribers.add(subscriber)
+        self._set_topics(subscriber, topics)
+
+    def _remove(self, subscriber):
+        subscriber.closed = True
+        self._set_topics(subscriber, set())
+        self._wildcard.discard(subscriber)
+        self.subscribers.discard(subscriber)
+
+    def _set_topics(self, subscriber, topics):
+        for topic in subscriber.topics or ():
+            self._by_topic[topic].discard(subscriber)
+            if not self._by_topic[topic]:
+                del self._by_topic[topic]
+        self._wildcard.discard(subscriber)
+
+        subscriber.topics = None if topics is None else set(topics)
+        if subscriber.closed:
+            return
+        if topics is None:
+            self._wildcard.add(subscriber)
+        else:
+            for topic in topics:
+                self._by_topic[topic].add(subscriber)
+
+    def update_subscription(self, subscriber, action, topics):
+        if action == 'subscribe':
+            current = subscriber.topics or set()
+            self._set_topics(subscriber, (current | topics) if topics else None)
+        elif subscriber.topics is not None:
+            self._set_topics(subscriber, subscriber.topics - topics)
+
+    # --- Fan-out ---
+    def publish(self, topic, message, sender=None):
+        """
+        Queues an already serialized message for every subscriber of `topic` except the
+        sender. Never waits on a client; returns the number of subscribers it was queued for.
+        """
+        self.messages_published += 1
+        delivered = 0
+        too_slow = []
+        for group in (self._wildcard, self._by_topic.get(topic, ())):
+            for client in group:
+                if client is sender:
+                    continue
+                if client.enqueue(message):
+                    self.messages_dropped += 1
+                    if client.drops_since_send > self.max_drops:
+                        too_slow.append(client)
+                delivered += 1
+        for client in too_slow:
+            self._disconnect_slow(client, "too many dropped messages")
+        return delivered
+
+    async def _send_loop(self, subscriber):
+        websocket = subscriber.websocket
+        try:
+            while True:
+                await subscriber.wakeup.wait()
+                subscriber.wakeup.clear()
+                while subscriber.queue:
+                    message = subscriber.queue.popleft()
+                    try:
+                        await asyncio.wait_for(websocket.send(message), self.send_timeout)
+                    except asyncio.TimeoutError:
+                        self._disconnect_slow(subscriber, f"send took longer than {self.send_timeout}s")
+                        return
+                    subscriber.drops_since_send = 0
+                    self.messages_sent += 1
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        except asyncio.CancelledError:
+            pass
+
+    def _disconnect_slow(self, subscriber, reason):
+        if subscriber.closed:
+            return
+        logger.warning("Disconnecting slow WebSocket client %s: %s", subscriber.websocket.remote_address, reason)
+        self.slow_disconnects += 1
+        self._remove(subscriber)
+        subscriber.queue.clear()
+        # 1008: policy violation; close in the background so publish() never blocks
+        asyncio.ensure_future(subscriber.websocket.close(code=1008, reason='Too slow'))
+
+    def stats(self):
+        return {
+            'connected': len(self.subscribers),
+            'subscribed_to_all': len(self._wildcard),
+            'topics': len(self._by_topic),
+            'messages_received': self.messages_received,
+            'messages_published': self.messages_published,
+            'messages_sent': self.messages_sent,
+            'messages_dropped': self.messages_dropped,
+            'queued': sum(len(s.queue) for s in list(self.subscribers)),
+            'slow_disconnects': self.slow_disconnects,
+            'timestamp': time.time(),
+        }